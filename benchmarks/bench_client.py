@@ -0,0 +1,53 @@
+"""
+Benchmarks of request/response round trips and setters of the VESC client against the simulator over loopback
+transports. The round trip benchmarks store their tail latencies in extra_info.
+"""
+import pytest
+
+pytest.importorskip('pytest_benchmark')
+
+from pyvesc.sim import Simulator
+from pyvesc.VESC import VESC
+from pyvesc.VESC.messages import GetValues
+from conftest import record
+
+ROUNDS = 2000
+
+
+@pytest.fixture(params=['pipe', 'socketpair'])
+def vesc(request):
+    with Simulator() as sim:
+        transport = getattr(sim, request.param)(timeout=0.01)
+        with VESC(transport, start_heartbeat=False) as vesc:
+            yield vesc
+
+
+def percentile(data, fraction):
+    ordered = sorted(data)
+    return ordered[min(int(fraction * len(ordered)), len(ordered) - 1)]
+
+
+def test_get_measurements(benchmark, vesc):
+    msg = benchmark.pedantic(vesc.get_measurements, rounds=ROUNDS, warmup_rounds=100)
+    assert isinstance(msg, GetValues)
+    data = benchmark.stats.stats.data
+    for name, fraction in (('p50', 0.5), ('p90', 0.9), ('p99', 0.99), ('p999', 0.999)):
+        benchmark.extra_info['latency_%s_us' % name] = percentile(data, fraction) * 1e6
+    benchmark.extra_info['latency_max_us'] = max(data) * 1e6
+    record(benchmark)
+
+
+def test_set_current(benchmark, vesc):
+    benchmark(vesc.set_current, 5.0)
+    record(benchmark)
+
+
+@pytest.mark.parametrize('write_window', [0.0, 0.0002])
+def test_set_current_window(benchmark, write_window):
+    # with a write window, setters in a burst are coalesced into fewer transport writes
+    with Simulator() as sim:
+        with VESC(sim.pipe(timeout=0.01), start_heartbeat=False, write_window=write_window) as vesc:
+            benchmark(vesc.set_current, 5.0)
+            vesc.flush()
+            benchmark.extra_info['writes'] = vesc.outgoing.writes
+            record(benchmark)
@@ -0,0 +1,121 @@
+"""
+Benchmarks of the message codec (VESCMessage.pack and VESCMessage.unpack) and of encode, encode_many and decode.
+
+The precompiled codecs are compared against the previous implementation, which rebuilt the format string and called
+the module level struct functions on every message. Each message's pack and unpack timings of both are in one group.
+"""
+import struct
+
+import pytest
+
+pytest.importorskip('pytest_benchmark')
+
+from pyvesc.protocol.base import VESCMessage
+from pyvesc.protocol.interface import encode, encode_many, encode_request, decode
+from pyvesc.VESC.messages import GetValues, GetVersion, SetCurrent, SetRPM
+from conftest import record
+
+MESSAGES = {
+    'SetCurrent': SetCurrent(12.5),
+    'SetRPM': SetRPM(3000),
+    'GetVersion': GetVersion(5, 2, 0),
+    'GetValues': GetValues(*[b'\x00' if field[1] == 'c' else idx for idx, field in enumerate(GetValues.fields)]),
+}
+
+
+# the previous pack only handled messages with numeric fields
+LEGACY_PACK_MESSAGES = ['SetCurrent', 'SetRPM']
+
+
+def legacy_unpack(msg_bytes):
+    msg_id = struct.unpack_from('!B', msg_bytes, 0)
+    msg_type = VESCMessage.msg_type(*msg_id)
+    data = list(struct.unpack_from('!' + msg_type._fmt_fields, msg_bytes, 1))
+    scalars = [field[2] for field in msg_type.fields if len(field) >= 3]
+    for k, field in enumerate(data):
+        try:
+            if scalars[k] != 0:
+                data[k] = data[k] / scalars[k]
+        except (TypeError, IndexError):
+            pass
+    return msg_type(*data)
+
+
+def legacy_pack(instance):
+    scalars = [field[2] for field in instance.fields if len(field) >= 3]
+    field_values = []
+    if not scalars:
+        for field_name in instance._field_names:
+            field_values.append(getattr(instance, field_name))
+    else:
+        for field_name, field_scalar in zip(instance._field_names, scalars):
+            field_values.append(int(getattr(instance, field_name) * field_scalar))
+    fmt = '!' + 'B' + instance._fmt_fields
+    return struct.pack(fmt, *((instance.id,) + tuple(field_values)))
+
+
+@pytest.fixture(params=sorted(MESSAGES))
+def msg(request):
+    return MESSAGES[request.param]
+
+
+def test_pack(benchmark, msg):
+    benchmark.group = 'pack %s' % type(msg).__name__
+    payload = benchmark(VESCMessage.pack, msg)
+    record(benchmark, nbytes=len(payload), func=lambda: VESCMessage.pack(msg))
+
+
+def test_unpack(benchmark, msg):
+    benchmark.group = 'unpack %s' % type(msg).__name__
+    payload = VESCMessage.pack(msg)
+    assert VESCMessage.pack(benchmark(VESCMessage.unpack, payload)) == payload
+    record(benchmark, nbytes=len(payload), func=lambda: VESCMessage.unpack(payload))
+
+
+@pytest.mark.parametrize('name', LEGACY_PACK_MESSAGES)
+def test_pack_legacy(benchmark, name):
+    msg = MESSAGES[name]
+    benchmark.group = 'pack %s' % name
+    payload = benchmark(legacy_pack, msg)
+    assert payload == VESCMessage.pack(msg)
+    record(benchmark, nbytes=len(payload))
+
+
+def test_unpack_legacy(benchmark, msg):
+    benchmark.group = 'unpack %s' % type(msg).__name__
+    payload = VESCMessage.pack(msg)
+    assert VESCMessage.pack(benchmark(legacy_unpack, payload)) == payload
+    record(benchmark, nbytes=len(payload))
+
+
+def test_encode(benchmark, msg):
+    packet = benchmark(encode, msg)
+    record(benchmark, nbytes=len(packet), func=lambda: encode(msg))
+
+
+def test_encode_request(benchmark):
+    packet = benchmark(encode_request, GetValues)
+    record(benchmark, nbytes=len(packet), func=lambda: encode_request(GetValues))
+
+
+def test_decode(benchmark, msg):
+    packet = encode(msg)
+    decoded, consumed = benchmark(decode, packet)
+    assert consumed == len(packet)
+    record(benchmark, nbytes=len(packet), func=lambda: decode(packet))
+
+
+TRAJECTORY_POINTS = 10000
+
+
+def encode_trajectory(values):
+    return b''.join(encode(SetCurrent(value)) for value in values)
+
+
+@pytest.mark.parametrize('encoder', [encode_trajectory, lambda values: encode_many(SetCurrent, values)[0]],
+                         ids=['encode', 'encode_many'])
+def test_encode_trajectory(benchmark, encoder):
+    values = [50 * (i / TRAJECTORY_POINTS - 0.5) for i in range(TRAJECTORY_POINTS)]
+    frames = benchmark(encoder, values)
+    assert frames == encode_trajectory(values)
+    record(benchmark, packets=TRAJECTORY_POINTS, nbytes=len(frames), func=lambda: encoder(values), calls=10)
@@ -0,0 +1,83 @@
+"""
+Benchmarks of packet framing and unframing, for short and long frames and for streams with corrupted packets.
+"""
+import pytest
+
+pytest.importorskip('pytest_benchmark')
+
+from pyvesc.protocol.metrics import CodecMetrics
+from pyvesc.protocol.packet.codec import frame, unframe, FrameBuffer, Stateful
+from conftest import PAYLOAD_SIZES, CORRUPTION_RATES, make_payload, make_stream, record
+
+STREAM_PACKETS = 1000
+# streams are handed to the unpackers in chunks, like the reads of a serial port filling a buffer
+READ_SIZE = 4096
+
+
+@pytest.mark.parametrize('size', PAYLOAD_SIZES)
+def test_frame(benchmark, size):
+    payload = make_payload(size)
+    packet = benchmark(frame, payload)
+    assert packet[0] == (0x02 if size < 256 else 0x03)
+    record(benchmark, nbytes=len(packet), func=lambda: frame(payload))
+
+
+@pytest.mark.parametrize('size', PAYLOAD_SIZES)
+def test_unframe(benchmark, size):
+    payload = make_payload(size)
+    packet = frame(payload)
+    assert benchmark(unframe, packet) == (payload, len(packet))
+    record(benchmark, nbytes=len(packet), func=lambda: unframe(packet))
+
+
+def unframe_stream(stream):
+    payloads = []
+    buffer = b''
+    for start in range(0, len(stream), READ_SIZE):
+        buffer += stream[start:start + READ_SIZE]
+        while buffer:
+            payload, consumed = unframe(buffer)
+            if consumed == 0:
+                break
+            buffer = buffer[consumed:]
+            if payload is not None:
+                payloads.append(payload)
+    return payloads
+
+
+def unframe_stream_views(stream):
+    payloads = []
+    buffer = FrameBuffer()
+    for start in range(0, len(stream), READ_SIZE):
+        buffer.write(stream[start:start + READ_SIZE])
+        # views are only valid until the next write
+        payloads.extend(bytes(payload) for payload in buffer)
+    return payloads
+
+
+def feed_stream(stream, metrics=None):
+    unpacker = Stateful(metrics=metrics)
+    payloads = []
+    for start in range(0, len(stream), READ_SIZE):
+        payloads.extend(unpacker.feed(stream[start:start + READ_SIZE]))
+    return payloads
+
+
+def feed_stream_with_metrics(stream):
+    return feed_stream(stream, CodecMetrics())
+
+
+@pytest.mark.parametrize('corruption_rate', CORRUPTION_RATES)
+@pytest.mark.parametrize('size', [64, 1024])
+@pytest.mark.parametrize('unpacker', [unframe_stream, unframe_stream_views, feed_stream, feed_stream_with_metrics],
+                         ids=['stateless', 'stateless-views', 'stateful', 'stateful-metrics'])
+def test_unframe_stream(benchmark, unpacker, size, corruption_rate):
+    payloads = [make_payload(size, seed) for seed in range(STREAM_PACKETS)]
+    stream, intact = make_stream(payloads, corruption_rate)
+    received = benchmark(unpacker, stream)
+    # a corrupted packet can take an intact neighbour with it, but nothing corrupted may get through
+    assert set(received) <= set(payloads)
+    if corruption_rate == 0:
+        assert len(received) == intact
+    benchmark.extra_info['packets_received'] = len(received)
+    record(benchmark, packets=STREAM_PACKETS, nbytes=len(stream), func=lambda: unpacker(stream), calls=10)
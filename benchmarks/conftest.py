@@ -0,0 +1,109 @@
+"""
+pytest-benchmark suite of the framing, message codec and VESC client hot paths.
+
+Run from the repository root with:
+
+    python -m pytest benchmarks --benchmark-json=benchmark.json
+
+Besides the timings, each benchmark stores throughput (packets and bytes per second), allocations per packet measured
+with tracemalloc and, for the client benchmarks, tail latencies in the extra_info of the JSON results. Save a baseline
+with --benchmark-autosave and catch regressions with e.g. --benchmark-compare --benchmark-compare-fail=mean:10%.
+"""
+import os
+import random
+import sys
+import tracemalloc
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from pyvesc.protocol.packet.codec import frame
+
+# short frames (start byte 0x02) carry up to 255 bytes of payload, longer payloads use long frames (start byte 0x03)
+PAYLOAD_SIZES = [8, 64, 255, 256, 1024]
+CORRUPTION_RATES = [0.0, 0.01, 0.1]
+
+
+def pytest_collect_file(file_path, parent):
+    # benchmark modules are named bench_*.py so a plain test run does not pick them up from other directories
+    if file_path.suffix == '.py' and file_path.name.startswith('bench_'):
+        return pytest.Module.from_parent(parent, path=file_path)
+
+
+def make_payload(size, seed=0):
+    """
+    :param size: number of payload bytes
+    :param seed: seed of the random payload bytes
+    :return: payload of the given size
+    """
+    return bytes(random.Random(seed).getrandbits(8) for i in range(size))
+
+
+def make_stream(payloads, corruption_rate=0.0, seed=0):
+    """
+    Frames payloads back to back, corrupting one byte of a fraction of the packets.
+    :param payloads: list of payloads
+    :param corruption_rate: fraction of the packets with a corrupted byte
+    :param seed: seed of the choice of corrupted packets and bytes
+    :return: tuple of the stream and the number of intact packets in it
+    """
+    rng = random.Random(seed)
+    stream = bytearray()
+    intact = 0
+    for payload in payloads:
+        packet = bytearray(frame(payload))
+        if rng.random() < corruption_rate:
+            packet[rng.randrange(len(packet))] ^= 1 << rng.randrange(8)
+        else:
+            intact += 1
+        stream += packet
+    return bytes(stream), intact
+
+
+def allocations(func, calls=1000):
+    """
+    Measures the memory allocated by a function with tracemalloc. The results of all calls are kept alive so objects
+    returned by func count as retained.
+    :param func: function to call without arguments
+    :param calls: number of calls to average over
+    :return: tuple of (blocks retained per call, bytes retained per call, peak bytes of a single call)
+    """
+    results = []
+    func()
+    tracemalloc.start()
+    try:
+        before = tracemalloc.take_snapshot()
+        start_size = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        results.append(func())
+        peak = tracemalloc.get_traced_memory()[1] - start_size
+        for i in range(calls - 1):
+            results.append(func())
+        after = tracemalloc.take_snapshot()
+    finally:
+        tracemalloc.stop()
+    stats = after.compare_to(before, 'filename')
+    # the list holding the results is not part of what is measured
+    blocks = sum(stat.count_diff for stat in stats) - 1
+    size = sum(stat.size_diff for stat in stats) - sys.getsizeof(results)
+    return blocks / calls, size / calls, peak
+
+
+def record(benchmark, packets=1, nbytes=0, func=None, calls=1000):
+    """
+    Stores throughput, and optionally allocations, in the extra_info of a benchmark that has run.
+    :param benchmark: the benchmark fixture after it was called
+    :param packets: number of packets handled per call of the benchmarked function
+    :param nbytes: number of bytes handled per call of the benchmarked function
+    :param func: function to measure the allocations of, divided by packets
+    :param calls: number of calls to measure the allocations over
+    """
+    mean = benchmark.stats.stats.mean
+    benchmark.extra_info['packets_per_second'] = packets / mean
+    benchmark.extra_info['bytes_per_second'] = nbytes / mean
+    if func is not None:
+        blocks, size, peak = allocations(func, calls)
+        benchmark.extra_info['blocks_per_packet'] = blocks / packets
+        benchmark.extra_info['bytes_allocated_per_packet'] = size / packets
+        benchmark.extra_info['peak_bytes_per_call'] = peak
@@ -0,0 +1,300 @@
+from pyvesc.protocol.base import VESCMessage
+from pyvesc.protocol.interface import encode_request, encode
+from pyvesc.protocol.packet.codec import Stateful
+from pyvesc.protocol.template import CommandTemplate
+from pyvesc.VESC.messages import *
+import asyncio
+import collections
+import struct
+
+# only needed to talk to a serial port, do not make this a required package
+try:
+    import serial_asyncio
+except ImportError:
+    serial_asyncio = None
+
+
+class VESCProtocol(asyncio.Protocol):
+    """
+    asyncio protocol speaking VESC packets. Received packets are decoded as they arrive and complete the oldest pending
+    request for their message id.
+    """
+    def __init__(self):
+        self.transport = None
+        self._unpacker = Stateful()
+        self._pending_requests = {}
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def data_received(self, data):
+        for payload in self._unpacker.feed(data):
+            if not payload:
+                # an empty packet is valid but carries no message
+                continue
+            try:
+                msg = VESCMessage.unpack(payload)
+            except (KeyError, IndexError, struct.error, UnicodeDecodeError):
+                # unknown or malformed message
+                continue
+            waiting = self._pending_requests.get(msg.id)
+            while waiting:
+                future = waiting.popleft()
+                if not future.done():
+                    future.set_result(msg)
+                    break
+
+    def connection_lost(self, exc):
+        for waiting in self._pending_requests.values():
+            for future in waiting:
+                if not future.done():
+                    future.set_exception(exc or ConnectionError("Connection to the VESC was closed."))
+        self._pending_requests.clear()
+
+    def write(self, data):
+        # transports may keep a reference to data until it is sent, and command templates reuse their bytearray
+        self.transport.write(bytes(data))
+
+    async def request(self, data, msg_id, timeout):
+        """
+        Writes a request and waits for the reply.
+        :param data: the encoded request
+        :param msg_id: id of the reply message
+        :param timeout: time in seconds to wait for the reply
+        :return: the reply message
+        """
+        future = asyncio.get_event_loop().create_future()
+        waiting = self._pending_requests.setdefault(msg_id, collections.deque())
+        waiting.append(future)
+        self.transport.write(data)
+        try:
+            return await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            if future in waiting:
+                waiting.remove(future)
+            raise TimeoutError("No reply with id %u received within %g seconds." % (msg_id, timeout))
+
+
+class AsyncVESC(object):
+    """
+    asyncio version of VESC. A single event loop can drive many controllers, each heartbeat is a task instead of a
+    thread.
+
+    Setters only write to the transport and are regular methods, getters wait for the reply and are coroutines. Create
+    instances with open_serial, open_connection or connect.
+    """
+    def __init__(self, protocol, request_timeout=1.0):
+        """
+        :param protocol: connected VESCProtocol
+        :param request_timeout: default time in seconds to wait for the reply to a request
+        """
+        self.protocol = protocol
+        self.request_timeout = request_timeout
+        self.alive_msg = [encode(Alive())]
+        self.heartbeat_task = None
+        self._command_templates = {}
+        self._selective_requests = {}
+        self._get_values_msg = encode_request(GetValues)
+
+    @classmethod
+    async def connect(cls, connection_factory, has_sensor=False, start_heartbeat=True, request_timeout=1.0):
+        """
+        Creates an AsyncVESC over any asyncio transport.
+        :param connection_factory: coroutine function called with a protocol factory that returns a (transport,
+                                   protocol) tuple, e.g. functools.partial(loop.create_connection, host=..., port=...)
+        :param has_sensor: Whether or not the bldc motor is using a hall effect sensor
+        :param start_heartbeat: Whether or not to automatically start the heartbeat task that will keep commands alive.
+        :param request_timeout: default time in seconds to wait for the reply to a request
+        :return: connected AsyncVESC
+        """
+        transport, protocol = await connection_factory(VESCProtocol)
+        vesc = cls(protocol, request_timeout=request_timeout)
+        if has_sensor:
+            vesc.write(encode(SetRotorPositionMode(SetRotorPositionMode.DISP_POS_OFF)))
+        if start_heartbeat:
+            vesc.start_heartbeat()
+        # check firmware version and set GetValue fields to old values if pre version 3.xx
+        try:
+            version = await vesc.get_firmware_version()
+        except BaseException:
+            await vesc.close()
+            raise
+        if int(version.split('.')[0]) < 3:
+            GetValues.fields = pre_v3_33_fields
+        return vesc
+
+    @classmethod
+    async def open_serial(cls, serial_port, baudrate=115200, **kwargs):
+        """
+        Creates an AsyncVESC on a serial port. Requires pyserial-asyncio.
+        :param serial_port: Serial device to use for communication (i.e. "COM3" or "/dev/tty.usbmodem0")
+        :param baudrate: baudrate for the serial communication. Shouldn't need to change this.
+        :param kwargs: see connect
+        :return: connected AsyncVESC
+        """
+        if serial_asyncio is None:
+            raise ImportError("Need to install pyserial-asyncio in order to use AsyncVESC with a serial port.")
+        loop = asyncio.get_event_loop()
+
+        def connection_factory(protocol_factory):
+            return serial_asyncio.create_serial_connection(loop, protocol_factory, serial_port, baudrate=baudrate)
+        return await cls.connect(connection_factory, **kwargs)
+
+    @classmethod
+    async def open_connection(cls, host, port, **kwargs):
+        """
+        Creates an AsyncVESC over TCP, e.g. to VESC Tool's TCP bridge.
+        :param host: host name or address
+        :param port: TCP port
+        :param kwargs: see connect
+        :return: connected AsyncVESC
+        """
+        loop = asyncio.get_event_loop()
+
+        def connection_factory(protocol_factory):
+            return loop.create_connection(protocol_factory, host, port)
+        return await cls.connect(connection_factory, **kwargs)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+    async def close(self):
+        """
+        Stops the heartbeat and closes the transport.
+        """
+        await self.stop_heartbeat()
+        self.protocol.transport.close()
+
+    async def _heartbeat_cmd_func(self):
+        """
+        Continuous function calling that keeps the motor alive
+        """
+        while True:
+            await asyncio.sleep(0.1)
+            for i in self.alive_msg:
+                self.write(i)
+
+    def start_heartbeat(self, can_id=None):
+        """
+        Starts a repetitive calling of the last set cmd to keep the motor alive.
+
+        Args:
+            can_id: Optional, used to specify the CAN ID to add to the existing heartbeat messaged
+        """
+        if can_id is not None:
+            self.alive_msg.append(encode(Alive(can_id=can_id)))
+        elif self.heartbeat_task is None:
+            self.heartbeat_task = asyncio.ensure_future(self._heartbeat_cmd_func())
+
+    async def stop_heartbeat(self):
+        """
+        Stops the heartbeat task.
+        """
+        if self.heartbeat_task is not None:
+            self.heartbeat_task.cancel()
+            try:
+                await self.heartbeat_task
+            except asyncio.CancelledError:
+                pass
+            self.heartbeat_task = None
+
+    def write(self, data):
+        """
+        :param data: the byte string to be sent
+        """
+        self.protocol.write(data)
+
+    async def request(self, msg_cls, can_id=None, timeout=None):
+        """
+        Requests a getter message and waits for the reply.
+        :param msg_cls: The getter message type, e.g. GetValues
+        :param can_id: Optional, CAN ID of the VESC to request the message from
+        :param timeout: time in seconds to wait for the reply, defaults to request_timeout
+        :return: the reply message
+        """
+        return await self.protocol.request(encode_request(msg_cls(can_id=can_id)), msg_cls.id,
+                                           self.request_timeout if timeout is None else timeout)
+
+    async def request_selective(self, msg_cls, mask, can_id=None, timeout=None):
+        """
+        Requests some of the fields of a selective getter and waits for the reply. See VESC.request_selective.
+        :param msg_cls: The selective getter message type, e.g. GetValuesSelective
+        :param mask: bitmask of the wanted fields, e.g. GetValuesSelective.build_mask('rpm', 'v_in')
+        :param can_id: Optional, CAN ID of the VESC to request the message from
+        :param timeout: time in seconds to wait for the reply, defaults to request_timeout
+        :return: the reply message, with a mask field followed by the selected fields
+        """
+        key = (msg_cls, mask, can_id)
+        data = self._selective_requests.get(key)
+        if data is None:
+            data = self._selective_requests[key] = encode(msg_cls(mask, can_id=can_id))
+        return await self.protocol.request(data, msg_cls.id, self.request_timeout if timeout is None else timeout)
+
+    def command(self, msg_cls, can_id=None):
+        """
+        Creates a pre-encoded command for sending a setter message repeatedly. See VESC.command.
+        :param msg_cls: The setter message type, e.g. SetCurrent
+        :param can_id: Optional, CAN ID to forward the command to
+        :return: CommandTemplate whose send() writes to this VESC
+        """
+        return CommandTemplate(msg_cls, can_id=can_id, write=self.write)
+
+    def _send_command(self, msg_cls, values, can_id=None):
+        """
+        Sends a setter message through a cached command template. The templates are shared by all callers, so setters
+        of the same message type and CAN ID must not be called from several threads at once.
+        """
+        key = (msg_cls, can_id)
+        template = self._command_templates.get(key)
+        if template is None:
+            template = self._command_templates[key] = self.command(msg_cls, can_id=can_id)
+        template.send(*values)
+
+    def set_rpm(self, new_rpm, can_id=None):
+        """
+        Set the electronic RPM value (a.k.a. the RPM value of the stator)
+        :param new_rpm: new rpm value
+        """
+        self._send_command(SetRPM, (new_rpm,), can_id)
+
+    def set_current(self, new_current, can_id=None):
+        """
+        :param new_current: new current in milli-amps for the motor
+        """
+        self._send_command(SetCurrent, (new_current,), can_id)
+
+    def set_duty_cycle(self, new_duty_cycle, can_id=None):
+        """
+        :param new_duty_cycle: Value of duty cycle to be set (range [-1e5, 1e5]).
+        """
+        self._send_command(SetDutyCycle, (new_duty_cycle,), can_id)
+
+    def set_servo(self, new_servo_pos, can_id=None):
+        """
+        :param new_servo_pos: New servo position. valid range [0, 1]
+        """
+        self._send_command(SetServoPosition, (new_servo_pos,), can_id)
+
+    async def get_measurements(self):
+        """
+        :return: A msg object with attributes containing the measurement values
+        """
+        return await self.protocol.request(self._get_values_msg, GetValues.id, self.request_timeout)
+
+    async def get_firmware_version(self):
+        return str(await self.request(GetVersion))
+
+    async def get_rpm(self):
+        """
+        :return: Current motor rpm
+        """
+        return (await self.get_measurements()).rpm
+
+    async def get_v_in(self):
+        """
+        :return: Current input voltage
+        """
+        return (await self.get_measurements()).v_in
@@ -0,0 +1,91 @@
+from pyvesc.protocol.interface import encode_request
+from pyvesc.protocol.template import CommandTemplate
+from pyvesc.VESC.messages import *
+
+
+class CanBus(object):
+    """
+    Fleet view of the VESCs on the CAN bus behind a VESC. Requests to all controllers are sent back-to-back in a single
+    write and their replies are matched as they stream in, so a polling cycle costs about one round trip instead of
+    one per controller.
+
+    Forwarded replies do not carry the CAN ID they came from. Replies with an app_controller_id field (e.g. GetValues)
+    are matched by it, which requires each controller's app controller id to be its CAN ID, the VESC default. Other
+    replies are matched in the order of can_ids, so they are only matched when every controller replied.
+    """
+    def __init__(self, vesc, can_ids):
+        """
+        :param vesc: VESC connected to the CAN bus
+        :param can_ids: CAN IDs of the controllers to address
+        """
+        self.vesc = vesc
+        self.can_ids = list(can_ids)
+        self._requests = {}
+        self._commands = {}
+
+    def _encoded_requests(self, msg_cls):
+        data = self._requests.get(msg_cls)
+        if data is None:
+            data = self._requests[msg_cls] = b''.join(encode_request(msg_cls(can_id=can_id))
+                                                      for can_id in self.can_ids)
+        return data
+
+    def request(self, msg_cls, timeout=None):
+        """
+        Requests a getter message from every controller and waits for the replies.
+        :param msg_cls: The getter message type, e.g. GetValues
+        :param timeout: time in seconds to wait for all the replies, defaults to the VESC's request_timeout
+        :return: dict mapping each CAN ID to its reply, or to None if it did not reply in time. For replies without an
+                 app_controller_id field, every CAN ID maps to None if any controller did not reply, as the silent one
+                 can not be told.
+        """
+        replies = self.vesc._request_many(self._encoded_requests(msg_cls), msg_cls.id, len(self.can_ids), timeout)
+        results = dict.fromkeys(self.can_ids)
+        if 'app_controller_id' in msg_cls._field_names:
+            for reply in replies:
+                can_id = ord(reply.app_controller_id)
+                if can_id in results:
+                    results[can_id] = reply
+        elif len(replies) == len(self.can_ids):
+            results.update(zip(self.can_ids, replies))
+        return results
+
+    def get_measurements(self, timeout=None):
+        """
+        :param timeout: time in seconds to wait for all the replies, defaults to the VESC's request_timeout
+        :return: dict mapping each CAN ID to its GetValues message, or to None if it did not reply in time
+        """
+        return self.request(GetValues, timeout)
+
+    def send(self, msg_cls, values):
+        """
+        Sends a setter message to several controllers in a single write.
+        :param msg_cls: The setter message type, e.g. SetCurrent
+        :param values: dict mapping CAN IDs to the value of the message's field, or to a tuple of the field values
+        """
+        frames = []
+        for can_id, value in values.items():
+            key = (msg_cls, can_id)
+            template = self._commands.get(key)
+            if template is None:
+                template = self._commands[key] = CommandTemplate(msg_cls, can_id=can_id)
+            frames.append(template.update(*(value if isinstance(value, tuple) else (value,))))
+        self.vesc.write(b''.join(frames))
+
+    def set_rpm(self, values):
+        """
+        :param values: dict mapping CAN IDs to the new rpm value
+        """
+        self.send(SetRPM, values)
+
+    def set_current(self, values):
+        """
+        :param values: dict mapping CAN IDs to the new motor current
+        """
+        self.send(SetCurrent, values)
+
+    def set_duty_cycle(self, values):
+        """
+        :param values: dict mapping CAN IDs to the new duty cycle
+        """
+        self.send(SetDutyCycle, values)
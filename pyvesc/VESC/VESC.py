@@ -1,139 +1,485 @@
-from pyvesc.protocol.interface import encode_request, encode, decode
+from pyvesc.protocol.base import VESCMessage
+from pyvesc.protocol.interface import encode_request, encode
+from pyvesc.protocol.packet.codec import Stateful, unframe
+from pyvesc.protocol.template import CommandTemplate
+from pyvesc.VESC.dispatch import Dispatcher
+from pyvesc.VESC.heartbeat import Heartbeat, shared_scheduler
 from pyvesc.VESC.messages import *
-import time
+from pyvesc.VESC.outgoing import OutgoingQueue
+from pyvesc.VESC.player import TrajectoryPlayer
+from pyvesc.VESC.stream import Subscription, TelemetryStream
+from pyvesc.VESC.transport import Transport, SerialTransport
+from concurrent import futures
+import struct
 import threading
 
-# because people may want to use this library for their own messaging, do not make this a required package
-try:
-    import serial
-except ImportError:
-    serial = None
-
 
 class VESC(object):
-    def __init__(self, serial_port, has_sensor=False, start_heartbeat=True, baudrate=115200, timeout=0.05):
+    def __init__(self, serial_port, has_sensor=False, start_heartbeat=True, baudrate=115200, timeout=0.05,
+                 request_timeout=1.0, metrics=None, heartbeat_scheduler=None, write_window=0.0002):
         """
-        :param serial_port: Serial device to use for communication (i.e. "COM3" or "/dev/tty.usbmodem0")
+        :param serial_port: Serial device to use for communication (i.e. "COM3" or "/dev/tty.usbmodem0"), or any
+                            Transport, e.g. SocketTransport.connect(host, port) or one end of PipeTransport.pair()
         :param has_sensor: Whether or not the bldc motor is using a hall effect sensor
-        :param start_heartbeat: Whether or not to automatically start the heartbeat thread that will keep commands
-                                alive.
-        :param baudrate: baudrate for the serial communication. Shouldn't need to change this.
-        :param timeout: timeout for the serial communication
+        :param start_heartbeat: Whether or not to automatically start the heartbeat that will keep commands alive.
+        :param baudrate: baudrate for the serial communication. Shouldn't need to change this. Not used if a
+                         Transport is given.
+        :param timeout: timeout for the serial communication. This is also the longest time the reader thread blocks
+                        before checking if it should stop. Not used if a Transport is given.
+        :param request_timeout: default time in seconds to wait for the reply to a request
+        :param metrics: Optional, Metrics to record the codec counters, request latencies and timeouts in
+        :param heartbeat_scheduler: Optional, HeartbeatScheduler sending the heartbeat, defaults to the one shared by
+                                    all VESC instances
+        :param write_window: time in seconds frames are held to be coalesced into one write with the frames that follow
+                             them, e.g. 0.0002 for 200 us. 0 writes every frame at once.
         """
 
-        if serial is None:
-            raise ImportError("Need to install pyserial in order to use the VESCMotor class.")
-
-        self.serial_port = serial.Serial(port=serial_port, baudrate=baudrate, timeout=timeout)
+        if isinstance(serial_port, Transport):
+            self.transport = serial_port
+        else:
+            self.transport = SerialTransport(serial_port, baudrate=baudrate, timeout=timeout)
+        # every write goes through the queue, so writes from different threads do not interleave
+        self.outgoing = OutgoingQueue(self.transport.write, window=write_window)
         if has_sensor:
-            self.serial_port.write(encode(SetRotorPositionMode(SetRotorPositionMode.DISP_POS_OFF)))
+            self.outgoing.put(encode(SetRotorPositionMode(SetRotorPositionMode.DISP_POS_OFF)), flush=True)
 
+        # an Alive is only sent to a target that received no command for the heartbeat period
         self.alive_msg = [encode(Alive())]
-
-        self.heart_beat_thread = threading.Thread(target=self._heartbeat_cmd_func)
-        self._stop_heartbeat = threading.Event()
+        self.heartbeat = Heartbeat(self.outgoing.put, alive_msg=self.alive_msg)
+        self.heartbeat_scheduler = heartbeat_scheduler if heartbeat_scheduler is not None else shared_scheduler()
+        self._command_templates = {}
+        self._selective_requests = {}
+
+        # replies are read by a background thread and handed to the callers waiting for them
+        self.request_timeout = request_timeout
+        self.metrics = metrics
+        self.dispatcher = Dispatcher(metrics)
+        self._streams = {}
+        self._subscriptions = {}
+        self._player = None
+        self.reader_thread = threading.Thread(target=self._reader_cmd_func, daemon=True)
+        self._stop_reader = threading.Event()
+        self.reader_thread.start()
 
         if start_heartbeat:
             self.start_heartbeat()
 
         # check firmware version and set GetValue fields to old values if pre version 3.xx
-        version = self.get_firmware_version()
+        try:
+            version = self.get_firmware_version()
+        except BaseException:
+            # e.g. no reply, do not leave the threads running and the port open
+            self.stop_heartbeat()
+            self.outgoing.close()
+            self.stop_reader()
+            self.transport.close()
+            raise
         if int(version.split('.')[0]) < 3:
             GetValues.fields = pre_v3_33_fields
 
         # store message info for getting values so it doesn't need to calculate it every time
         msg = GetValues()
         self._get_values_msg = encode_request(msg)
-        self._get_values_msg_expected_length = msg._full_msg_size
 
     def __enter__(self):
         return self
 
     def __exit__(self, exc_type, exc_val, exc_tb):
+        if self._player is not None:
+            self._player.stop()
+        self.stop_stream()
         self.stop_heartbeat()
-        if self.serial_port.is_open:
-            self.serial_port.flush()
-            self.serial_port.close()
+        self.outgoing.close()
+        self.stop_reader()
+        self.transport.close()
+        for subscriptions in self._subscriptions.values():
+            for subscription in subscriptions:
+                subscription.close()
+        self._subscriptions.clear()
+
+    @property
+    def serial_port(self):
+        """
+        The pyserial port if communicating over a serial port, None otherwise.
+        """
+        return getattr(self.transport, 'serial', None)
 
-    def _heartbeat_cmd_func(self):
+    @property
+    def heart_beat_thread(self):
         """
-        Continuous function calling that keeps the motor alive
+        The thread of the heartbeat scheduler, which is shared with other VESC instances. Kept for backwards
+        compatibility, the heartbeat no longer has a thread per VESC.
         """
-        while not self._stop_heartbeat.is_set():
-            time.sleep(0.1)
-            for i in self.alive_msg:
-                self.write(i)
+        return self.heartbeat_scheduler.scheduler_thread
 
     def start_heartbeat(self, can_id=None):
         """
-        Starts a repetitive calling of the last set cmd to keep the motor alive.
+        Starts keeping the motor alive. Commands written to the motor keep it alive too, so an Alive is only sent when
+        no command was written for the heartbeat period.
 
         Args:
             can_id: Optional, used to specify the CAN ID to add to the existing heartbeat messaged
         """
         if can_id is not None:
-            self.alive_msg.append(encode(Alive(can_id=can_id)))
+            self.heartbeat.add_target(can_id)
         else:
-            self.heart_beat_thread.start()
+            self.heartbeat_scheduler.add(self.heartbeat)
 
     def stop_heartbeat(self):
         """
-        Stops the heartbeat thread and resets the last cmd function. THIS MUST BE CALLED BEFORE THE OBJECT GOES OUT OF
-        SCOPE UNLESS WRAPPING IN A WITH STATEMENT (Assuming the heartbeat was started).
+        Stops the heartbeat. THIS MUST BE CALLED BEFORE THE OBJECT GOES OUT OF SCOPE UNLESS WRAPPING IN A WITH
+        STATEMENT (Assuming the heartbeat was started).
+        """
+        self.heartbeat_scheduler.remove(self.heartbeat)
+
+    def _reader_cmd_func(self):
+        """
+        Continuously reads from the transport and hands the decoded messages to the callers waiting for them. Blocks
+        in the transport read while the link is idle, and fails the requests that timed out between reads.
+        """
+        unpacker = Stateful(metrics=self.metrics.codec if self.metrics is not None else None)
+        try:
+            while not self._stop_reader.is_set():
+                try:
+                    data = self.transport.read()
+                except (OSError, ValueError):
+                    # the transport was closed
+                    break
+                if data:
+                    for payload in unpacker.feed(data):
+                        self._dispatch(payload)
+                self.dispatcher.expire()
+        finally:
+            # also when the thread dies, so requests do not wait for their timeout
+            self.dispatcher.fail_all(ConnectionError("The reader of the VESC was stopped."))
+
+    def _dispatch(self, payload):
+        """
+        Decodes a received payload, pushes it to the stream of its message id and completes the request it replies
+        to, or hands it to the subscribers of its message id.
+        :param payload: payload of a received packet
+        """
+        if not payload:
+            # an empty packet is valid but carries no message
+            return
+        try:
+            msg = VESCMessage.unpack(payload)
+        except (KeyError, IndexError, struct.error, UnicodeDecodeError):
+            # unknown or malformed message
+            if self.metrics is not None:
+                self.metrics.decode_errors += 1
+            return
+        stream = self._streams.get(msg.id)
+        if stream is not None:
+            stream.buffer.push(msg)
+        self.dispatcher.dispatch(msg)
+
+    def stop_reader(self):
+        """
+        Stops the reader thread. Pending requests fail with a ConnectionError.
+        """
+        self._stop_reader.set()
+        if self.reader_thread.is_alive():
+            self.reader_thread.join()
+
+    def _request(self, data, msg_id, timeout=None, can_id=None):
+        """
+        Writes a request and waits for the reply.
+        :param data: the encoded request
+        :param msg_id: id of the reply message
+        :param timeout: time in seconds to wait for the reply, defaults to request_timeout
+        :param can_id: CAN ID the request is forwarded to, None for the VESC itself
+        :return: the reply message
+        """
+        if timeout is None:
+            timeout = self.request_timeout
+        future, = self.dispatcher.expect(msg_id, can_id, timeout)
+        self.outgoing.put(data, flush=True)
+        try:
+            return future.result(timeout)
+        except futures.TimeoutError:
+            if not self.dispatcher.cancel(future):
+                # the reply arrived, or the request expired, just after the timeout
+                return future.result(0)
+            raise TimeoutError("No reply with id %u received within %g seconds." % (msg_id, timeout))
+
+    def _request_many(self, data, msg_id, count, timeout=None):
+        """
+        Writes several requests at once and waits for their replies, so they cost about one round trip.
+        :param data: the encoded requests, concatenated
+        :param msg_id: id of the reply messages
+        :param count: number of requests in data
+        :param timeout: time in seconds to wait for all the replies, defaults to request_timeout
+        :return: list of the replies in the order they arrived, shorter than count if some did not arrive in time
+        """
+        if timeout is None:
+            timeout = self.request_timeout
+        pending = self.dispatcher.expect(msg_id, None, timeout, count)
+        self.outgoing.put(data, flush=True)
+        done, not_done = futures.wait(pending, timeout)
+        for future in not_done:
+            # replies that arrived just after the timeout are kept
+            self.dispatcher.cancel(future)
+        # replies complete the oldest pending futures first, so the done futures are in arrival order
+        return [future.result() for future in pending if future.done() and future.exception() is None]
+
+    def _request_all(self, data, pending, timeout):
+        """
+        Writes requests registered with the dispatcher and waits for all their replies.
+        :param data: the encoded requests, concatenated
+        :param pending: futures of the requests, as returned by Dispatcher.expect
+        :param timeout: time in seconds to wait for all the replies
+        :return: list of the replies in the order of pending, None for the requests that were not answered in time
+        """
+        self.outgoing.put(data, flush=True)
+        done, not_done = futures.wait(pending, timeout)
+        for future in not_done:
+            self.dispatcher.cancel(future)
+        return [future.result() if future.done() and future.exception() is None else None for future in pending]
+
+    def request(self, msg_cls, can_id=None, timeout=None):
+        """
+        Requests a getter message and waits for the reply.
+        :param msg_cls: The getter message type, e.g. GetValues
+        :param can_id: Optional, CAN ID of the VESC to request the message from
+        :param timeout: time in seconds to wait for the reply, defaults to request_timeout
+        :return: the reply message
+        """
+        return self._request(encode_request(msg_cls(can_id=can_id)), msg_cls.id, timeout, can_id)
+
+    def request_many(self, requests, timeout=None):
+        """
+        Pipelines several getter requests on the link and waits for all the replies, so they cost about one round trip,
+        e.g. request_many([GetValues, GetVersion, (GetValues, 3)]).
+        :param requests: list of getter message types, or of (message type, CAN ID) tuples for forwarded requests
+        :param timeout: time in seconds to wait for all the replies, defaults to request_timeout
+        :return: list of the replies in the order of requests, None for the requests that were not answered in time
+        """
+        if timeout is None:
+            timeout = self.request_timeout
+        pending = []
+        data = bytearray()
+        for request in requests:
+            msg_cls, can_id = request if isinstance(request, tuple) else (request, None)
+            pending.extend(self.dispatcher.expect(msg_cls.id, can_id, timeout))
+            data += encode_request(msg_cls(can_id=can_id))
+        return self._request_all(data, pending, timeout)
+
+    def subscribe(self, msg_cls, target, capacity=1024):
+        """
+        Hands the received messages of a type that are not replies to a request to a consumer, e.g. the rotor position
+        pushed by the firmware after SetRotorPositionMode, with subscribe(GetRotorPosition, queue.Queue(4096)), or the
+        text of COMM_PRINT with subscribe(Print, lambda msg: print(msg.text)). The reader thread never waits for the
+        consumer: if it falls behind, the oldest messages are dropped and counted in the subscription's dropped.
+        :param msg_cls: The message type
+        :param target: function called with each message from a thread of the subscription, or a queue.Queue-like
+                       object the messages are put in
+        :param capacity: number of messages buffered for a callback
+        :return: Subscription
+        """
+        subscription = Subscription(target, capacity)
+        self._subscriptions.setdefault(msg_cls.id, []).append(subscription)
+        self.dispatcher.subscribe(msg_cls.id, subscription.push)
+        return subscription
+
+    def unsubscribe(self, msg_cls, target=None):
+        """
+        :param msg_cls: The subscribed message type
+        :param target: the Subscription, or the callback or queue it was created with. None for all subscriptions of
+                       msg_cls.
         """
-        self._stop_heartbeat.set()
-        if self.heart_beat_thread.is_alive():
-            self.heart_beat_thread.join()
+        subscriptions = self._subscriptions.get(msg_cls.id, [])
+        for subscription in list(subscriptions):
+            if target is None or target is subscription or target is subscription.target:
+                self.dispatcher.unsubscribe(msg_cls.id, subscription.push)
+                subscriptions.remove(subscription)
+                subscription.close()
 
     def write(self, data, num_read_bytes=None):
         """
         A write wrapper function implemented like this to try and make it easier to incorporate other communication
-        methods than UART in the future.
+        methods than UART in the future. The data is queued and written together with the frames queued within the
+        write window, call flush() to write it at once.
         :param data: the byte string to be sent
-        :param num_read_bytes: number of bytes to read for decoding response
-        :return: decoded response from buffer
+        :param num_read_bytes: if not None, wait for the replies to the requests in data. The replies are matched by
+                               message id and CAN ID so their length does not need to be known; kept for backwards
+                               compatibility.
+        :return: decoded response if num_read_bytes is not None, a list of them if data holds several requests
+        """
+        if num_read_bytes is None:
+            self.outgoing.put(data)
+            self.heartbeat.touch_frames(data)
+            return
+        keys = []
+        offset = 0
+        while offset < len(data):
+            payload, consumed = unframe(data, offset=offset)
+            if not consumed:
+                break
+            offset += consumed
+            if payload is None:
+                continue
+            # the COMM_FORWARD_CAN header of forwarded requests holds the CAN ID
+            if payload[0] == VESCMessage._comm_forward_can:
+                keys.append((payload[2], payload[1]))
+            else:
+                keys.append((payload[0], None))
+        if len(keys) == 1:
+            return self._request(data, keys[0][0], can_id=keys[0][1])
+        pending = [self.dispatcher.expect(msg_id, can_id, self.request_timeout)[0] for msg_id, can_id in keys]
+        return self._request_all(data, pending, self.request_timeout)
+
+    def _write_now(self, data):
+        """
+        Writes data with the pending frames without waiting for the write window, e.g. for frames that are timed.
+        """
+        self.outgoing.put(data, flush=True)
+        self.heartbeat.touch_frames(data)
+
+    def flush(self):
+        """
+        Writes the frames held in the write window now.
+        """
+        self.outgoing.flush()
+
+    def emergency_stop(self, can_ids=()):
+        """
+        Stops a playing trajectory and writes SetCurrent(0) ahead of all queued frames, which are dropped so that no
+        queued setpoint is written after the stop. Requests waiting for a reply may time out.
+        :param can_ids: CAN IDs of the VESCs behind this one to stop as well
+        """
+        if self._player is not None:
+            self._player.stop()
+        data = encode(SetCurrent(0)) + b''.join(encode(SetCurrent(0, can_id=can_id)) for can_id in can_ids)
+        self.outgoing.put_urgent(data)
+        self.heartbeat.touch_frames(data)
+
+    def request_selective(self, msg_cls, mask, can_id=None, timeout=None):
+        """
+        Requests some of the fields of a selective getter and waits for the reply. Only the selected fields are sent
+        by the VESC, e.g. request_selective(GetValuesSelective, GetValuesSelective.build_mask('rpm', 'v_in')).
+        :param msg_cls: The selective getter message type, e.g. GetValuesSelective
+        :param mask: bitmask of the wanted fields
+        :param can_id: Optional, CAN ID of the VESC to request the message from
+        :param timeout: time in seconds to wait for the reply, defaults to request_timeout
+        :return: the reply message, with a mask field followed by the selected fields
+        """
+        key = (msg_cls, mask, can_id)
+        data = self._selective_requests.get(key)
+        if data is None:
+            data = self._selective_requests[key] = encode(msg_cls(mask, can_id=can_id))
+        return self._request(data, msg_cls.id, timeout, can_id)
+
+    def start_stream(self, msg_cls=GetValues, rate_hz=50, capacity=1024, mask=None, can_id=None):
+        """
+        Starts polling a getter at a fixed rate. Requests are pipelined without waiting for the replies, and the
+        replies are pushed into a bounded buffer, dropping the oldest samples if the consumer falls behind. Replies to
+        request() calls for the same message are pushed too.
+        :param msg_cls: The getter message type, e.g. GetValues or GetValuesSelective
+        :param rate_hz: number of requests per second
+        :param capacity: number of samples kept in the buffer
+        :param mask: bitmask of the wanted fields, required for the selective getters
+        :param can_id: Optional, CAN ID of the VESC to poll
+        :return: TelemetryStream with latest(), drain() and iteration over the samples
+        """
+        if msg_cls.id in self._streams:
+            raise ValueError("%s is already being streamed" % msg_cls.__name__)
+        if mask is None:
+            data = encode_request(msg_cls(can_id=can_id))
+        else:
+            data = encode(msg_cls(mask, can_id=can_id))
+        stream = TelemetryStream(self.outgoing.put, data, msg_cls.id, rate_hz, capacity)
+        self._streams[msg_cls.id] = stream
+        stream.start()
+        return stream
+
+    def stop_stream(self, msg_cls=None):
+        """
+        Stops a stream started by start_stream. Samples already buffered can still be taken from it.
+        :param msg_cls: The streamed message type, or None to stop all streams
+        """
+        if msg_cls is None:
+            msg_ids = list(self._streams)
+        else:
+            msg_ids = [msg_cls.id]
+        for msg_id in msg_ids:
+            stream = self._streams.pop(msg_id, None)
+            if stream is not None:
+                stream.stop()
+
+    def play_trajectory(self, frames, offsets=None, rate_hz=1000, tolerance=None, spin=0.001):
+        """
+        Starts sending pre-encoded setpoints at a fixed rate on an absolute deadline schedule, e.g.
+        play_trajectory(*encode_many(SetCurrent, currents), rate_hz=1000). The setpoints keep the motor alive, so no
+        heartbeat is sent while playing unless the period is longer than the heartbeat period.
+        :param frames: buffer of concatenated frames with offsets, or a sequence of encoded frames
+        :param offsets: offsets of the frames in the buffer, as returned by encode_many
+        :param rate_hz: number of frames per second
+        :param tolerance: lateness in seconds above which a frame counts as late, defaults to a quarter period
+        :param spin: time in seconds before each deadline that is busy waited instead of slept
+        :return: TrajectoryPlayer reporting the late and missed frames, with wait() and stop()
+        """
+        if self._player is not None and self._player.running:
+            raise ValueError("A trajectory is already playing")
+        player = TrajectoryPlayer(self._write_now, frames, offsets, rate_hz, tolerance=tolerance, spin=spin)
+        self._player = player
+        player.start()
+        return player
+
+    def command(self, msg_cls, can_id=None):
+        """
+        Creates a pre-encoded command for sending a setter message repeatedly, e.g. from a control loop. Only the value
+        bytes and the CRC are updated on each send.
+        :param msg_cls: The setter message type, e.g. SetCurrent
+        :param can_id: Optional, CAN ID to forward the command to
+        :return: CommandTemplate whose send() writes to this VESC
+        """
+        return CommandTemplate(msg_cls, can_id=can_id, write=self.write)
+
+    def _send_command(self, msg_cls, values, can_id=None):
+        """
+        Sends a setter message through a cached command template. The templates are shared by all callers and not
+        thread-safe, so setters of the same message type and CAN ID must not be called from several threads at once.
         """
-        self.serial_port.write(data)
-        if num_read_bytes is not None:
-            while self.serial_port.in_waiting <= num_read_bytes:
-                time.sleep(0.000001)  # add some delay just to help the CPU
-            response, consumed = decode(self.serial_port.read(self.serial_port.in_waiting))
-            return response
+        key = (msg_cls, can_id)
+        template = self._command_templates.get(key)
+        if template is None:
+            template = self._command_templates[key] = self.command(msg_cls, can_id=can_id)
+        template.send(*values)
 
-    def set_rpm(self, new_rpm, **kwargs):
+    def set_rpm(self, new_rpm, can_id=None):
         """
         Set the electronic RPM value (a.k.a. the RPM value of the stator)
         :param new_rpm: new rpm value
         """
-        self.write(encode(SetRPM(new_rpm, **kwargs)))
+        self._send_command(SetRPM, (new_rpm,), can_id)
 
-    def set_current(self, new_current, **kwargs):
+    def set_current(self, new_current, can_id=None):
         """
         :param new_current: new current in milli-amps for the motor
         """
-        self.write(encode(SetCurrent(new_current, **kwargs)))
+        self._send_command(SetCurrent, (new_current,), can_id)
 
-    def set_duty_cycle(self, new_duty_cycle, **kwargs):
+    def set_duty_cycle(self, new_duty_cycle, can_id=None):
         """
         :param new_duty_cycle: Value of duty cycle to be set (range [-1e5, 1e5]).
         """
-        self.write(encode(SetDutyCycle(new_duty_cycle, **kwargs)))
+        self._send_command(SetDutyCycle, (new_duty_cycle,), can_id)
 
-    def set_servo(self, new_servo_pos, **kwargs):
+    def set_servo(self, new_servo_pos, can_id=None):
         """
         :param new_servo_pos: New servo position. valid range [0, 1]
         """
-        self.write(encode(SetServoPosition(new_servo_pos, **kwargs)))
+        self._send_command(SetServoPosition, (new_servo_pos,), can_id)
 
     def get_measurements(self):
         """
         :return: A msg object with attributes containing the measurement values
         """
-        return self.write(self._get_values_msg, num_read_bytes=self._get_values_msg_expected_length)
+        return self._request(self._get_values_msg, GetValues.id)
 
     def get_firmware_version(self):
-        msg = GetVersion()
-        return str(self.write(encode_request(msg), num_read_bytes=msg._full_msg_size))
+        return str(self.request(GetVersion))
 
     def get_rpm(self):
         """
@@ -1 +1,27 @@
-from .VESC import VESC
\ No newline at end of file
+from pyvesc._lazy import lazy_module
+
+lazy_module(__name__, {
+    'VESC': ('pyvesc.VESC.VESC', 'VESC'),
+    'AsyncVESC': ('pyvesc.VESC.AsyncVESC', 'AsyncVESC'),
+    'CanBus': ('pyvesc.VESC.CanBus', 'CanBus'),
+    'Transport': ('pyvesc.VESC.transport', 'Transport'),
+    'SerialTransport': ('pyvesc.VESC.transport', 'SerialTransport'),
+    'SocketTransport': ('pyvesc.VESC.transport', 'SocketTransport'),
+    'UDPTransport': ('pyvesc.VESC.transport', 'UDPTransport'),
+    'PipeTransport': ('pyvesc.VESC.transport', 'PipeTransport'),
+    'Heartbeat': ('pyvesc.VESC.heartbeat', 'Heartbeat'),
+    'HeartbeatScheduler': ('pyvesc.VESC.heartbeat', 'HeartbeatScheduler'),
+    'Dispatcher': ('pyvesc.VESC.dispatch', 'Dispatcher'),
+    'OutgoingQueue': ('pyvesc.VESC.outgoing', 'OutgoingQueue'),
+    'TrajectoryPlayer': ('pyvesc.VESC.player', 'TrajectoryPlayer'),
+    'RingBuffer': ('pyvesc.VESC.stream', 'RingBuffer'),
+    'Subscription': ('pyvesc.VESC.stream', 'Subscription'),
+    'TelemetryStream': ('pyvesc.VESC.stream', 'TelemetryStream'),
+    'dispatch': ('pyvesc.VESC.dispatch', None),
+    'heartbeat': ('pyvesc.VESC.heartbeat', None),
+    'messages': ('pyvesc.VESC.messages', None),
+    'outgoing': ('pyvesc.VESC.outgoing', None),
+    'player': ('pyvesc.VESC.player', None),
+    'stream': ('pyvesc.VESC.stream', None),
+    'transport': ('pyvesc.VESC.transport', None),
+})
@@ -0,0 +1,183 @@
+import collections
+import threading
+import time
+from concurrent import futures
+
+
+def reply_can_id(msg):
+    """
+    Forwarded replies do not carry the CAN ID they came from, but some messages (e.g. GetValues) have the controller
+    id of the sender in their app_controller_id field.
+    :param msg: received message
+    :return: controller id of the sender, None if the message does not tell
+    """
+    if 'app_controller_id' in msg._field_names:
+        return ord(msg.app_controller_id)
+    return None
+
+
+class Dispatcher(object):
+    """
+    Matches received messages to the requests waiting for them, so any number of requests can be in flight on one
+    link. Requests are keyed by the id of the reply message and the CAN ID they were forwarded to. A reply that tells
+    its sender completes the oldest request forwarded to that CAN ID, or else the oldest request to the VESC itself.
+    Other replies complete the oldest request with their message id.
+
+    Messages that complete no request are handed to the subscribers of their message id. Requests nobody waits on
+    any more are failed with a TimeoutError by expire().
+    """
+    def __init__(self, metrics=None):
+        """
+        :param metrics: Optional, Metrics to record the request latencies and timeouts in
+        """
+        self.metrics = metrics
+        #: messages that completed no request and had no subscriber
+        self.unhandled = 0
+        #: exceptions raised by subscriber callbacks
+        self.callback_errors = 0
+        # msg_id -> deque of futures, oldest first
+        self._pending = {}
+        self._subscribers = {}
+        self._next_deadline = None
+        self._lock = threading.Lock()
+
+    def expect(self, msg_id, can_id=None, timeout=1.0, count=1):
+        """
+        Registers requests before they are written.
+        :param msg_id: id of the reply message
+        :param can_id: CAN ID the requests are forwarded to, None for the VESC itself
+        :param timeout: time in seconds after which expire() fails the requests
+        :param count: number of requests
+        :return: list of futures completed with the replies
+        """
+        now = time.perf_counter()
+        pending = []
+        for i in range(count):
+            future = futures.Future()
+            future.msg_id = msg_id
+            future.can_id = can_id
+            future.sent = now
+            future.deadline = now + timeout
+            pending.append(future)
+        with self._lock:
+            self._pending.setdefault(msg_id, collections.deque()).extend(pending)
+            if self._next_deadline is None or now + timeout < self._next_deadline:
+                self._next_deadline = now + timeout
+        return pending
+
+    def cancel(self, future):
+        """
+        Stops waiting for a reply, e.g. after the caller timed out. Counted as a timeout.
+        :param future: future returned by expect
+        :return: True if the request was still pending, False if it was completed or expired meanwhile
+        """
+        with self._lock:
+            waiting = self._pending.get(future.msg_id)
+            if future.done() or not waiting or future not in waiting:
+                return False
+            waiting.remove(future)
+        if self.metrics is not None:
+            self.metrics.count_timeout(future.msg_id)
+        return True
+
+    def expire(self, now=None):
+        """
+        Fails the requests whose timeout has passed with a TimeoutError. Cheap to call often.
+        :param now: time.perf_counter value, defaults to now
+        """
+        if now is None:
+            now = time.perf_counter()
+        if self._next_deadline is None or now < self._next_deadline:
+            return
+        expired = []
+        with self._lock:
+            next_deadline = None
+            for waiting in self._pending.values():
+                for future in list(waiting):
+                    if future.deadline <= now:
+                        waiting.remove(future)
+                        expired.append(future)
+                    elif next_deadline is None or future.deadline < next_deadline:
+                        next_deadline = future.deadline
+            self._next_deadline = next_deadline
+        for future in expired:
+            future.set_exception(TimeoutError("No reply with id %u received within %g seconds."
+                                              % (future.msg_id, future.deadline - future.sent)))
+            if self.metrics is not None:
+                self.metrics.count_timeout(future.msg_id)
+
+    def fail_all(self, exception):
+        """
+        Fails every pending request, e.g. when the link is closed.
+        """
+        with self._lock:
+            pending = [future for waiting in self._pending.values() for future in waiting]
+            self._pending.clear()
+            self._next_deadline = None
+        for future in pending:
+            future.set_exception(exception)
+
+    def subscribe(self, msg_id, callback):
+        """
+        :param msg_id: id of the messages to receive
+        :param callback: function called with each message that completes no request. Called from the reader thread,
+                         so it should return quickly.
+        """
+        with self._lock:
+            # subscribers are replaced rather than mutated so dispatch can iterate without the lock
+            self._subscribers[msg_id] = self._subscribers.get(msg_id, ()) + (callback,)
+
+    def unsubscribe(self, msg_id, callback):
+        with self._lock:
+            callbacks = list(self._subscribers.get(msg_id, ()))
+            if callback in callbacks:
+                callbacks.remove(callback)
+            if callbacks:
+                self._subscribers[msg_id] = tuple(callbacks)
+            else:
+                self._subscribers.pop(msg_id, None)
+
+    def _match(self, waiting, msg):
+        """
+        :return: index in waiting of the request msg replies to
+        """
+        sender = reply_can_id(msg)
+        if sender is None or len(waiting) == 1:
+            return 0
+        local = None
+        for idx, future in enumerate(waiting):
+            if future.can_id == sender:
+                return idx
+            if local is None and future.can_id is None:
+                local = idx
+        return local if local is not None else 0
+
+    def dispatch(self, msg):
+        """
+        Completes the request msg replies to, or hands msg to the subscribers of its message id.
+        :param msg: received message
+        :return: True if msg completed a request
+        """
+        future = None
+        with self._lock:
+            waiting = self._pending.get(msg.id)
+            if waiting:
+                idx = self._match(waiting, msg)
+                future = waiting[idx]
+                del waiting[idx]
+        if future is not None:
+            future.set_result(msg)
+            if self.metrics is not None:
+                self.metrics.observe_latency(msg.id, time.perf_counter() - future.sent)
+            return True
+        callbacks = self._subscribers.get(msg.id)
+        if not callbacks:
+            self.unhandled += 1
+            return False
+        for callback in callbacks:
+            try:
+                callback(msg)
+            except Exception:
+                # a failing subscriber must not stop the reader thread
+                self.callback_errors += 1
+        return False
@@ -0,0 +1,244 @@
+import threading
+import time
+from pyvesc.protocol.base import VESCMessage
+from pyvesc.protocol.interface import encode
+from pyvesc.VESC.messages import Alive, SetCurrent, SetCurrentBrake, SetDutyCycle, SetPosition, SetRPM
+
+# commands that reset the firmware's command timeout, so an Alive is redundant after them
+_keepalive_ids = frozenset(msg_cls.id for msg_cls in (Alive, SetCurrent, SetCurrentBrake, SetDutyCycle, SetPosition,
+                                                      SetRPM))
+
+
+def _commands(data):
+    """
+    Walks the frames in written data.
+    :param data: encoded frames
+    :return: generator of (can_id, msg_id) of the frames, can_id is None for frames that are not forwarded
+    """
+    end = len(data)
+    offset = 0
+    while offset < end:
+        start_byte = data[offset]
+        if start_byte == 0x2 and offset + 2 < end:
+            index = offset + 2
+            length = data[offset + 1]
+        elif start_byte == 0x3 and offset + 3 < end:
+            index = offset + 3
+            length = (data[offset + 1] << 8) | data[offset + 2]
+        else:
+            return
+        msg_id = data[index]
+        if msg_id == VESCMessage._comm_forward_can and length > 2 and index + 2 < end:
+            yield data[index + 1], data[index + 2]
+        else:
+            yield None, msg_id
+        offset = index + length + 3
+
+
+class Heartbeat(object):
+    """
+    Keeps the commands of one link alive. A target is the VESC itself (can_id None) or a VESC behind it on the CAN bus.
+    The time of the last command written to each target is tracked, and an Alive is only sent to a target that has
+    not received a command for period. Targets due within window of each other get their Alive in the same write.
+
+    The targets are the encoded Alives in alive_msg, which may also be appended to directly. The Alives are written by
+    a HeartbeatScheduler, which serves many links from one thread.
+    """
+    def __init__(self, write, period=0.1, window=0.02, alive_msg=None):
+        """
+        :param write: function writing bytes to the link
+        :param period: longest time in seconds a target may go without a command
+        :param window: targets due within this time in seconds of each other are sent their Alive together
+        :param alive_msg: Optional, list of the encoded Alives of the targets
+        """
+        self.period = period
+        self.window = window
+        self.alive_msg = alive_msg if alive_msg is not None else []
+        #: Alive frames written
+        self.alive_sent = 0
+        #: writes of Alive frames
+        self.writes = 0
+        self.scheduler = None
+        self._write = write
+        # can_id -> [deadline, encoded Alive]
+        self._targets = {}
+        self._synced = []
+        self._lock = threading.Lock()
+
+    def _sync_targets(self):
+        """
+        Updates the targets from alive_msg, keeping the deadlines of the existing ones. Called with the lock held.
+        """
+        if self._synced == self.alive_msg:
+            return
+        targets = {}
+        for frame in self.alive_msg:
+            for can_id, msg_id in _commands(frame):
+                targets[can_id] = self._targets.get(can_id) or [time.monotonic() + self.period, frame]
+        self._targets = targets
+        self._synced = list(self.alive_msg)
+
+    @property
+    def targets(self):
+        with self._lock:
+            self._sync_targets()
+            return list(self._targets)
+
+    def add_target(self, can_id=None):
+        """
+        :param can_id: CAN ID of the VESC to keep alive, None for the VESC the link is connected to
+        """
+        with self._lock:
+            self._sync_targets()
+            if can_id not in self._targets:
+                self.alive_msg.append(encode(Alive(can_id=can_id)))
+                self._sync_targets()
+        if self.scheduler is not None:
+            self.scheduler.wake()
+
+    def remove_target(self, can_id=None):
+        with self._lock:
+            self._sync_targets()
+            target = self._targets.get(can_id)
+            if target is not None:
+                self.alive_msg.remove(target[1])
+                self._sync_targets()
+
+    def touch(self, can_id=None):
+        """
+        Records that a command was written to a target, postponing its Alive.
+        :param can_id: CAN ID the command was forwarded to, None if it was for the VESC itself
+        """
+        target = self._targets.get(can_id)
+        if target is not None:
+            target[0] = time.monotonic() + self.period
+
+    def touch_frames(self, data):
+        """
+        Records the commands in written data, which may hold several frames.
+        :param data: encoded frames
+        """
+        for can_id, msg_id in _commands(data):
+            if msg_id in _keepalive_ids:
+                self.touch(can_id)
+
+    def collect_due(self, now=None):
+        """
+        Takes the Alives of the targets due within window, and postpones their deadlines.
+        :param now: time.monotonic value, defaults to now
+        :return: (the Alives to write in a single write, empty if none is due; time.monotonic value at which the next
+                 Alive is due, None if there are no targets)
+        """
+        if now is None:
+            now = time.monotonic()
+        frames = []
+        with self._lock:
+            self._sync_targets()
+            for target in self._targets.values():
+                if target[0] <= now + self.window:
+                    frames.append(target[1])
+                    target[0] = now + self.period
+            next_deadline = min((target[0] for target in self._targets.values()), default=None)
+        return b''.join(frames), next_deadline
+
+    def send_due(self, now=None):
+        """
+        Writes the Alives of the targets due within window, in a single write.
+        :param now: time.monotonic value, defaults to now
+        :return: time.monotonic value at which the next Alive is due, None if there are no targets
+        """
+        data, next_deadline = self.collect_due(now)
+        if data:
+            self._write(data)
+            self.alive_sent += len(list(_commands(data)))
+            self.writes += 1
+        return next_deadline
+
+
+class HeartbeatScheduler(object):
+    """
+    Sends the Alives of many Heartbeats from a single thread, which sleeps until the earliest deadline. The thread is
+    started when the first Heartbeat is added and ends when the last one is removed.
+
+    The Alives are written without holding the scheduler's lock, so a slow link does not block adding or removing
+    Heartbeats. It does delay the Alives of the other links until its write returns.
+    """
+    def __init__(self):
+        self._heartbeats = []
+        self._cond = threading.Condition()
+        self._changed = False
+        self.scheduler_thread = None
+
+    def add(self, heartbeat):
+        with self._cond:
+            if heartbeat not in self._heartbeats:
+                self._heartbeats.append(heartbeat)
+                heartbeat.scheduler = self
+            if self.scheduler_thread is None:
+                self.scheduler_thread = threading.Thread(target=self._scheduler_cmd_func, daemon=True)
+                self.scheduler_thread.start()
+            self._changed = True
+            self._cond.notify()
+
+    def remove(self, heartbeat):
+        """
+        Stops sending the Alives of a Heartbeat. An Alive already being written may still complete.
+        """
+        with self._cond:
+            if heartbeat in self._heartbeats:
+                self._heartbeats.remove(heartbeat)
+                heartbeat.scheduler = None
+            self._changed = True
+            self._cond.notify()
+
+    def wake(self):
+        """
+        Makes the scheduler recompute its next deadline, e.g. after a target was added.
+        """
+        with self._cond:
+            self._changed = True
+            self._cond.notify()
+
+    def _scheduler_cmd_func(self):
+        """
+        Sends the due Alives and sleeps until the next deadline. Heartbeats whose link was closed are removed.
+        """
+        while True:
+            with self._cond:
+                if not self._heartbeats:
+                    self.scheduler_thread = None
+                    return
+                heartbeats = list(self._heartbeats)
+                self._changed = False
+            now = time.monotonic()
+            next_deadline = None
+            for heartbeat in heartbeats:
+                if heartbeat.scheduler is not self:
+                    continue
+                try:
+                    deadline = heartbeat.send_due(now)
+                except (OSError, ValueError):
+                    # the transport was closed
+                    self.remove(heartbeat)
+                    continue
+                if deadline is not None and (next_deadline is None or deadline < next_deadline):
+                    next_deadline = deadline
+            with self._cond:
+                # add, remove or wake may have been called while the Alives were written
+                if not self._changed:
+                    self._cond.wait(None if next_deadline is None else max(0.0, next_deadline - time.monotonic()))
+
+
+_shared_scheduler = None
+_shared_scheduler_lock = threading.Lock()
+
+
+def shared_scheduler():
+    """
+    :return: the HeartbeatScheduler used by all VESC instances that are not given their own
+    """
+    global _shared_scheduler
+    with _shared_scheduler_lock:
+        if _shared_scheduler is None:
+            _shared_scheduler = HeartbeatScheduler()
+        return _shared_scheduler
@@ -1,5 +1,6 @@
 from pyvesc.protocol.base import VESCMessage
 from pyvesc.VESC.messages import VedderCmd
+import struct
 
 
 pre_v3_33_fields = [('temp_mos1', 'h', 10),
@@ -76,4 +77,131 @@ class GetRotorPosition(metaclass=VESCMessage):
 
     fields = [
             ('rotor_pos', 'i', 100000)
-    ]
\ No newline at end of file
+    ]
+
+
+class Print(metaclass=VESCMessage):
+    """ Text printed by the firmware
+
+    Sent by the VESC without a request, e.g. in reply to terminal commands.
+    """
+    id = VedderCmd.COMM_PRINT
+
+    fields = [
+            ('text', 's', 0)
+    ]
+
+
+_mask_struct = struct.Struct('!I')
+
+
+class _SelectiveGetter(object):
+    """ Shared behaviour of the selective getters.
+
+    The request carries a bitmask of the wanted field groups, and the reply echoes the mask followed by the fields of
+    the selected groups in bit order. Each mask gets its own message class (a layout), generated on first use and
+    cached, so decoding a reply is a single precompiled unpack of only the selected fields.
+
+    Layouts are not registered, so the message id still maps to the getter itself and requests are encoded as before.
+    Decoded replies are instances of the layout, e.g. GetValuesSelective_00000180, not of the getter, so compare their
+    id rather than their type. To decode recorded replies in bulk, pass the layout of their mask to decode_batch. The
+    bit order of field_groups is the firmware's and does not follow pre_v3_33_fields.
+    """
+    __slots__ = ()
+
+    @classmethod
+    def build_mask(cls, *field_names):
+        """
+        :param field_names: names of the wanted fields, e.g. 'rpm', 'v_in'
+        :return: bitmask selecting the groups of the given fields
+        """
+        bits = {field[0]: bit for bit, group in enumerate(cls.field_groups) for field in group}
+        mask = 0
+        for field_name in field_names:
+            if field_name not in bits:
+                raise ValueError("%s has no field %s" % (cls.__name__, field_name))
+            mask |= 1 << bits[field_name]
+        return mask
+
+    @classmethod
+    def layout(cls, mask):
+        """
+        :param mask: bitmask of the selected field groups
+        :return: message class of the replies to requests with this mask
+        """
+        layout = cls._layouts.get(mask)
+        if layout is None:
+            fields = list(cls.fields)
+            for bit, group in enumerate(cls.field_groups):
+                if mask & (1 << bit):
+                    fields.extend(group)
+            layout = cls._layouts[mask] = VESCMessage('%s_%08x' % (cls.__name__, mask), (),
+                                                      {'id': cls.id, 'fields': fields, '__doc__': cls.__doc__},
+                                                      register=False)
+        return layout
+
+    @classmethod
+    def _layout_for_payload(cls, payload):
+        mask = _mask_struct.unpack_from(payload, 1)[0]
+        layout = cls._layouts.get(mask)
+        return layout if layout is not None else cls.layout(mask)
+
+
+class GetValuesSelective(_SelectiveGetter, metaclass=VESCMessage):
+    """ Gets a selection of the GetValues fields
+
+    Send GetValuesSelective(GetValuesSelective.build_mask('rpm', 'avg_motor_current', 'v_in')) to request only the rpm,
+    current and voltage. The reply has a mask field followed by the selected fields.
+    """
+    id = VedderCmd.COMM_GET_VALUES_SELECTIVE
+
+    fields = [
+        ('mask', 'I')
+    ]
+
+    _layouts = {}
+
+    # indexed by mask bit
+    field_groups = [[field] for field in GetValues.fields[:18]] + [
+        [('temp_mos1', 'h', 10), ('temp_mos2', 'h', 10), ('temp_mos3', 'h', 10)],
+        [('avg_vd', 'i', 1000), ('avg_vq', 'i', 1000)],
+    ]
+
+
+class GetValuesSetupSelective(_SelectiveGetter, metaclass=VESCMessage):
+    """ Gets a selection of the setup values, summed over all VESCs on the CAN bus
+
+    Used like GetValuesSelective.
+    """
+    id = VedderCmd.COMM_GET_VALUES_SETUP_SELECTIVE
+
+    fields = [
+        ('mask', 'I')
+    ]
+
+    _layouts = {}
+
+    # indexed by mask bit
+    field_groups = [
+        [('temp_fet', 'h', 10)],
+        [('temp_motor', 'h', 10)],
+        [('current_tot', 'i', 100)],
+        [('current_in_tot', 'i', 100)],
+        [('duty_now', 'h', 1000)],
+        [('rpm', 'i', 1)],
+        [('speed', 'i', 1000)],
+        [('v_in', 'h', 10)],
+        [('battery_level', 'h', 1000)],
+        [('amp_hours', 'i', 10000)],
+        [('amp_hours_charged', 'i', 10000)],
+        [('watt_hours', 'i', 10000)],
+        [('watt_hours_charged', 'i', 10000)],
+        [('distance', 'i', 1000)],
+        [('distance_abs', 'i', 1000)],
+        [('pid_pos_now', 'i', 1000000)],
+        [('mc_fault_code', 'c', 0)],
+        [('app_controller_id', 'c', 0)],
+        [('num_vescs', 'B', 0)],
+        [('wh_batt_left', 'i', 1000)],
+        [('odometer', 'I', 1)],
+    ]
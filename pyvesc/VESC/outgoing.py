@@ -0,0 +1,146 @@
+import threading
+import time
+
+
+class OutgoingQueue(object):
+    """
+    Thread-safe queue of the frames written to a VESC. Frames queued within window of the first pending one are written
+    together in one contiguous write by a background thread, which saves a syscall, and on USB-CDC a USB frame, per
+    frame. Writes never interleave: the writer thread, flush() and put_urgent() all write under the same lock, and
+    frames are written in the order they were queued.
+
+    Frames are copied into the queue, so the caller may reuse its buffer as soon as put() returns.
+    """
+    def __init__(self, write, window=0.0002, max_bytes=4096):
+        """
+        :param write: function writing bytes to the transport
+        :param window: time in seconds frames are held to be coalesced with later ones, 0 writes every frame at once
+        :param max_bytes: pending bytes at which the frames are written without waiting for the window to end
+        """
+        self.window = window
+        self.max_bytes = max_bytes
+        #: writes to the transport
+        self.writes = 0
+        #: bytes written to the transport
+        self.bytes_written = 0
+        #: bytes dropped from the queue by put_urgent
+        self.bytes_discarded = 0
+        self._write = write
+        self._pending = bytearray()
+        self._first = 0.0
+        self._error = None
+        self._closed = False
+        self._cond = threading.Condition()
+        self._write_lock = threading.Lock()
+        self.writer_thread = threading.Thread(target=self._writer_cmd_func, daemon=True)
+        self.writer_thread.start()
+
+    def __len__(self):
+        return len(self._pending)
+
+    def _check(self):
+        if self._error is not None:
+            raise self._error
+        if self._closed:
+            raise ValueError("The outgoing queue is closed.")
+
+    def put(self, data, flush=False):
+        """
+        Queues frames to be written.
+        :param data: bytes-like object holding one or more encoded frames
+        :param flush: write the pending frames and data now, e.g. for a request that is waited on
+        """
+        if flush or self.window <= 0:
+            self._flush(data)
+            return
+        with self._cond:
+            self._check()
+            if not self._pending:
+                self._first = time.perf_counter()
+                self._cond.notify()
+            self._pending += data
+            if len(self._pending) >= self.max_bytes:
+                self._cond.notify()
+
+    def put_urgent(self, data, discard=True):
+        """
+        Writes frames ahead of the pending ones, without waiting for the window, e.g. an emergency stop.
+        :param data: bytes-like object holding one or more encoded frames
+        :param discard: drop the pending frames, so no stale setpoint is written after data
+        """
+        with self._write_lock:
+            with self._cond:
+                self._check()
+                pending = self._pending
+                self._pending = bytearray()
+            if discard:
+                self.bytes_discarded += len(pending)
+                pending = b''
+            self._write_now(bytes(data) + pending)
+
+    def flush(self):
+        """
+        Writes the pending frames now. Returns once they were handed to the transport.
+        """
+        self._flush(b'')
+
+    def _flush(self, data):
+        with self._write_lock:
+            with self._cond:
+                self._check()
+                pending = self._pending
+                self._pending = bytearray()
+            pending += data
+            if pending:
+                self._write_now(pending)
+
+    def _write_now(self, data):
+        """
+        Writes to the transport. Called with the write lock held.
+        """
+        self._write(data)
+        self.writes += 1
+        self.bytes_written += len(data)
+
+    def _writer_cmd_func(self):
+        """
+        Waits for the first pending frame, then for the window to end or max_bytes to be reached, and writes the
+        pending frames. A failed write closes the queue and is raised by the next put.
+        """
+        while True:
+            with self._cond:
+                while not self._pending and not self._closed:
+                    self._cond.wait()
+                if self._closed:
+                    return
+                while self._pending and len(self._pending) < self.max_bytes and not self._closed:
+                    remaining = self._first + self.window - time.perf_counter()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+            try:
+                self._flush(b'')
+            except (OSError, ValueError) as e:
+                # the transport was closed
+                with self._cond:
+                    if self._error is None and not self._closed:
+                        self._error = e
+                    self._closed = True
+                return
+
+    def close(self):
+        """
+        Writes the pending frames and stops the writer thread. Frames that can not be written because the transport was
+        closed are dropped.
+        """
+        try:
+            if not self._closed:
+                self.flush()
+        except (OSError, ValueError):
+            pass
+        finally:
+            with self._cond:
+                self._closed = True
+                self._cond.notify()
+            if self.writer_thread.is_alive() and self.writer_thread is not threading.current_thread():
+                self.writer_thread.join()
@@ -0,0 +1,150 @@
+import threading
+import time
+
+
+class TrajectoryPlayer(object):
+    """
+    Sends pre-encoded frames, e.g. from encode_many, at a fixed rate. Frame i is due at start + i * period, measured
+    with time.perf_counter_ns, so timing errors do not accumulate. The player sleeps until shortly before each deadline
+    and spins for the rest, which keeps it on time at rates of a few kHz.
+
+    Frames sent more than tolerance after their deadline are counted in late. When the player falls more than a period
+    behind, the frames whose deadline has passed are skipped, counted in missed, and the newest due frame is sent.
+
+    Setpoints keep the motor alive, so the VESC's heartbeat sends no Alive while playing. Without a VESC, alive frames
+    can be given to write between setpoints when the period is longer than the heartbeat period. Created by
+    VESC.play_trajectory.
+    """
+    def __init__(self, write, frames, offsets=None, rate_hz=1000, tolerance=None, spin=0.001, alive=None,
+                 heartbeat_period=0.1):
+        """
+        :param write: function writing bytes to the VESC
+        :param frames: buffer of concatenated frames with offsets, or a sequence of encoded frames
+        :param offsets: offsets of the frames in the buffer, of length number of frames + 1, as returned by encode_many
+        :param rate_hz: number of frames per second
+        :param tolerance: lateness in seconds above which a frame counts as late, defaults to a quarter period
+        :param spin: time in seconds before each deadline that is busy waited instead of slept
+        :param alive: Optional, list of encoded alive frames to send when no frame is sent for heartbeat_period
+        :param heartbeat_period: longest time in seconds without a write when alive is given
+        """
+        if rate_hz <= 0:
+            raise ValueError("rate_hz must be positive")
+        if offsets is None:
+            self._frames = list(frames)
+        else:
+            view = memoryview(frames)
+            self._frames = [view[offsets[i]:offsets[i + 1]] for i in range(len(offsets) - 1)]
+        self.period_ns = int(round(1e9 / rate_hz))
+        if tolerance is None:
+            self.tolerance_ns = self.period_ns // 4
+        else:
+            self.tolerance_ns = int(tolerance * 1e9)
+        self._spin_ns = int(spin * 1e9)
+        self._sleep_slice_ns = 50000000
+        self._alive = alive
+        self._heartbeat_ns = int(heartbeat_period * 1e9)
+        self._write = write
+        #: frames written
+        self.sent = 0
+        #: frames written more than tolerance after their deadline
+        self.late = 0
+        #: frames skipped because the next deadline had already passed
+        self.missed = 0
+        #: largest lateness of a written frame in seconds
+        self.max_lateness = 0.0
+        #: alive frames written between setpoints
+        self.heartbeats_sent = 0
+        self._stop = threading.Event()
+        self._done = threading.Event()
+        self.player_thread = threading.Thread(target=self._player_cmd_func, daemon=True)
+
+    def __len__(self):
+        return len(self._frames)
+
+    @property
+    def running(self):
+        return self.player_thread.is_alive() and not self._done.is_set()
+
+    def _wait_until(self, deadline):
+        """
+        Sleeps until spin before the deadline, then busy waits for the rest. time.sleep overshoots much less than
+        waiting on an event, so the stop flag is checked between slices of sleep.
+        :param deadline: time.perf_counter_ns value to wait for
+        :return: False if the player was stopped while waiting
+        """
+        while True:
+            remaining = deadline - self._spin_ns - time.perf_counter_ns()
+            if remaining <= 0:
+                break
+            if self._stop.is_set():
+                return False
+            time.sleep(min(remaining, self._sleep_slice_ns) / 1e9)
+        while time.perf_counter_ns() < deadline:
+            if self._stop.is_set():
+                return False
+        return True
+
+    def _player_cmd_func(self):
+        """
+        Writes each frame at its deadline, inserting alive frames when the gap between frames is longer than the
+        heartbeat period.
+        """
+        frames = self._frames
+        count = len(frames)
+        period = self.period_ns
+        start = last_write = time.perf_counter_ns()
+        i = 0
+        try:
+            while i < count:
+                deadline = start + i * period
+                if self._alive:
+                    while deadline - last_write > self._heartbeat_ns:
+                        last_write += self._heartbeat_ns
+                        if not self._wait_until(last_write):
+                            return
+                        for data in self._alive:
+                            self._write(data)
+                        self.heartbeats_sent += 1
+                if not self._wait_until(deadline):
+                    return
+                now = time.perf_counter_ns()
+                behind = (now - deadline) // period
+                if behind:
+                    # a stale setpoint is of no use, send the newest one that is due
+                    behind = min(behind, count - 1 - i)
+                    self.missed += behind
+                    i += behind
+                    deadline += behind * period
+                lateness = now - deadline
+                if lateness > self.tolerance_ns:
+                    self.late += 1
+                if lateness > self.max_lateness * 1e9:
+                    self.max_lateness = lateness / 1e9
+                self._write(frames[i])
+                last_write = now
+                self.sent += 1
+                i += 1
+        except (OSError, ValueError):
+            # the transport was closed
+            pass
+        finally:
+            self._done.set()
+
+    def start(self):
+        self.player_thread.start()
+
+    def stop(self):
+        """
+        Stops playing. Frames not sent yet are dropped.
+        """
+        self._stop.set()
+        if self.player_thread.is_alive():
+            self.player_thread.join()
+
+    def wait(self, timeout=None):
+        """
+        Waits until all frames were sent or the player was stopped.
+        :param timeout: time in seconds to wait, None to wait indefinitely
+        :return: True if the player is done
+        """
+        return self._done.wait(timeout)
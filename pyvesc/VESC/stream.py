@@ -0,0 +1,254 @@
+import queue
+import threading
+import time
+
+
+class RingBuffer(object):
+    """
+    Bounded, preallocated buffer of the most recent samples. push() never blocks on consumers: when the buffer is full
+    the oldest sample is overwritten and counted in dropped.
+
+    Samples can be taken with latest(), drain() or by iterating, which blocks until new samples arrive and ends once
+    the buffer is closed and empty.
+    """
+    def __init__(self, capacity):
+        """
+        :param capacity: number of samples kept
+        """
+        if capacity < 1:
+            raise ValueError("capacity must be at least 1")
+        self.capacity = capacity
+        self.dropped = 0
+        self._items = [None] * capacity
+        self._start = 0
+        self._count = 0
+        self._closed = False
+        self._cond = threading.Condition()
+
+    def __len__(self):
+        return self._count
+
+    @property
+    def closed(self):
+        return self._closed
+
+    def push(self, item):
+        """
+        :param item: sample to append, overwriting the oldest one if the buffer is full
+        """
+        with self._cond:
+            end = self._start + self._count
+            if end >= self.capacity:
+                end -= self.capacity
+            self._items[end] = item
+            if self._count == self.capacity:
+                self._start = end + 1 if end + 1 < self.capacity else 0
+                self.dropped += 1
+            else:
+                self._count += 1
+            self._cond.notify_all()
+
+    def latest(self):
+        """
+        :return: the newest sample without removing it, None if the buffer is empty
+        """
+        with self._cond:
+            if not self._count:
+                return None
+            return self._items[(self._start + self._count - 1) % self.capacity]
+
+    def drain(self):
+        """
+        :return: list of the buffered samples from oldest to newest. The buffer is empty afterwards.
+        """
+        with self._cond:
+            end = self._start + self._count
+            if end <= self.capacity:
+                items = self._items[self._start:end]
+            else:
+                items = self._items[self._start:] + self._items[:end - self.capacity]
+            for i in range(self.capacity):
+                self._items[i] = None
+            self._start = 0
+            self._count = 0
+            return items
+
+    def _pop(self, timeout=None):
+        with self._cond:
+            if not self._count and not self._closed:
+                self._cond.wait(timeout)
+            if not self._count:
+                return None
+            item = self._items[self._start]
+            self._items[self._start] = None
+            self._start = self._start + 1 if self._start + 1 < self.capacity else 0
+            self._count -= 1
+            return item
+
+    def __iter__(self):
+        while True:
+            item = self._pop()
+            if item is not None:
+                yield item
+            elif self._closed:
+                return
+
+    def close(self):
+        """
+        Wakes up blocked iterators, which end once the remaining samples are consumed.
+        """
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+
+class TelemetryStream(object):
+    """
+    Polls a getter at a fixed rate. Requests are written on a background thread without waiting for the replies, and
+    the replies are decoded by the VESC's reader thread and pushed into a RingBuffer. Created by VESC.start_stream.
+    """
+    def __init__(self, write, data, msg_id, rate_hz, capacity=1024):
+        """
+        :param write: function writing bytes to the VESC
+        :param data: the encoded request
+        :param msg_id: id of the reply message
+        :param rate_hz: number of requests per second
+        :param capacity: number of samples kept in the buffer
+        """
+        if rate_hz <= 0:
+            raise ValueError("rate_hz must be positive")
+        self.msg_id = msg_id
+        self.period = 1.0 / rate_hz
+        self.buffer = RingBuffer(capacity)
+        self.requests_sent = 0
+        self._write = write
+        self._data = data
+        self._stop = threading.Event()
+        self.poller_thread = threading.Thread(target=self._poller_cmd_func, daemon=True)
+
+    def _poller_cmd_func(self):
+        """
+        Writes a request every period. Deadlines advance by whole periods so the rate does not drift, and ticks missed
+        by more than a period are skipped instead of being sent in a burst.
+        """
+        deadline = time.monotonic()
+        while not self._stop.wait(max(0.0, deadline - time.monotonic())):
+            try:
+                self._write(self._data)
+            except (OSError, ValueError):
+                # the transport was closed
+                break
+            self.requests_sent += 1
+            deadline += self.period
+            now = time.monotonic()
+            if now - deadline > self.period:
+                deadline = now
+        self.buffer.close()
+
+    def start(self):
+        self.poller_thread.start()
+
+    def stop(self):
+        """
+        Stops polling and closes the buffer. Samples already buffered can still be taken.
+        """
+        self._stop.set()
+        if self.poller_thread.is_alive():
+            self.poller_thread.join()
+        self.buffer.close()
+
+    def latest(self):
+        """
+        :return: the newest sample, None if none has arrived yet
+        """
+        return self.buffer.latest()
+
+    def drain(self):
+        """
+        :return: list of the buffered samples from oldest to newest
+        """
+        return self.buffer.drain()
+
+    def __iter__(self):
+        return iter(self.buffer)
+
+
+class Subscription(object):
+    """
+    Hands the messages of a subscription to a consumer without ever blocking the VESC's reader thread. Messages for a
+    callback are buffered in a RingBuffer and the callback is called from a thread of the subscription, so a slow
+    callback only drops the oldest messages. Messages for a queue are put without waiting, dropping the oldest queued
+    message when the queue is full. Created by VESC.subscribe.
+    """
+    def __init__(self, target, capacity=1024):
+        """
+        :param target: function called with each message, or a queue.Queue-like object with put_nowait and get_nowait
+        :param capacity: number of messages buffered for a callback
+        """
+        self.target = target
+        #: messages handed to the consumer
+        self.delivered = 0
+        #: exceptions raised by the callback
+        self.callback_errors = 0
+        self._dropped = 0
+        self._queue = target if callable(getattr(target, 'put_nowait', None)) else None
+        if self._queue is None and not callable(target):
+            raise TypeError("target must be callable or have put_nowait")
+        self.buffer = None
+        self.delivery_thread = None
+        if self._queue is None:
+            self.buffer = RingBuffer(capacity)
+            self.delivery_thread = threading.Thread(target=self._delivery_cmd_func, daemon=True)
+            self.delivery_thread.start()
+
+    @property
+    def dropped(self):
+        """
+        Messages dropped because the consumer fell behind.
+        """
+        if self.buffer is not None:
+            return self.buffer.dropped
+        return self._dropped
+
+    def push(self, msg):
+        """
+        :param msg: message to hand to the consumer, never blocks
+        """
+        if self._queue is None:
+            self.buffer.push(msg)
+            return
+        try:
+            self._queue.put_nowait(msg)
+        except queue.Full:
+            try:
+                self._queue.get_nowait()
+            except queue.Empty:
+                pass
+            self._dropped += 1
+            try:
+                self._queue.put_nowait(msg)
+            except queue.Full:
+                self._dropped += 1
+                return
+        self.delivered += 1
+
+    def _delivery_cmd_func(self):
+        """
+        Calls the callback with each buffered message until the subscription is closed.
+        """
+        for msg in self.buffer:
+            try:
+                self.target(msg)
+            except Exception:
+                # a failing callback must not end the subscription
+                self.callback_errors += 1
+            self.delivered += 1
+
+    def close(self):
+        """
+        Stops the delivery. Messages already buffered are still handed to the callback.
+        """
+        if self.buffer is not None:
+            self.buffer.close()
+            if self.delivery_thread is not threading.current_thread():
+                self.delivery_thread.join()
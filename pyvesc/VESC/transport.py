@@ -0,0 +1,207 @@
+import socket
+import threading
+
+
+class Transport(object):
+    """
+    Byte stream to a VESC. VESC accepts any transport implementing this interface.
+
+    read() blocks until data is available or the transport's timeout expires, and returns everything that can be read
+    in one call. The returned object may be a view of a buffer that is reused by the next read, so it must be consumed
+    (e.g. fed to a Stateful unpacker) before reading again.
+    """
+    def write(self, data):
+        """
+        :param data: bytes-like object to send.
+        """
+        raise NotImplementedError
+
+    def read(self):
+        """
+        :return: bytes-like object, empty if nothing was received before the timeout.
+        """
+        raise NotImplementedError
+
+    def close(self):
+        raise NotImplementedError
+
+    @property
+    def is_open(self):
+        raise NotImplementedError
+
+
+class SerialTransport(Transport):
+    """
+    Transport over a serial port (UART or USB-CDC). Requires pyserial.
+    """
+    def __init__(self, port, baudrate=115200, timeout=0.05):
+        """
+        :param port: Serial device to use for communication (i.e. "COM3" or "/dev/tty.usbmodem0")
+        :param baudrate: baudrate for the serial communication.
+        :param timeout: longest time in seconds a read blocks.
+        """
+        # because people may want to use this library for their own messaging, do not make this a required package
+        try:
+            import serial
+        except ImportError:
+            raise ImportError("Need to install pyserial in order to use a serial port.")
+        self.serial = serial.Serial(port=port, baudrate=baudrate, timeout=timeout)
+
+    def write(self, data):
+        self.serial.write(data)
+
+    def read(self):
+        # block for the first byte, then take everything that has arrived
+        return self.serial.read(self.serial.in_waiting or 1)
+
+    def close(self):
+        if self.serial.is_open:
+            self.serial.flush()
+            self.serial.close()
+
+    @property
+    def is_open(self):
+        return self.serial.is_open
+
+
+class SocketTransport(Transport):
+    """
+    Transport over a connected stream socket, e.g. TCP to VESC Tool's TCP bridge. Reads use recv_into with a reusable
+    buffer.
+    """
+    def __init__(self, sock, timeout=0.05, buffer_size=4096):
+        """
+        :param sock: connected socket.
+        :param timeout: longest time in seconds a read blocks.
+        :param buffer_size: maximum number of bytes returned by a read.
+        """
+        self.socket = sock
+        self.socket.settimeout(timeout)
+        self._buffer = bytearray(buffer_size)
+        self._view = memoryview(self._buffer)
+        self._is_open = True
+
+    @classmethod
+    def connect(cls, host, port, timeout=0.05, buffer_size=4096):
+        """
+        Opens a TCP connection.
+        :param host: host name or address.
+        :param port: TCP port.
+        :param timeout: longest time in seconds a read blocks.
+        :param buffer_size: maximum number of bytes returned by a read.
+        :return: SocketTransport
+        """
+        sock = socket.create_connection((host, port))
+        # packets are small and latency matters more than throughput
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        return cls(sock, timeout=timeout, buffer_size=buffer_size)
+
+    def write(self, data):
+        self.socket.sendall(data)
+
+    def read(self):
+        try:
+            received = self.socket.recv_into(self._buffer)
+        except socket.timeout:
+            return b''
+        if received == 0:
+            raise ConnectionError("Connection closed by peer.")
+        return self._view[:received]
+
+    def close(self):
+        if self._is_open:
+            self._is_open = False
+            self.socket.close()
+
+    @property
+    def is_open(self):
+        return self._is_open
+
+
+class UDPTransport(SocketTransport):
+    """
+    Transport over UDP. Each write is sent as one datagram and each read returns one datagram.
+    """
+    @classmethod
+    def connect(cls, host, port, timeout=0.05, buffer_size=4096, local_port=0):
+        """
+        :param host: host name or address of the VESC bridge.
+        :param port: UDP port of the VESC bridge.
+        :param timeout: longest time in seconds a read blocks.
+        :param buffer_size: maximum datagram size.
+        :param local_port: local UDP port to receive replies on, 0 picks a free port.
+        :return: UDPTransport
+        """
+        address = socket.getaddrinfo(host, port, type=socket.SOCK_DGRAM)[0]
+        sock = socket.socket(address[0], socket.SOCK_DGRAM)
+        sock.bind(('', local_port))
+        sock.connect(address[4])
+        return cls(sock, timeout=timeout, buffer_size=buffer_size)
+
+    def write(self, data):
+        self.socket.send(data)
+
+    def read(self):
+        try:
+            received = self.socket.recv_into(self._buffer)
+        except socket.timeout:
+            return b''
+        return self._view[:received]
+
+
+class PipeTransport(Transport):
+    """
+    In-memory transport, one end of a pipe created by PipeTransport.pair(). Useful for tests and simulators.
+    """
+    def __init__(self, timeout=0.05):
+        """
+        :param timeout: longest time in seconds a read blocks.
+        """
+        self.timeout = timeout
+        self.peer = None
+        self._received = bytearray()
+        self._condition = threading.Condition()
+        self._is_open = True
+
+    @classmethod
+    def pair(cls, timeout=0.05):
+        """
+        Creates two connected ends of a pipe. Data written to one end is read from the other.
+        :param timeout: longest time in seconds a read blocks.
+        :return: tuple of two PipeTransport
+        """
+        a = cls(timeout=timeout)
+        b = cls(timeout=timeout)
+        a.peer = b
+        b.peer = a
+        return a, b
+
+    def _deliver(self, data):
+        with self._condition:
+            self._received += data
+            self._condition.notify()
+
+    def write(self, data):
+        if not self._is_open or not self.peer.is_open:
+            raise ConnectionError("Pipe is closed.")
+        self.peer._deliver(data)
+
+    def read(self):
+        with self._condition:
+            if not self._received:
+                if not self.peer.is_open:
+                    raise ConnectionError("Pipe closed by peer.")
+                self._condition.wait(self.timeout)
+            data = bytes(self._received)
+            del self._received[:]
+        return data
+
+    def close(self):
+        self._is_open = False
+        # wake up a reader blocked on the other end
+        with self.peer._condition:
+            self.peer._condition.notify_all()
+
+    @property
+    def is_open(self):
+        return self._is_open
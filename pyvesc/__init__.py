@@ -2,5 +2,19 @@ import sys
 if sys.version_info < (3, 3):
     raise SystemExit("Invalid Python version. PyVESC requires Python 3.3 or greater.")
 
-from pyvesc.protocol import *
-from pyvesc.VESC import *
+from pyvesc._lazy import lazy_module
+
+# names are imported from pyvesc.protocol and pyvesc.VESC on first use
+lazy_module(__name__, dict(
+    [(name, ('pyvesc.protocol', name)) for name in (
+        'decode', 'decode_batch', 'encode', 'encode_request', 'encode_many', 'VESCMessage', 'CommandTemplate',
+        'CodecMetrics', 'LatencyHistogram', 'Metrics', 'Stateful', 'Stateless', 'UnpackerBase', 'PackerBase', 'frame',
+        'unframe', 'FrameBuffer', 'crc16', 'Header', 'Footer', 'CorruptPacket', 'InvalidChecksum', 'InvalidPayload',
+        'base', 'interface', 'metrics', 'packet', 'template', 'codec', 'crc', 'exceptions', 'structure')] +
+    [(name, ('pyvesc.VESC', name)) for name in (
+        'VESC', 'AsyncVESC', 'CanBus', 'Transport', 'SerialTransport', 'SocketTransport', 'UDPTransport',
+        'PipeTransport', 'RingBuffer', 'Subscription', 'TelemetryStream', 'TrajectoryPlayer', 'Heartbeat',
+        'HeartbeatScheduler', 'OutgoingQueue', 'Dispatcher', 'dispatch', 'heartbeat', 'messages', 'outgoing', 'player',
+        'stream', 'transport')] +
+    [('protocol', ('pyvesc.protocol', None)), ('tools', ('pyvesc.tools', None))]
+))
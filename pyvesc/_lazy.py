@@ -0,0 +1,46 @@
+"""
+Lazy attributes of the pyvesc packages, so that importing pyvesc only loads the modules that are actually used.
+"""
+import importlib
+import sys
+import types
+
+
+class LazyModule(types.ModuleType):
+    """
+    Module whose public names are imported from their defining modules on first access and then cached in the module.
+
+    Some names are shared by a class and the submodule defining it (e.g. pyvesc.VESC.VESC). Importing such a submodule
+    assigns it to the package, which would hide the class, so these assignments are ignored.
+    """
+    def __getattr__(self, name):
+        try:
+            module_name, attribute = self.__dict__['_lazy_names'][name]
+        except KeyError:
+            raise AttributeError("module %r has no attribute %r" % (self.__name__, name)) from None
+        value = importlib.import_module(module_name)
+        if attribute is not None:
+            value = getattr(value, attribute)
+        types.ModuleType.__setattr__(self, name, value)
+        return value
+
+    def __setattr__(self, name, value):
+        target = self.__dict__.get('_lazy_names', {}).get(name)
+        if target is not None and target[1] is not None and isinstance(value, types.ModuleType):
+            return
+        types.ModuleType.__setattr__(self, name, value)
+
+    def __dir__(self):
+        return sorted(set(self.__dict__) | set(self.__dict__['_lazy_names']))
+
+
+def lazy_module(module_name, names):
+    """
+    Makes the public names of a package lazy. The names are also listed in __all__ so star imports still load them.
+    :param module_name: __name__ of the package
+    :param names: dict mapping each name to (module name, attribute name), or to (module name, None) for a module
+    """
+    module = sys.modules[module_name]
+    module._lazy_names = names
+    module.__all__ = list(names)
+    module.__class__ = LazyModule
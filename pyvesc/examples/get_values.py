@@ -1,5 +1,6 @@
 import pyvesc
 from pyvesc.VESC.messages import GetValues, SetRPM, SetCurrent, SetRotorPositionMode, GetRotorPosition
+import queue
 import serial
 import time
 
@@ -27,18 +28,10 @@ def get_values_example():
                     (response, consumed) = pyvesc.decode(ser.read(61))
 
                     # Print out the values
-                    try:
+                    # the rotor position is pushed by the VESC too, see rotor_position_example
+                    if isinstance(response, GetValues):
                         print(response.rpm)
 
-                    except:
-                        # ToDo: Figure out how to isolate rotor position and other sensor data
-                        #       in the incoming datastream
-                        #try:
-                        #    print(response.rotor_pos)
-                        #except:
-                        #    pass
-                        pass
-
                 time.sleep(0.1)
 
         except KeyboardInterrupt:
@@ -46,5 +39,23 @@ def get_values_example():
             ser.write(pyvesc.encode(SetCurrent(0)))
 
 
+
+def rotor_position_example():
+    # VESC separates the rotor position pushes from the replies to requests
+    with pyvesc.VESC(serial_port=serialport) as motor:
+        positions = queue.Queue()
+        motor.subscribe(GetRotorPosition, positions)
+        motor.write(pyvesc.encode(SetRotorPositionMode(SetRotorPositionMode.DISP_POS_MODE_ENCODER)))
+        try:
+            while True:
+                motor.set_rpm(10000)
+                print(motor.get_measurements().rpm)
+                while not positions.empty():
+                    print(positions.get().rotor_pos)
+                time.sleep(0.1)
+        except KeyboardInterrupt:
+            motor.set_current(0)
+
+
 if __name__ == "__main__":
     get_values_example()
@@ -0,0 +1,268 @@
+"""
+Compact binary log of timestamped VESC traffic.
+
+A log file starts with a file header and is followed by chunks of records. Each chunk starts with a header holding
+the number of records, their size in bytes and the timestamps of the first and last record, so a reader can index a
+log by hopping from chunk header to chunk header without touching the records. Each record is a timestamp, a length,
+a kind (a raw frame as read from the link, or the payload of a message) and the bytes.
+
+Logs are append-only: LogWriter adds chunks to the end of an existing log, and a chunk cut short by a crash is
+ignored by LogReader. Timestamps must not decrease, which is what makes seeking by time a bisection.
+"""
+from pyvesc.protocol.base import VESCMessage
+from pyvesc.protocol.packet.codec import Stateful
+import bisect
+import mmap
+import os
+import struct
+import time
+
+
+RECORD_FRAME = 0
+RECORD_PAYLOAD = 1
+
+_file_magic = b'PYVESCLG'
+_file_version = 1
+_file_header_struct = struct.Struct('<8sH')
+_chunk_magic = b'CHNK'
+_chunk_header_struct = struct.Struct('<4sIIdd')
+_record_header_struct = struct.Struct('<dIB')
+
+
+class LogFormatError(Exception):
+    """
+    The file is not a log, or was written by an unsupported version.
+    """
+    pass
+
+
+class LogWriter(object):
+    """
+    Appends timestamped records to a log. Records are collected in memory and written a chunk at a time.
+    """
+    def __init__(self, path, chunk_size=1 << 20):
+        """
+        :param path: path of the log, created if it does not exist
+        :param chunk_size: number of record bytes after which a chunk is written
+        """
+        self.chunk_size = chunk_size
+        self._last = None
+        if os.path.exists(path) and os.path.getsize(path):
+            with LogReader(path) as reader:
+                end = reader._end
+                self._last = reader.end_time
+            # drop a chunk cut short by a crash, records appended after it could not be read
+            os.truncate(path, end)
+            self._file = open(path, 'ab')
+        else:
+            self._file = open(path, 'ab')
+            self._file.write(_file_header_struct.pack(_file_magic, _file_version))
+        self._chunk = bytearray()
+        self._count = 0
+        self._first = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def _append(self, kind, data, timestamp):
+        if timestamp is None:
+            # the wall clock may step backwards, e.g. when synced by NTP, which must not fail a recording
+            timestamp = time.time()
+            if self._last is not None and timestamp < self._last:
+                timestamp = self._last
+        elif self._last is not None and timestamp < self._last:
+            raise ValueError("Timestamps of a log must not decrease (%f after %f)." % (timestamp, self._last))
+        if self._first is None:
+            self._first = timestamp
+        self._last = timestamp
+        self._chunk += _record_header_struct.pack(timestamp, len(data), kind)
+        self._chunk += data
+        self._count += 1
+        if len(self._chunk) >= self.chunk_size:
+            self.flush()
+
+    def write_frame(self, data, timestamp=None):
+        """
+        :param data: raw bytes as read from the link, e.g. one or more packets
+        :param timestamp: time of the record in seconds, defaults to time.time(), or to the time of the previous
+                          record if the clock stepped back. A given timestamp before the previous record raises
+                          ValueError.
+        """
+        self._append(RECORD_FRAME, data, timestamp)
+
+    def write_message(self, msg, timestamp=None):
+        """
+        :param msg: message to record, e.g. a decoded GetValues reply. Only its payload is stored.
+        :param timestamp: time of the record in seconds, defaults to time.time(), or to the time of the previous
+                          record if the clock stepped back. A given timestamp before the previous record raises
+                          ValueError.
+        """
+        self._append(RECORD_PAYLOAD, VESCMessage.pack(msg), timestamp)
+
+    def flush(self):
+        """
+        Writes the collected records as a chunk.
+        """
+        if self._count:
+            self._file.write(_chunk_header_struct.pack(_chunk_magic, self._count, len(self._chunk), self._first,
+                                                       self._last))
+            self._file.write(self._chunk)
+            self._chunk = bytearray()
+            self._count = 0
+            self._first = None
+        self._file.flush()
+
+    def close(self):
+        if not self._file.closed:
+            self.flush()
+            self._file.close()
+
+
+def _check_file_header(data):
+    if len(data) < _file_header_struct.size:
+        raise LogFormatError("File is too short to be a log.")
+    magic, version = _file_header_struct.unpack_from(data, 0)
+    if magic != _file_magic:
+        raise LogFormatError("File is not a log.")
+    if version != _file_version:
+        raise LogFormatError("Unsupported log version %u." % version)
+
+
+class LogReader(object):
+    """
+    Reads a log through mmap. Opening only reads the chunk headers, and records are returned as memoryviews of the
+    mapped file, so only the part of the log that is asked for is read and decoded. The memoryviews are valid until the
+    reader is closed.
+    """
+    def __init__(self, path):
+        """
+        :param path: path of the log
+        """
+        self._file = open(path, 'rb')
+        try:
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # empty file
+            self._file.close()
+            raise LogFormatError("File is too short to be a log.")
+        self._view = memoryview(self._mmap)
+        try:
+            _check_file_header(self._view)
+        except LogFormatError:
+            self.close()
+            raise
+        # offsets of the first record of each chunk, and the chunks' record bytes, counts and first and last times
+        self._offsets = []
+        self._sizes = []
+        self._counts = []
+        self._firsts = []
+        self._lasts = []
+        # end of the last complete chunk, where a writer appends
+        self._end = _file_header_struct.size
+        end = len(self._view)
+        while self._end + _chunk_header_struct.size <= end:
+            magic, count, size, first, last = _chunk_header_struct.unpack_from(self._view, self._end)
+            offset = self._end + _chunk_header_struct.size
+            if magic != _chunk_magic or offset + size > end:
+                # chunk cut short while it was written
+                break
+            self._offsets.append(offset)
+            self._sizes.append(size)
+            self._counts.append(count)
+            self._firsts.append(first)
+            self._lasts.append(last)
+            self._end = offset + size
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def __len__(self):
+        return sum(self._counts)
+
+    def __iter__(self):
+        return self.records()
+
+    @property
+    def start_time(self):
+        """
+        Timestamp of the first record, None if the log is empty.
+        """
+        return self._firsts[0] if self._firsts else None
+
+    @property
+    def end_time(self):
+        """
+        Timestamp of the last record, None if the log is empty.
+        """
+        return self._lasts[-1] if self._lasts else None
+
+    def records(self, start=None, end=None):
+        """
+        Iterates over the records with start <= timestamp < end. Chunks before start are skipped using the index.
+        :param start: time in seconds of the first record, defaults to the beginning of the log
+        :param end: time in seconds after the last record, defaults to the end of the log
+        :return: iterator of (timestamp, kind, data) tuples, where kind is RECORD_FRAME or RECORD_PAYLOAD and data is a
+                 memoryview of the mapped file
+        """
+        chunk = 0 if start is None else bisect.bisect_left(self._lasts, start)
+        view = self._view
+        unpack_header = _record_header_struct.unpack_from
+        header_size = _record_header_struct.size
+        for chunk in range(chunk, len(self._offsets)):
+            if end is not None and self._firsts[chunk] >= end:
+                return
+            offset = self._offsets[chunk]
+            chunk_end = offset + self._sizes[chunk]
+            while offset < chunk_end:
+                timestamp, length, kind = unpack_header(view, offset)
+                offset += header_size
+                if end is not None and timestamp >= end:
+                    return
+                if start is None or timestamp >= start:
+                    yield timestamp, kind, view[offset:offset + length]
+                offset += length
+
+    def messages(self, start=None, end=None):
+        """
+        Iterates over the decoded messages with start <= timestamp < end. Frame records are fed to a single Stateful
+        unpacker, so packets split over several reads are reassembled and get the timestamp of the record completing
+        them. Unknown or corrupt messages are skipped.
+        :param start: time in seconds of the first record, defaults to the beginning of the log
+        :param end: time in seconds after the last record, defaults to the end of the log
+        :return: iterator of (timestamp, message) tuples
+        """
+        unpacker = Stateful()
+        for timestamp, kind, data in self.records(start, end):
+            if kind == RECORD_FRAME:
+                for payload in unpacker.feed(data):
+                    msg = _unpack(payload)
+                    if msg is not None:
+                        yield timestamp, msg
+            else:
+                msg = _unpack(data)
+                if msg is not None:
+                    yield timestamp, msg
+
+    def close(self):
+        if self._mmap.closed:
+            return
+        self._view.release()
+        try:
+            self._mmap.close()
+        except BufferError:
+            # memoryviews of records are still alive, the mapping is closed when they are collected
+            pass
+        self._file.close()
+
+
+def _unpack(payload):
+    try:
+        return VESCMessage.unpack(payload)
+    except (KeyError, IndexError, struct.error, UnicodeDecodeError):
+        return None
@@ -1,3 +1,36 @@
-from .interface import *
-from .packet import *
-from .base import *
+from pyvesc._lazy import lazy_module
+
+lazy_module(__name__, {
+    'decode': ('pyvesc.protocol.interface', 'decode'),
+    'decode_batch': ('pyvesc.protocol.interface', 'decode_batch'),
+    'encode': ('pyvesc.protocol.interface', 'encode'),
+    'encode_request': ('pyvesc.protocol.interface', 'encode_request'),
+    'encode_many': ('pyvesc.protocol.interface', 'encode_many'),
+    'VESCMessage': ('pyvesc.protocol.base', 'VESCMessage'),
+    'CommandTemplate': ('pyvesc.protocol.template', 'CommandTemplate'),
+    'CodecMetrics': ('pyvesc.protocol.metrics', 'CodecMetrics'),
+    'LatencyHistogram': ('pyvesc.protocol.metrics', 'LatencyHistogram'),
+    'Metrics': ('pyvesc.protocol.metrics', 'Metrics'),
+    'Stateful': ('pyvesc.protocol.packet.codec', 'Stateful'),
+    'Stateless': ('pyvesc.protocol.packet.codec', 'Stateless'),
+    'UnpackerBase': ('pyvesc.protocol.packet.codec', 'UnpackerBase'),
+    'PackerBase': ('pyvesc.protocol.packet.codec', 'PackerBase'),
+    'frame': ('pyvesc.protocol.packet.codec', 'frame'),
+    'unframe': ('pyvesc.protocol.packet.codec', 'unframe'),
+    'FrameBuffer': ('pyvesc.protocol.packet.codec', 'FrameBuffer'),
+    'crc16': ('pyvesc.protocol.packet.crc', 'crc16'),
+    'Header': ('pyvesc.protocol.packet.structure', 'Header'),
+    'Footer': ('pyvesc.protocol.packet.structure', 'Footer'),
+    'CorruptPacket': ('pyvesc.protocol.packet.exceptions', 'CorruptPacket'),
+    'InvalidChecksum': ('pyvesc.protocol.packet.exceptions', 'InvalidChecksum'),
+    'InvalidPayload': ('pyvesc.protocol.packet.exceptions', 'InvalidPayload'),
+    'base': ('pyvesc.protocol.base', None),
+    'interface': ('pyvesc.protocol.interface', None),
+    'metrics': ('pyvesc.protocol.metrics', None),
+    'packet': ('pyvesc.protocol.packet', None),
+    'template': ('pyvesc.protocol.template', None),
+    'codec': ('pyvesc.protocol.packet.codec', None),
+    'crc': ('pyvesc.protocol.packet.crc', None),
+    'exceptions': ('pyvesc.protocol.packet.exceptions', None),
+    'structure': ('pyvesc.protocol.packet.structure', None),
+})
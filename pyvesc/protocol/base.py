@@ -1,6 +1,34 @@
 import struct
 
 
+def _field_property(idx):
+    """
+    Creates the property used to access a message field. Field values are stored together in the _values tuple of the
+    message instance.
+    :param idx: index of the field.
+    :return: property object.
+    """
+    def fget(instance):
+        return instance._values[idx]
+
+    def fset(instance, value):
+        try:
+            values = list(instance._values)
+        except AttributeError:
+            values = [None] * len(instance.fields)
+        values[idx] = value
+        instance._values = tuple(values)
+    return property(fget, fset)
+
+
+def _as_tuple(instance):
+    """
+    Field values of the message, in the order of its fields. The tuple is the message's own storage, so no copy is made.
+    :return: tuple of field values.
+    """
+    return instance._values
+
+
 class VESCMessage(type):
     """ Metaclass for VESC messages.
 
@@ -9,131 +37,203 @@ class VESCMessage(type):
     fields: list of tuples. tuples are of size 2, first element is the field name, second element is the fields type
             the third optional element is a scalar that will be applied to the data upon unpack
     format character. For more info on struct format characters see: https://docs.python.org/2/library/struct.html
+
+    Message instances have no __dict__. The field values of an instance are stored in a single tuple, which is returned
+    by as_tuple() without copying, and the fields are accessed through properties generated from fields.
+
+    Messages whose layout depends on their payload (e.g. the selective getters) define a classmethod
+    _layout_for_payload(payload) returning the message class to unpack the payload with. Such layout classes are
+    created with register=False so they do not take over the message id in the registry.
+
+    The messages of pyvesc.VESC.messages register when that module is imported, which msg_type does on the first
+    lookup of an unregistered id.
     """
     _msg_registry = {}
+    _builtin_messages_loaded = False
     _endian_fmt = '!'
     _id_fmt = 'B'
     _can_id_fmt = 'BB'
     _comm_forward_can = 34
     _entry_msg_registry = None
+    _header_struct = struct.Struct(_endian_fmt + _id_fmt)
+    _can_header_struct = struct.Struct(_endian_fmt + _can_id_fmt + _id_fmt)
 
-    def __init__(cls, name, bases, clsdict):
-        cls.can_id = None
+    def __new__(mcs, name, bases, clsdict, register=True):
+        clsdict['__slots__'] = ('can_id', '_values')
+        clsdict.setdefault('as_tuple', _as_tuple)
+        return super(VESCMessage, mcs).__new__(mcs, name, bases, clsdict)
+
+    def __init__(cls, name, bases, clsdict, register=True):
         msg_id = clsdict['id']
         # make sure that message classes are final
         for klass in bases:
             if isinstance(klass, VESCMessage):
                 raise TypeError("VESC messages cannot be inherited.")
         # check for duplicate id
-        if msg_id in VESCMessage._msg_registry:
-            raise TypeError("ID conflict with %s" % str(VESCMessage._msg_registry[msg_id]))
-        else:
+        if register:
+            if msg_id in VESCMessage._msg_registry:
+                raise TypeError("ID conflict with %s" % str(VESCMessage._msg_registry[msg_id]))
             VESCMessage._msg_registry[msg_id] = cls
-        # initialize cls static variables
-        cls._string_field = None
-        cls._fmt_fields = ''
-        cls._field_names = []
-        cls._field_scalars = []
-        for field, idx in zip(cls.fields, range(0, len(cls.fields))):
-            cls._field_names.append(field[0])
-            if len(field) >= 3:
-                cls._field_scalars.append(field[2])
-            if field[1] is 's':
-                # string field, add % so we can vary the length
-                cls._fmt_fields += '%u'
-                cls._string_field = idx
-            cls._fmt_fields += field[1]
-        cls._full_msg_size = struct.calcsize(cls._fmt_fields)
-        # check that at most 1 field is a string
-        string_field_count = cls._fmt_fields.count('s')
-        if string_field_count > 1:
-            raise TypeError("Max number of string fields is 1.")
-        if 'p' in cls._fmt_fields:
-            raise TypeError("Field with format character 'p' detected. For string field use 's'.")
+        if not hasattr(cls, '_layout_for_payload'):
+            cls._layout_for_payload = None
+        cls._compile_fields()
         super(VESCMessage, cls).__init__(name, bases, clsdict)
 
+    def __setattr__(cls, name, value):
+        super(VESCMessage, cls).__setattr__(name, value)
+        if name == 'fields':
+            # the message layout changed (e.g. older firmware), recompile the codecs
+            cls._compile_fields()
+
+    @property
+    def can_id(cls):
+        """
+        Message classes are never forwarded over CAN, only message instances can have a CAN ID.
+        """
+        return None
+
+    def _compile_fields(cls):
+        """
+        Compile the struct objects, scalars and string field info for the message class. This is done once per class
+        so packing and unpacking do not need to rebuild format strings.
+        """
+        string_field = None
+        fmt_fields = ''
+        field_names = []
+        field_scalars = []
+        for idx, field in enumerate(cls.fields):
+            field_names.append(field[0])
+            field_scalars.append(field[2] if len(field) >= 3 else 0)
+            if field[1] == 's':
+                if string_field is not None:
+                    raise TypeError("Max number of string fields is 1.")
+                # string field, add % so we can vary the length
+                fmt_fields += '%u'
+                string_field = idx
+            elif 'p' in field[1]:
+                raise TypeError("Field with format character 'p' detected. For string field use 's'.")
+            fmt_fields += field[1]
+        # replace the field properties of the previous layout
+        for field_name in cls.__dict__.get('_field_names', []):
+            if isinstance(cls.__dict__.get(field_name), property):
+                delattr(cls, field_name)
+        for idx, field_name in enumerate(field_names):
+            setattr(cls, field_name, _field_property(idx))
+        # initialize cls static variables
+        cls._string_field = string_field
+        cls._fmt_fields = fmt_fields
+        cls._field_names = field_names
+        cls._field_scalars = tuple(field_scalars)
+        cls._scaled_fields = tuple((idx, scalar) for idx, scalar in enumerate(field_scalars) if scalar)
+        header_fmt = VESCMessage._endian_fmt + VESCMessage._id_fmt
+        can_header_fmt = VESCMessage._endian_fmt + VESCMessage._can_id_fmt + VESCMessage._id_fmt
+        cls._header_bytes = VESCMessage._header_struct.pack(cls.id)
+        if string_field is None:
+            cls._struct = struct.Struct(header_fmt + fmt_fields)
+            cls._can_struct = struct.Struct(can_header_fmt + fmt_fields)
+            cls._full_msg_size = cls._struct.size - VESCMessage._header_struct.size
+        else:
+            # the fields before and after the string are packed separately so the string length can vary
+            prefix_fmt = ''.join(field[1] for field in cls.fields[:string_field])
+            suffix_fmt = ''.join(field[1] for field in cls.fields[string_field + 1:])
+            cls._struct = struct.Struct(header_fmt + prefix_fmt)
+            cls._can_struct = struct.Struct(can_header_fmt + prefix_fmt)
+            cls._suffix_struct = struct.Struct(VESCMessage._endian_fmt + suffix_fmt)
+            cls._full_msg_size = cls._struct.size - VESCMessage._header_struct.size + cls._suffix_struct.size
+
     def __call__(cls, *args, **kwargs):
         instance = super(VESCMessage, cls).__call__()
         if 'can_id' in kwargs:
             instance.can_id = kwargs['can_id']
         else:
             instance.can_id = None
-        if args:
+        if args or not cls.fields:
             if len(args) != len(cls.fields):
                 raise AttributeError("Expected %u arguments, received %u" % (len(cls.fields), len(args)))
-            for name, value in zip(cls._field_names, args):
-                setattr(instance, name, value)
+            instance._values = args
+        return instance
+
+    def _from_values(cls, values):
+        """
+        Creates a message from already validated field values, skipping the checks done by __call__.
+        :param values: sequence of field values in the order of cls.fields.
+        :return: message instance.
+        """
+        instance = cls.__new__(cls)
+        instance.can_id = None
+        instance._values = tuple(values)
         return instance
 
     @staticmethod
     def msg_type(id):
+        try:
+            return VESCMessage._msg_registry[id]
+        except KeyError:
+            if VESCMessage._builtin_messages_loaded:
+                raise
+        # the messages that come with pyvesc register when they are first needed
+        VESCMessage._builtin_messages_loaded = True
+        import pyvesc.VESC.messages
         return VESCMessage._msg_registry[id]
 
     @staticmethod
     def unpack(msg_bytes):
-        msg_id = struct.unpack_from(VESCMessage._endian_fmt + VESCMessage._id_fmt, msg_bytes, 0)
-        msg_type = VESCMessage.msg_type(*msg_id)
-        data = None
-        if not (msg_type._string_field is None):
-            # string field
-            fmt_wo_string = msg_type._fmt_fields.replace('%u', '')
-            fmt_wo_string = fmt_wo_string.replace('s', '')
-            len_string = len(msg_bytes) - struct.calcsize(VESCMessage._endian_fmt + fmt_wo_string) - 1
-            fmt_w_string = msg_type._fmt_fields % (len_string)
-            data = struct.unpack_from(VESCMessage._endian_fmt + fmt_w_string, msg_bytes, 1)
-        else:
-            data = list(struct.unpack_from(VESCMessage._endian_fmt + msg_type._fmt_fields, msg_bytes, 1))
-            for k, field in enumerate(data):
-                try:
-                    if msg_type._field_scalars[k] != 0:
-                        data[k] = data[k]/msg_type._field_scalars[k]
-                except (TypeError, IndexError) as e:
-                    print("Error ecountered on field " + msg_type.fields[k][0])
-                    print(e)
-        msg = msg_type(*data)
-        if not (msg_type._string_field is None):
-            string_field_name = msg_type._field_names[msg_type._string_field]
-            setattr(msg,
-                    string_field_name,
-                    getattr(msg, string_field_name).decode('ascii'))
-        return msg
+        msg_type = VESCMessage.msg_type(msg_bytes[0])
+        if msg_type._layout_for_payload is not None:
+            msg_type = msg_type._layout_for_payload(msg_bytes)
+        if msg_type._string_field is None:
+            data = msg_type._struct.unpack_from(msg_bytes, 0)[1:]
+            if msg_type._scaled_fields:
+                data = list(data)
+                for idx, scalar in msg_type._scaled_fields:
+                    data[idx] = data[idx] / scalar
+            return msg_type._from_values(data)
+        # string field
+        string_start = msg_type._struct.size
+        string_end = len(msg_bytes) - msg_type._suffix_struct.size
+        data = msg_type._struct.unpack_from(msg_bytes, 0)[1:]\
+            + (bytes(msg_bytes[string_start:string_end]).decode('ascii'),)\
+            + msg_type._suffix_struct.unpack_from(msg_bytes, string_end)
+        return msg_type(*data)
+
+    @staticmethod
+    def _field_values(instance):
+        """
+        Gets the field values of a message with the scalars applied.
+        :param instance: message instance.
+        :return: sequence of field values ready to be packed.
+        """
+        field_values = instance._values
+        if instance._scaled_fields:
+            field_values = list(field_values)
+            for idx, scalar in instance._scaled_fields:
+                field_values[idx] = int(field_values[idx] * scalar)
+        return field_values
 
     @staticmethod
     def pack(instance, header_only=None):
         if header_only:
             if instance.can_id is not None:
-                fmt = VESCMessage._endian_fmt + VESCMessage._can_id_fmt + VESCMessage._id_fmt
-                values = (VESCMessage._comm_forward_can, instance.can_id, instance.id)
+                return VESCMessage._can_header_struct.pack(VESCMessage._comm_forward_can, instance.can_id, instance.id)
             else:
-                fmt = VESCMessage._endian_fmt + VESCMessage._id_fmt
-                values = (instance.id,)
-            return struct.pack(fmt, *values)
-
-        field_values = []
-        if not instance._field_scalars:
-            for field_name in instance._field_names:
-                field_values.append(getattr(instance, field_name))
-        else:
-            for field_name, field_scalar in zip(instance._field_names, instance._field_scalars):
-                field_values.append(int(getattr(instance, field_name) * field_scalar))
+                return instance._header_bytes
+
+        field_values = VESCMessage._field_values(instance)
         if not (instance._string_field is None):
             # string field
-            string_field_name = instance._field_names[instance._string_field]
-            string_length = len(getattr(instance, string_field_name))
-            field_values[instance._string_field] = field_values[instance._string_field].encode('ascii')
-            values = ((instance.id,) + tuple(field_values))
+            string_field = instance._string_field
+            prefix_values = field_values[:string_field]
+            suffix = instance._suffix_struct.pack(*field_values[string_field + 1:])
+            string = field_values[string_field].encode('ascii')
             if instance.can_id is not None:
-                fmt = VESCMessage._endian_fmt + VESCMessage._can_id_fmt + VESCMessage._id_fmt\
-                      + (instance._fmt_fields % (string_length))
-                values = (VESCMessage._comm_forward_can, instance.can_id) + values
+                prefix = instance._can_struct.pack(VESCMessage._comm_forward_can, instance.can_id, instance.id,
+                                                   *prefix_values)
             else:
-                fmt = VESCMessage._endian_fmt + VESCMessage._id_fmt + (instance._fmt_fields % (string_length))
-            return struct.pack(fmt, *values)
+                prefix = instance._struct.pack(instance.id, *prefix_values)
+            return prefix + string + suffix
         else:
-            values = ((instance.id,) + tuple(field_values))
             if instance.can_id is not None:
-                fmt = VESCMessage._endian_fmt + VESCMessage._can_id_fmt + VESCMessage._id_fmt + instance._fmt_fields
-                values = (VESCMessage._comm_forward_can, instance.can_id) + values
+                return instance._can_struct.pack(VESCMessage._comm_forward_can, instance.can_id, instance.id,
+                                                 *field_values)
             else:
-                fmt = VESCMessage._endian_fmt + VESCMessage._id_fmt + instance._fmt_fields
-            return struct.pack(fmt, *values)
+                return instance._struct.pack(instance.id, *field_values)
@@ -1,19 +1,29 @@
 import pyvesc.protocol.base
 import pyvesc.protocol.packet.codec
+import pyvesc.protocol.packet.crc
+import pyvesc.protocol.packet.structure
+import pyvesc.protocol.template
+import array
+import struct
 
 
-def decode(buffer):
+def decode(buffer, offset=0):
     """
     Decodes the next valid VESC message in a buffer.
 
-    :param buffer: The buffer to attempt to parse from.
-    :type buffer: bytes
+    :param buffer: The buffer to attempt to parse from. The message is decoded
+                   straight from a memoryview without copying the payload.
+    :type buffer: bytes-like object
 
-    :return: PyVESC message, number of bytes consumed in the buffer. If nothing
-             was parsed returns (None, 0).
+    :param offset: Index in the buffer to start parsing at. Advancing the
+                   offset by the consumed bytes avoids slicing the buffer.
+    :type offset: int
+
+    :return: PyVESC message, number of bytes consumed in the buffer, counted
+             from offset. If nothing was parsed returns (None, consumed).
     :rtype: `tuple`: (PyVESC message, int)
     """
-    msg_payload, consumed = pyvesc.protocol.packet.codec.unframe(buffer)
+    msg_payload, consumed = pyvesc.protocol.packet.codec.unframe(buffer, offset=offset)
     if msg_payload:
         return pyvesc.protocol.base.VESCMessage.unpack(msg_payload), consumed
     else:
@@ -51,3 +61,195 @@ def encode_request(msg_cls):
     msg_payload = pyvesc.protocol.base.VESCMessage.pack(msg_cls, header_only=True)
     packet = pyvesc.protocol.packet.codec.frame(msg_payload)
     return packet
+
+
+# struct format characters (standard sizes) and their numpy equivalents, used for batch decoding
+_numpy_types = {
+    'c': 'S1', 'b': 'i1', 'B': 'u1', '?': '?',
+    'h': 'i2', 'H': 'u2', 'i': 'i4', 'I': 'u4', 'l': 'i4', 'L': 'u4', 'q': 'i8', 'Q': 'u8',
+    'e': 'f2', 'f': 'f4', 'd': 'f8',
+}
+
+
+def _import_numpy():
+    # numpy is only needed for batch decoding, so do not make it a required package
+    try:
+        import numpy
+    except ImportError:
+        raise ImportError("Need to install numpy in order to decode batches of messages.")
+    return numpy
+
+
+def _numpy_dtypes(msg_cls):
+    """
+    Builds the numpy dtypes of a message type.
+    :param msg_cls: PyVESC message type without a string field.
+    :return: (1) dtype of the payload as sent over the wire (big-endian, including the message id), (2) dtype of the
+             decoded messages, scaled fields are float64.
+    """
+    if msg_cls._string_field is not None:
+        raise TypeError("Messages with a string field cannot be batch decoded.")
+    wire_fields = [('id', 'u1')]
+    decoded_fields = []
+    for field, scalar in zip(msg_cls.fields, msg_cls._field_scalars):
+        numpy_type = _numpy_types.get(field[1])
+        if numpy_type is None:
+            raise TypeError("Format character %r of field %s cannot be batch decoded." % (field[1], field[0]))
+        wire_fields.append((field[0], '>' + numpy_type))
+        decoded_fields.append((field[0], 'f8' if scalar else numpy_type))
+    return wire_fields, decoded_fields
+
+
+def _decode_payloads(msg_cls, payloads):
+    """
+    Unpacks payloads of one message type into columns, with the field scalars applied to whole columns at once.
+    :param msg_cls: PyVESC message type without a string field.
+    :param payloads: list of payloads of msg_cls, all of the size of its wire dtype.
+    :return: structured array with one record per payload and one named column per field.
+    """
+    numpy = _import_numpy()
+    wire_fields, decoded_fields = _numpy_dtypes(msg_cls)
+    wire = numpy.frombuffer(b''.join(payloads), dtype=numpy.dtype(wire_fields))
+    decoded = numpy.empty(len(wire), dtype=decoded_fields)
+    for field_name, scalar in zip(msg_cls._field_names, msg_cls._field_scalars):
+        if scalar:
+            numpy.divide(wire[field_name], scalar, out=decoded[field_name])
+        else:
+            decoded[field_name] = wire[field_name]
+    return decoded
+
+
+def decode_batch(buffer, msg_cls, as_dict=False, chunk_size=1 << 20):
+    """
+    Decodes every valid message of one type in a buffer, e.g. a recorded stream of GetValues replies. The buffer is
+    scanned once and the messages are unpacked into columns, with the field scalars applied to whole columns at once.
+    Packets of other message types are skipped. Requires numpy.
+
+    :param buffer: The buffer to parse, e.g. the contents of a capture file.
+    :type buffer: bytes-like object
+
+    :param msg_cls: The message type to decode.
+    :type msg_cls: PyVESC message type
+
+    :param as_dict: Return a dictionary of columns instead of a structured array.
+    :type as_dict: bool
+
+    :param chunk_size: Number of bytes scanned at a time.
+    :type chunk_size: int
+
+    :return: Structured array with one record per message and one named column per field, or a dictionary mapping the
+             field names to arrays.
+    :rtype: numpy.ndarray or dict
+    """
+    numpy = _import_numpy()
+    payload_size = numpy.dtype(_numpy_dtypes(msg_cls)[0]).itemsize
+    msg_id = msg_cls.id
+    unpacker = pyvesc.protocol.packet.codec.Stateful()
+    payloads = []
+    with memoryview(buffer) as view:
+        for start in range(0, len(view), chunk_size):
+            for payload in unpacker.feed(view[start:start + chunk_size]):
+                if len(payload) == payload_size and payload[0] == msg_id:
+                    payloads.append(payload)
+    for payload in unpacker.finish():
+        if len(payload) == payload_size and payload[0] == msg_id:
+            payloads.append(payload)
+    decoded = _decode_payloads(msg_cls, payloads)
+    if as_dict:
+        return {field_name: decoded[field_name] for field_name in msg_cls._field_names}
+    return decoded
+
+
+def encode_many(msg_cls, values, can_id=None):
+    """
+    Encodes a whole sequence of setter messages at once, e.g. a precomputed
+    current or RPM trajectory. All frames of a message type have the same
+    size, so they are written back to back into one preallocated buffer. With
+    numpy the values are scaled and packed column by column and the CRCs of all
+    frames are computed together, otherwise each frame is patched from a
+    CommandTemplate.
+
+    :param msg_cls: The message type to encode, e.g. SetCurrent. String fields
+                    are not supported.
+    :type msg_cls: PyVESC message type
+
+    :param values: The field values of each message: a sequence (or 1-D array)
+                   of values for messages with a single field, or a sequence of
+                   tuples (or 2-D array) of values in the order of
+                   msg_cls.fields.
+    :type values: sequence or numpy.ndarray
+
+    :param can_id: Optional, CAN ID to forward the messages to.
+    :type can_id: int
+
+    :return: (1) The packets, concatenated, (2) offsets of the packets in the
+             buffer, with a final entry for the end of the buffer so packet i
+             is frames[offsets[i]:offsets[i + 1]].
+    :rtype: `tuple`: (bytearray, array.array)
+    """
+    template = pyvesc.protocol.template.CommandTemplate(msg_cls, can_id=can_id)
+    frame_size = len(template.frame)
+    numeric = all(field[1] in _numpy_types and field[1] not in 'c?' for field in msg_cls.fields)
+    try:
+        import numpy
+    except ImportError:
+        numpy = None
+    if numpy is not None and numeric:
+        frames = _encode_many_numpy(numpy, template, values)
+    else:
+        single_field = len(msg_cls.fields) == 1
+        frames = bytearray()
+        for value in values:
+            frames += template.update(value) if single_field else template.update(*value)
+    offsets = array.array('Q', range(0, len(frames) + 1, frame_size))
+    return frames, offsets
+
+
+def _encode_many_numpy(numpy, template, values):
+    """
+    Vectorized encode_many.
+    :param numpy: the numpy module
+    :param template: CommandTemplate of the message type, holding the constant bytes of the frames
+    :param values: see encode_many
+    :return: bytearray of the frames
+    """
+    msg_cls = template.msg_cls
+    columns = numpy.asarray(values)
+    if columns.ndim == 1 and len(msg_cls.fields) == 1:
+        columns = columns.reshape(-1, 1)
+    if columns.ndim != 2 or columns.shape[1] != len(msg_cls.fields):
+        raise ValueError("Expected %u values per message." % len(msg_cls.fields))
+    count = len(columns)
+    frame_size = len(template.frame)
+    frames = bytearray(count * frame_size)
+    frame_array = numpy.frombuffer(frames, dtype=numpy.uint8).reshape(count, frame_size)
+    # header and payload header are the same for every frame
+    frame_array[:] = numpy.frombuffer(bytes(template.frame), dtype=numpy.uint8)
+    # pack the values big-endian, as struct would
+    wire = numpy.empty(count, dtype=[(field[0], '>' + _numpy_types[field[1]]) for field in msg_cls.fields])
+    for idx, (field, scalar) in enumerate(zip(msg_cls.fields, msg_cls._field_scalars)):
+        column = columns[:, idx]
+        if scalar:
+            # int() truncates toward zero
+            column = numpy.trunc(column * scalar)
+        field_type = wire.dtype[idx]
+        if field_type.kind in 'iu':
+            # NaN and inf would be cast to arbitrary integers. int() raises ValueError for them as well
+            if not numpy.isfinite(column).all():
+                raise ValueError("Values of field %s are not finite." % field[0])
+            limits = numpy.iinfo(field_type)
+            if count and (column.min() < limits.min or column.max() > limits.max):
+                raise struct.error("Values of field %s are out of range for format %r." % (field[0], field[1]))
+        wire[field[0]] = column
+    values_start = template._values_offset
+    values_end = template._footer_offset
+    frame_array[:, values_start:values_end] = wire.view(numpy.uint8).reshape(count, values_end - values_start)
+    # CRC16-XMODEM of every frame at once, one payload byte position at a time
+    table = numpy.array(pyvesc.protocol.packet.crc.CRC16_XMODEM_TABLE, dtype=numpy.uint16)
+    crc = numpy.full(count, template._payload_header_crc, dtype=numpy.uint16)
+    for column in frame_array[:, values_start:values_end].T:
+        crc = (crc << numpy.uint16(8)) ^ table[(crc >> numpy.uint16(8)) ^ column]
+    frame_array[:, values_end] = crc >> numpy.uint16(8)
+    frame_array[:, values_end + 1] = crc & numpy.uint16(0xFF)
+    frame_array[:, values_end + 2] = pyvesc.protocol.packet.structure.Footer.TERMINATOR
+    return frames
@@ -0,0 +1,135 @@
+import bisect
+
+
+class CodecMetrics(object):
+    """
+    Counters of an unpacker. Pass an instance to Stateful or unframe to have them updated; unpackers without one do
+    not count anything.
+    """
+    __slots__ = ('frames', 'bytes', 'corrupt_packets', 'crc_errors', 'resyncs', 'bytes_skipped')
+
+    def __init__(self):
+        #: valid packets unpacked
+        self.frames = 0
+        #: bytes fed to a Stateful unpacker, or consumed by unframe
+        self.bytes = 0
+        #: corrupt packets detected, including crc_errors
+        self.corrupt_packets = 0
+        #: packets with an invalid checksum
+        self.crc_errors = 0
+        #: valid packets found again after a corrupt packet
+        self.resyncs = 0
+        #: bytes dropped while looking for the next valid packet
+        self.bytes_skipped = 0
+
+    def as_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+class LatencyHistogram(object):
+    """
+    Histogram of latencies in seconds with fixed bucket bounds, as used by Prometheus.
+    """
+    #: upper bounds of the buckets in seconds, the last bucket is unbounded
+    default_bounds = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+    __slots__ = ('bounds', 'counts', 'count', 'sum')
+
+    def __init__(self, bounds=default_bounds):
+        """
+        :param bounds: increasing upper bounds of the buckets in seconds
+        """
+        self.bounds = tuple(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, seconds):
+        self.counts[bisect.bisect_left(self.bounds, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+
+    def cumulative(self):
+        """
+        :return: list of (upper bound, number of observations <= upper bound), ending with (inf, count)
+        """
+        total = 0
+        buckets = []
+        for bound, count in zip(self.bounds + (float('inf'),), self.counts):
+            total += count
+            buckets.append((bound, total))
+        return buckets
+
+    def as_dict(self):
+        return {'count': self.count, 'sum': self.sum, 'buckets': self.cumulative()}
+
+
+class Metrics(object):
+    """
+    Opt-in metrics of a VESC connection, e.g. VESC(port, metrics=Metrics()). The codec counters of the reader, the
+    request to reply latency per message id, the request timeouts per message id and the number of received payloads
+    that could not be decoded are recorded.
+
+    The counters are updated without locks, so they are cheap enough to leave on. Export them with as_dict() or
+    prometheus().
+    """
+    def __init__(self, latency_bounds=LatencyHistogram.default_bounds):
+        """
+        :param latency_bounds: upper bounds of the latency histogram buckets in seconds
+        """
+        self.codec = CodecMetrics()
+        self.latency = {}
+        self.timeouts = {}
+        self.decode_errors = 0
+        self._latency_bounds = latency_bounds
+
+    def observe_latency(self, msg_id, seconds):
+        """
+        :param msg_id: id of the reply message
+        :param seconds: time from writing the request to receiving the reply
+        """
+        histogram = self.latency.get(msg_id)
+        if histogram is None:
+            histogram = self.latency[msg_id] = LatencyHistogram(self._latency_bounds)
+        histogram.observe(seconds)
+
+    def count_timeout(self, msg_id):
+        """
+        :param msg_id: id of the reply message that did not arrive in time
+        """
+        self.timeouts[msg_id] = self.timeouts.get(msg_id, 0) + 1
+
+    def as_dict(self):
+        """
+        :return: dict of the codec counters, the latency histograms and timeouts keyed by message id, and the decode
+                 errors
+        """
+        return {
+            'codec': self.codec.as_dict(),
+            'latency': {msg_id: histogram.as_dict() for msg_id, histogram in self.latency.items()},
+            'timeouts': dict(self.timeouts),
+            'decode_errors': self.decode_errors,
+        }
+
+    def prometheus(self, prefix='pyvesc'):
+        """
+        :param prefix: prefix of the metric names
+        :return: the metrics in the Prometheus text exposition format
+        """
+        lines = []
+        for name, value in self.codec.as_dict().items():
+            lines.append('# TYPE %s_%s_total counter' % (prefix, name))
+            lines.append('%s_%s_total %d' % (prefix, name, value))
+        lines.append('# TYPE %s_decode_errors_total counter' % prefix)
+        lines.append('%s_decode_errors_total %d' % (prefix, self.decode_errors))
+        lines.append('# TYPE %s_request_timeouts_total counter' % prefix)
+        for msg_id, count in sorted(self.timeouts.items()):
+            lines.append('%s_request_timeouts_total{msg_id="%u"} %d' % (prefix, msg_id, count))
+        lines.append('# TYPE %s_request_latency_seconds histogram' % prefix)
+        for msg_id, histogram in sorted(self.latency.items()):
+            for bound, count in histogram.cumulative():
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append('%s_request_latency_seconds_bucket{msg_id="%u",le="%s"} %d' % (prefix, msg_id, le, count))
+            lines.append('%s_request_latency_seconds_sum{msg_id="%u"} %r' % (prefix, msg_id, histogram.sum))
+            lines.append('%s_request_latency_seconds_count{msg_id="%u"} %d' % (prefix, msg_id, histogram.count))
+        return '\n'.join(lines) + '\n'
@@ -1,68 +1,70 @@
 from .exceptions import *
 from .structure import *
-from crccheck.crc import CrcXmodem
-
-crc_checker = CrcXmodem()
+from .crc import crc16
+import heapq
+import re
 
 
 class UnpackerBase(object):
     """
     Helper methods for both stateless and stated unpacking.
+
+    The stateless helpers take the offset of the packet in the buffer instead of slicing the buffer, so no bytes are
+    copied while looking for a packet. Payloads are copied out of the buffer, unless the buffer is a memoryview in which
+    case a view of the payload is returned.
     """
+    _start_byte_pattern = re.compile(rb'[\x02\x03]')
+    _max_header_size = struct.calcsize(Header.fmt(0x3))
+
     @staticmethod
-    def _unpack_header(buffer):
+    def _unpack_header(buffer, offset=0):
         """
         Attempt to unpack a header from the buffer.
         :param buffer: buffer object.
+        :param offset: index of the start byte in the buffer.
         :return: Header object if successful, None otherwise.
         """
-        if len(buffer) == 0:
+        if len(buffer) <= offset:
             return None
-        fmt = Header.fmt(buffer[0])
-        if len(buffer) >= struct.calcsize(fmt):
+        fmt = Header.fmt(buffer[offset])
+        if len(buffer) - offset >= struct.calcsize(fmt):
             try:
-                header = Header.parse(buffer)
+                header = Header.parse(buffer, offset)
                 return header
             except struct.error:
-                raise CorruptPacket("Unable to parse header: %s" % buffer)
+                raise CorruptPacket("Unable to parse header: %s" % bytes(buffer[offset:]))
         else:
             return None
 
     @staticmethod
-    def _unpack_footer(buffer, header):
+    def _unpack_footer(buffer, header, offset=0):
         """
         Unpack the footer. Parse must be valid.
         :param buffer: buffer object.
         :param header: Header object for current packet.
+        :param offset: index of the start byte in the buffer.
         :return: Footer object.
         """
         try:
-            footer = Footer.parse(buffer, header)
+            footer = Footer.parse(buffer, header, offset)
             return footer
         except struct.error:
-            raise CorruptPacket("Unable to parse footer: %s" % buffer)
+            raise CorruptPacket("Unable to parse footer: %s" % bytes(buffer[offset:]))
 
     @staticmethod
-    def _next_possible_packet_index(buffer):
+    def _next_possible_packet_index(buffer, offset=0):
         """
         Tries to find the next possible start byte of a packet in a buffer. Typically called after a corruption has been
         detected.
         :param buffer: buffer object.
-        :return: Index of next valid start byte. Returns -1 if no valid start bytes are found.
+        :param offset: index of the current packet in the buffer.
+        :return: Index of next valid start byte, relative to offset. Returns -1 if no valid start bytes are found.
         """
-        if len(buffer) < 2: # too short to find next
-            return -1
-        next_short_sb = buffer[1:].find(b'\x02')
-        next_long_sb= buffer[1:].find(b'\x03')
-        possible_index = []
-        if next_short_sb >= 0: # exclude index zero's as we know the current first packet is corrupt
-            possible_index.append(next_short_sb + 1) # +1 because we want found from second byte
-        if next_long_sb >= 0:
-            possible_index.append(next_long_sb + 1)
-        if possible_index == []:
+        # exclude the start byte at offset as we know the current packet is corrupt
+        match = UnpackerBase._start_byte_pattern.search(buffer, offset + 1)
+        if match is None:
             return -1
-        else:
-            return min(possible_index)
+        return match.start() - offset
 
     @staticmethod
     def _consume_after_corruption_detected(buffer):
@@ -82,26 +84,29 @@ class UnpackerBase(object):
         return struct.calcsize(Header.fmt(header.payload_index)) + header.payload_length + struct.calcsize(Footer.fmt())
 
     @staticmethod
-    def _packet_parsable(buffer, header):
+    def _packet_parsable(buffer, header, offset=0):
         """
         Checks if an entire packet is parsable.
         :param buffer: buffer object
         :param header: Header object
+        :param offset: index of the start byte in the buffer.
         :return: True if the current packet is parsable, False otherwise.
         """
         frame_size = UnpackerBase._packet_size(header)
-        return len(buffer) >= frame_size
+        return len(buffer) - offset >= frame_size
 
     @staticmethod
-    def _unpack_payload(buffer, header):
+    def _unpack_payload(buffer, header, offset=0):
         """
         Unpacks the payload of the packet.
         :param buffer: buffer object
         :param header: Header object
-        :return: byte string of the payload
+        :param offset: index of the start byte in the buffer.
+        :return: byte string of the payload, or a view of the payload if buffer is a memoryview
         """
-        footer_index = header.payload_index + header.payload_length
-        return bytes(buffer[header.payload_index:footer_index])
+        payload_index = offset + header.payload_index
+        payload = buffer[payload_index:payload_index + header.payload_length]
+        return payload if isinstance(payload, memoryview) else bytes(payload)
 
     @staticmethod
     def _validate_payload(payload, footer):
@@ -112,76 +117,169 @@ class UnpackerBase(object):
         :param footer: Footer object
         :return: void
         """
-        crc_checker.calc(payload)
-        if crc_checker.calc(payload) != footer.crc:
-            raise CorruptPacket("Invalid checksum value.")
-        if footer.terminator is not Footer.TERMINATOR:
+        if crc16(payload) != footer.crc:
+            raise InvalidChecksum("Invalid checksum value.")
+        if footer.terminator != Footer.TERMINATOR:
             raise CorruptPacket("Invalid terminator: %u" % footer.terminator)
         return
 
     @staticmethod
-    def _unpack(buffer, header, errors, recovery_mode=False):
+    def _parse(buffer, header, errors, metrics=None, offset=0):
+        """
+        Attempt to parse the packet at offset in the buffer.
+        :param buffer: buffer object
+        :param header: Header object of the packet, parsed from the buffer if None
+        :param errors: specifies error handling scheme. see codec error handling schemes
+        :param metrics: CodecMetrics counting corrupt packets, or None
+        :param offset: index of the start byte in the buffer.
+        :return: (1) Packet if parse was successful, None otherwise, (2) Length of the packet, (3) True if the packet is
+                 corrupt, False if it is valid or incomplete
+        """
+        try:
+            # if we were not given a header then try to parse one
+            if header is None:
+                header = UnpackerBase._unpack_header(buffer, offset)
+            # check if a packet is parsable
+            if header is None or UnpackerBase._packet_parsable(buffer, header, offset) is False:
+                # buffer is too short to parse the rest of the packet
+                return None, 0, False
+            # parse the packet
+            payload = UnpackerBase._unpack_payload(buffer, header, offset)
+            footer = UnpackerBase._unpack_footer(buffer, header, offset)
+            # validate the payload
+            UnpackerBase._validate_payload(payload, footer)
+            return payload, UnpackerBase._packet_size(header), False
+        except CorruptPacket as corrupt_packet:
+            if metrics is not None:
+                metrics.corrupt_packets += 1
+                if isinstance(corrupt_packet, InvalidChecksum):
+                    metrics.crc_errors += 1
+            if errors == 'strict':
+                raise corrupt_packet
+            return None, 0, True
+
+    @staticmethod
+    def _unpack(buffer, header, errors, recovery_mode=False, metrics=None, offset=0):
         """
         Attempt to parse a packet from the buffer.
         :param buffer: buffer object
         :param errors: specifies error handling scheme. see codec error handling schemes
-        :return: (1) Packet if parse was successful, None otherwise, (2) Length consumed of buffer
+        :param metrics: CodecMetrics to update, or None
+        :param offset: index in the buffer to start parsing at.
+        :return: (1) Packet if parse was successful, None otherwise, (2) Length consumed of buffer, counted from offset
         """
-        while True:
-            try:
-                # if we were not given a header then try to parse one
-                if header is None:
-                    header = UnpackerBase._unpack_header(buffer)
-                if header is None:
-                    # buffer is too short to parse a header
-                    if recovery_mode:
-                        return Stateless._recovery_recurse(buffer, header, errors, False)
-                    else:
-                        return None, 0
-                # check if a packet is parsable
-                if UnpackerBase._packet_parsable(buffer, header) is False:
-                    # buffer is too short to parse the rest of the packet
-                    if recovery_mode:
-                        return Stateless._recovery_recurse(buffer, header, errors, False)
-                    else:
-                        return None, 0
-                # parse the packet
-                payload = UnpackerBase._unpack_payload(buffer, header)
-                footer = UnpackerBase._unpack_footer(buffer, header)
-                # validate the payload
-                UnpackerBase._validate_payload(payload, footer)
-                # clean header as we wont need it again
-                consumed = UnpackerBase._packet_size(header)
-                header = None
-                return payload, consumed
-            except CorruptPacket as corrupt_packet:
-                if errors is 'ignore':
-                    # find the next possible start byte in the buffer
-                    return Stateless._recovery_recurse(buffer, header, errors, True)
-                elif errors is 'strict':
-                    raise corrupt_packet
+        payload, consumed, corrupt = UnpackerBase._parse(buffer, header, errors, metrics, offset)
+        if payload is None:
+            if corrupt:
+                # find the next possible start byte in the buffer
+                payload, consumed = UnpackerBase._recover(buffer, errors, True, metrics, offset)
+            elif recovery_mode:
+                payload, consumed = UnpackerBase._recover(buffer, errors, False, metrics, offset)
+        if metrics is not None:
+            metrics.bytes += consumed
+            if payload is not None:
+                metrics.frames += 1
+        return payload, consumed
 
     @staticmethod
-    def _recovery_recurse(buffer, header, errors, consume_on_not_recovered):
-        header = None  # clean header
-        next_sb = UnpackerBase._next_possible_packet_index(buffer)
-        if next_sb == -1:  # no valid start byte in buffer. consume entire buffer
-            if consume_on_not_recovered:
-                return None, len(buffer)
-            else:
-                return None, 0
-        else:
-            payload, consumed = UnpackerBase._unpack(buffer[next_sb:], header, errors, True)
-            if payload is None:
-                # failed to recover
-                if consume_on_not_recovered:
-                    return payload, consumed + next_sb
-                else:
-                    return payload, consumed
-            else:
+    def _recover(buffer, errors, consume_on_not_recovered, metrics=None, offset=0):
+        """
+        Looks for a valid packet after the start byte at offset in the buffer. Candidate start bytes are tried in a
+        loop rather than recursively so long corrupt buffers cannot exceed the recursion limit.
+        :param buffer: buffer object
+        :param errors: specifies error handling scheme. see codec error handling schemes
+        :param consume_on_not_recovered: whether the packet at offset is corrupt, in which case the bytes up to the
+                                         next candidate are consumed even if no packet is recovered
+        :param metrics: CodecMetrics counting resyncs and skipped bytes, or None
+        :param offset: index of the start byte in the buffer.
+        :return: (1) Packet if one was recovered, None otherwise, (2) Length consumed of buffer, counted from offset
+        """
+        start = offset
+        consumed = 0
+        consume = consume_on_not_recovered
+        while True:
+            next_sb = UnpackerBase._next_possible_packet_index(buffer, offset)
+            if next_sb == -1:  # no valid start byte in buffer. consume the rest of it if the last candidate was corrupt
+                if consume:
+                    consumed += len(buffer) - offset
+                if metrics is not None:
+                    metrics.bytes_skipped += consumed
+                return None, consumed
+            if consume:
+                consumed += next_sb
+            offset += next_sb
+            payload, size, consume = UnpackerBase._parse(buffer, None, errors, metrics, offset)
+            if payload is not None:
                 # recovery was successful
-                return payload, consumed + next_sb
+                if metrics is not None:
+                    metrics.resyncs += 1
+                    metrics.bytes_skipped += offset - start
+                return payload, offset - start + size
 
+    # Probing for a packet after an incomplete one, shared by the unpackers that keep a buffer between calls. The probe
+    # index only moves forward and probed packets that are still incomplete are kept as candidates until enough bytes
+    # have arrived to validate them, so each start byte is validated at most once while probing.
+
+    def _reset_probe(self):
+        """
+        Forgets the probed start bytes, e.g. when leaving recovery mode.
+        """
+        self._probe = 0
+        self._candidates = []
+
+    def _shift_probe(self, consumed):
+        """
+        Moves the probe state along with the buffer after bytes were removed from its start.
+        :param consumed: number of bytes removed from the start of the buffer.
+        """
+        self._probe = max(self._probe - consumed, 0)
+        self._candidates = [(complete - consumed, index - consumed)
+                            for complete, index in self._candidates if index > consumed]
+        heapq.heapify(self._candidates)
+
+    def _probed_packet_at(self, buffer, index, end):
+        """
+        Check if a valid packet starts at index. Incomplete packets are queued as probe candidates.
+        :param buffer: buffer object
+        :param index: Index of a possible start byte in the buffer.
+        :param end: number of valid bytes in the buffer.
+        :return: True if a complete valid packet starts at index, False otherwise.
+        """
+        try:
+            header = UnpackerBase._unpack_header(buffer, index)
+        except CorruptPacket:
+            return False
+        packet_size = 0 if header is None else UnpackerBase._packet_size(header)
+        if header is None or end - index < packet_size:
+            # recheck once the longest header, or the whole packet, has arrived
+            heapq.heappush(self._candidates, (index + max(packet_size, UnpackerBase._max_header_size), index))
+            return False
+        return UnpackerBase._parse(buffer, header, 'ignore', None, index)[0] is not None
+
+    def _probe_ahead(self, buffer, cursor, end):
+        """
+        Look for a complete valid packet after the incomplete one at the cursor.
+        :param buffer: buffer object
+        :param cursor: Index of the incomplete packet in the buffer.
+        :param end: number of valid bytes in the buffer.
+        :return: Index of the packet, None if none was found.
+        """
+        candidates = self._candidates
+        while candidates and candidates[0][0] <= end:
+            index = heapq.heappop(candidates)[1]
+            if index > cursor and self._probed_packet_at(buffer, index, end):
+                return index
+        index = max(self._probe, cursor + 1)
+        while True:
+            match = self._start_byte_pattern.search(buffer, index, end)
+            if match is None:
+                self._probe = end
+                return None
+            index = match.start()
+            self._probe = index + 1
+            if self._probed_packet_at(buffer, index, end):
+                return index
+            index += 1
 
 
 class PackerBase(object):
@@ -211,14 +309,16 @@ class Stateless(UnpackerBase, PackerBase):
     Statelessly pack and unpack VESC packets.
     """
     @staticmethod
-    def unpack(buffer, errors='ignore'):
+    def unpack(buffer, errors='ignore', metrics=None, offset=0):
         """
         Attempt to parse a packet from the buffer.
-        :param buffer: buffer object
+        :param buffer: buffer object. If it is a memoryview, the packet is returned as a view into it.
         :param errors: specifies error handling scheme. see codec error handling schemes
-        :return: (1) Packet if parse was successful, None otherwise, (2) Length consumed of buffer
+        :param metrics: CodecMetrics to update, or None
+        :param offset: index in the buffer to start parsing at, so consumed bytes do not need to be sliced off
+        :return: (1) Packet if parse was successful, None otherwise, (2) Length consumed of buffer, counted from offset
         """
-        return Stateless._unpack(buffer, None, errors)
+        return Stateless._unpack(buffer, None, errors, metrics=metrics, offset=offset)
 
     @staticmethod
     def pack(payload):
@@ -227,8 +327,305 @@ class Stateless(UnpackerBase, PackerBase):
         """
         return Stateless._pack(payload)
 
+
+class Stateful(UnpackerBase, PackerBase):
+    """
+    Incrementally unpack VESC packets from a stream of bytes.
+
+    Bytes are appended to an internal buffer with feed(). The unpacker keeps a cursor into that buffer along with the
+    header of the packet currently being received, so bytes are not re-parsed when a packet arrives over several calls.
+    Consumed bytes are released in place at the start of the next feed().
+
+    After a corrupt packet the unpacker is in recovery mode, just like Stateless. While the packet at the cursor is
+    incomplete, later start bytes are probed for a complete valid packet, see UnpackerBase._probe_ahead.
+    """
+    _short_header = struct.Struct(Header.fmt(0x2))
+    _long_header = struct.Struct(Header.fmt(0x3))
+    _footer = struct.Struct(Footer.fmt())
+
+    def __init__(self, errors='ignore', metrics=None):
+        """
+        :param errors: specifies error handling scheme. see codec error handling schemes
+        :param metrics: CodecMetrics to update, or None to not count anything
+        """
+        self.errors = errors
+        self.metrics = metrics
+        self._buffer = bytearray()
+        self._cursor = 0
+        self._header = None
+        self._recovering = False
+        self._reset_probe()
+
+    def reset(self):
+        """
+        Discard all buffered bytes and any partially received packet.
+        :return: void
+        """
+        del self._buffer[:]
+        self._cursor = 0
+        self._header = None
+        self._recovering = False
+        self._reset_probe()
+
+    @property
+    def pending(self):
+        """
+        Number of buffered bytes that have not been consumed yet.
+        """
+        return len(self._buffer) - self._cursor
+
+    def feed(self, data):
+        """
+        Append bytes to the stream and iterate over every packet that can now be parsed.
+        :param data: bytes-like object received from the stream.
+        :return: Iterator of byte strings, one per valid payload.
+        """
+        if self._cursor:
+            del self._buffer[:self._cursor]
+            self._shift_probe(self._cursor)
+            self._cursor = 0
+        self._buffer += data
+        if self.metrics is not None:
+            self.metrics.bytes += len(data)
+        return self._drain()
+
+    def _parse_header(self, index):
+        """
+        Parse the header of the packet starting at index.
+        :param index: Index of the start byte in the buffer.
+        :return: Header object, None if the buffer is too short to parse a header.
+        """
+        buffer = self._buffer
+        start_byte = buffer[index]
+        if start_byte == 0x2:
+            header_struct = self._short_header
+        elif start_byte == 0x3:
+            header_struct = self._long_header
+        else:
+            raise CorruptPacket("Invalid start byte: %u" % start_byte)
+        if len(buffer) - index < header_struct.size:
+            return None
+        return Header._make(header_struct.unpack_from(buffer, index))
+
+    def _parse_packet(self, index, header):
+        """
+        Parse and validate the packet starting at index.
+        :param index: Index of the start byte in the buffer.
+        :param header: Header object of the packet.
+        :return: (1) byte string of the payload, None if the packet is incomplete, (2) size of the packet.
+        """
+        buffer = self._buffer
+        packet_size = header.payload_index + header.payload_length + self._footer.size
+        if len(buffer) - index < packet_size:
+            return None, packet_size
+        payload_start = index + header.payload_index
+        payload_end = payload_start + header.payload_length
+        crc, terminator = self._footer.unpack_from(buffer, payload_end)
+        with memoryview(buffer) as view:
+            with view[payload_start:payload_end] as payload_view:
+                if crc16(payload_view) != crc:
+                    raise InvalidChecksum("Invalid checksum value.")
+                if terminator != Footer.TERMINATOR:
+                    raise CorruptPacket("Invalid terminator: %u" % terminator)
+                return bytes(payload_view), packet_size
+
+    def _drain(self):
+        while True:
+            try:
+                if self._cursor >= len(self._buffer):
+                    return
+                if self._header is None:
+                    self._header = self._parse_header(self._cursor)
+                payload = None
+                if self._header is not None:
+                    payload, packet_size = self._parse_packet(self._cursor, self._header)
+                if payload is None:
+                    # the packet at the cursor is incomplete
+                    if not self._recovering:
+                        return
+                    recovered_index = self._probe_ahead(self._buffer, self._cursor, len(self._buffer))
+                    if recovered_index is None:
+                        return
+                    if self.metrics is not None:
+                        self.metrics.bytes_skipped += recovered_index - self._cursor
+                    self._header = None
+                    self._cursor = recovered_index
+                    continue
+            except CorruptPacket as corrupt_packet:
+                # drop the start byte at the cursor and resync to the next possible start byte
+                self._header = None
+                self._recovering = True
+                match = self._start_byte_pattern.search(self._buffer, self._cursor + 1)
+                cursor = len(self._buffer) if match is None else match.start()
+                if self.metrics is not None:
+                    self.metrics.corrupt_packets += 1
+                    if isinstance(corrupt_packet, InvalidChecksum):
+                        self.metrics.crc_errors += 1
+                    self.metrics.bytes_skipped += cursor - self._cursor
+                self._cursor = cursor
+                if self.errors == 'strict':
+                    raise corrupt_packet
+                continue
+            self._header = None
+            if self._recovering:
+                self._recovering = False
+                self._reset_probe()
+                if self.metrics is not None:
+                    self.metrics.resyncs += 1
+            if self.metrics is not None:
+                self.metrics.frames += 1
+            self._cursor += packet_size
+            yield payload
+
+    def finish(self):
+        """
+        End a finite stream, e.g. a capture file. As no more bytes arrive, an incomplete packet at the cursor can only
+        be a start byte in corrupt data whose length runs past the end, which would hide every packet after it. It is
+        skipped and the rest of the buffer is searched for packets. Incomplete packets at the very end are discarded.
+        :return: Iterator of byte strings, one per valid payload.
+        """
+        while self._cursor < len(self._buffer):
+            self._header = None
+            self._recovering = True
+            match = self._start_byte_pattern.search(self._buffer, self._cursor + 1)
+            cursor = len(self._buffer) if match is None else match.start()
+            if self.metrics is not None:
+                self.metrics.bytes_skipped += cursor - self._cursor
+            self._cursor = cursor
+            yield from self._drain()
+        self.reset()
+
+    def unpack(self, buffer):
+        """
+        Feed a buffer and return the first packet that can be parsed. Any further packets stay buffered and are
+        returned by subsequent calls.
+        :param buffer: bytes-like object received from the stream.
+        :return: byte string of the payload if one was parsed, None otherwise.
+        """
+        for payload in self.feed(buffer):
+            return payload
+        return None
+
+    @staticmethod
+    def pack(payload):
+        """
+        See PackerBase.pack
+        """
+        return Stateful._pack(payload)
+
+
 def frame(bytestring):
     return Stateless.pack(bytestring)
 
-def unframe(buffer, errors='ignore'):
-    return Stateless.unpack(buffer, errors)
+def unframe(buffer, errors='ignore', metrics=None, offset=0):
+    return Stateless.unpack(buffer, errors, metrics, offset)
+
+
+class FrameBuffer(UnpackerBase):
+    """
+    Receive buffer for unframing packets without copying them. Received bytes are written into a preallocated buffer
+    and packets are returned as memoryviews of it.
+
+    The buffer compacts lazily: consumed bytes are only discarded when a write does not fit behind the buffered bytes,
+    and the buffer only grows when the unconsumed bytes alone do not fit. A returned payload view is valid until the
+    next write, which may move the bytes it refers to.
+
+    After a corrupt packet the buffer is in recovery mode, like Stateful, which is kept across writes: while the packet
+    at the start is incomplete, later start bytes are probed for a complete valid packet, so a corrupt length does not
+    stall the stream. Probed packets that are still incomplete are rechecked once they are complete.
+    """
+    def __init__(self, size=65536, errors='ignore', metrics=None):
+        """
+        :param size: initial size of the buffer in bytes
+        :param errors: specifies error handling scheme. see codec error handling schemes
+        :param metrics: CodecMetrics to update, or None
+        """
+        self.errors = errors
+        self.metrics = metrics
+        self._buffer = bytearray(size)
+        self._view = memoryview(self._buffer)
+        self._start = 0
+        self._end = 0
+        self._recovering = False
+        self._reset_probe()
+
+    def __len__(self):
+        """
+        Number of bytes written that have not been consumed yet.
+        """
+        return self._end - self._start
+
+    def write(self, data):
+        """
+        :param data: bytes-like object received from the stream.
+        """
+        size = len(data)
+        if self._end + size > len(self._buffer):
+            self._compact(size)
+        self._view[self._end:self._end + size] = data
+        self._end += size
+
+    def _compact(self, size):
+        """
+        Moves the unconsumed bytes to the start of the buffer, growing it if size more bytes would still not fit.
+        :param size: number of bytes about to be written.
+        """
+        pending = self._end - self._start
+        if pending + size > len(self._buffer):
+            # payload views may still refer to the old buffer, so it cannot be resized in place
+            buffer = bytearray(max(2 * len(self._buffer), pending + size))
+            buffer[:pending] = self._view[self._start:self._end]
+            self._buffer = buffer
+            self._view = memoryview(buffer)
+        else:
+            self._buffer[:pending] = self._buffer[self._start:self._end]
+        self._shift_probe(self._start)
+        self._start = 0
+        self._end = pending
+
+    def unframe(self):
+        """
+        Unframes the next packet in the buffer. The start byte of a corrupt packet is dropped and the buffer resyncs to
+        the next possible start byte, as Stateful does.
+        :return: memoryview of the payload if a packet was parsed, None otherwise.
+        """
+        view = self._view[:self._end]
+        metrics = self.metrics
+        while self._start < self._end:
+            payload, packet_size, corrupt = UnpackerBase._parse(view, None, self.errors, metrics, self._start)
+            if corrupt:
+                match = UnpackerBase._start_byte_pattern.search(view, self._start + 1)
+                index = self._end if match is None else match.start()
+                self._recovering = True
+            elif payload is None:
+                # the packet at the start is incomplete
+                if not self._recovering:
+                    return None
+                index = self._probe_ahead(view, self._start, self._end)
+                if index is None:
+                    return None
+            else:
+                if self._recovering:
+                    self._recovering = False
+                    self._reset_probe()
+                    if metrics is not None:
+                        metrics.resyncs += 1
+                if metrics is not None:
+                    metrics.frames += 1
+                    metrics.bytes += packet_size
+                self._start += packet_size
+                return payload
+            if metrics is not None:
+                metrics.bytes += index - self._start
+                metrics.bytes_skipped += index - self._start
+            self._start = index
+        return None
+
+    def __iter__(self):
+        """
+        Iterates over the payloads of the packets in the buffer.
+        """
+        payload = self.unframe()
+        while payload is not None:
+            yield payload
+            payload = self.unframe()
@@ -0,0 +1,58 @@
+"""
+CRC16-XMODEM checksum used in the footer of VESC packets (polynomial 0x1021, initial value 0).
+
+crc16 uses binascii.crc_hqx when it is available, which computes the same checksum natively. Otherwise it falls back
+to a table-driven pure Python implementation. Both accept any bytes-like object, including memoryview slices, without
+copying.
+"""
+import binascii
+
+
+def _make_table(polynomial):
+    """
+    Precompute the CRC of every possible byte.
+    :param polynomial: CRC polynomial.
+    :return: tuple of 256 CRC values.
+    """
+    table = []
+    for byte in range(256):
+        crc = byte << 8
+        for bit in range(8):
+            if crc & 0x8000:
+                crc = (crc << 1) ^ polynomial
+            else:
+                crc <<= 1
+        table.append(crc & 0xFFFF)
+    return tuple(table)
+
+
+CRC16_XMODEM_TABLE = _make_table(0x1021)
+
+
+def crc16_table(data, crc=0):
+    """
+    Table-driven CRC16-XMODEM.
+    :param data: bytes-like object.
+    :param crc: CRC of the preceding data, used to compute a checksum over several pieces.
+    :return: CRC value.
+    """
+    table = CRC16_XMODEM_TABLE
+    for byte in data:
+        crc = ((crc << 8) & 0xFF00) ^ table[(crc >> 8) ^ byte]
+    return crc
+
+
+def crc16_native(data, crc=0):
+    """
+    CRC16-XMODEM computed by binascii.crc_hqx.
+    :param data: bytes-like object.
+    :param crc: CRC of the preceding data, used to compute a checksum over several pieces.
+    :return: CRC value.
+    """
+    return binascii.crc_hqx(data, crc)
+
+
+if hasattr(binascii, 'crc_hqx'):
+    crc16 = crc16_native
+else:
+    crc16 = crc16_table
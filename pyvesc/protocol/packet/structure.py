@@ -1,9 +1,7 @@
 import collections
 import struct
 from pyvesc.protocol.packet.exceptions import *
-from crccheck.crc import CrcXmodem
-
-crc_checker = CrcXmodem()
+from pyvesc.protocol.packet.crc import crc16
 
 
 class Header(collections.namedtuple('Header', ['payload_index', 'payload_length'])):
@@ -27,13 +25,14 @@ class Header(collections.namedtuple('Header', ['payload_index', 'payload_length'
         return Header(payload_index, payload_length)
 
     @staticmethod
-    def parse(buffer):
+    def parse(buffer, offset=0):
         """
         Creates a Header by parsing the given buffer.
         :param buffer: buffer object.
+        :param offset: index of the start byte in the buffer.
         :return: Header object.
         """
-        return Header._make(struct.unpack_from(Header.fmt(buffer[0]), buffer, 0))
+        return Header._make(struct.unpack_from(Header.fmt(buffer[offset]), buffer, offset))
 
     @staticmethod
     def fmt(start_byte):
@@ -42,9 +41,9 @@ class Header(collections.namedtuple('Header', ['payload_index', 'payload_length'
         :param start_byte: The first byte in the buffer.
         :return: The character format of the packet header.
         """
-        if start_byte is 0x2:
+        if start_byte == 0x2:
             return '>BB'
-        elif start_byte is 0x3:
+        elif start_byte == 0x3:
             return '>BH'
         else:
             raise CorruptPacket("Invalid start byte: %u" % start_byte)
@@ -57,12 +56,13 @@ class Footer(collections.namedtuple('Footer', ['crc', 'terminator'])):
     TERMINATOR = 0x3 # Terminator character
 
     @staticmethod
-    def parse(buffer, header):
-        return Footer._make(struct.unpack_from(Footer.fmt(), buffer, header.payload_index + header.payload_length))
+    def parse(buffer, header, offset=0):
+        return Footer._make(struct.unpack_from(Footer.fmt(), buffer,
+                                               offset + header.payload_index + header.payload_length))
 
     @staticmethod
     def generate(payload):
-        crc = crc_checker.calc(payload)
+        crc = crc16(payload)
         terminator = Footer.TERMINATOR
         return Footer(crc, terminator)
 
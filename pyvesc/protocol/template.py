@@ -0,0 +1,69 @@
+import struct
+from pyvesc.protocol.base import VESCMessage
+from pyvesc.protocol.packet.structure import Header, Footer
+from pyvesc.protocol.packet.crc import crc16
+
+
+class CommandTemplate(object):
+    """
+    Pre-encoded packet for a VESC message that is sent repeatedly with new values, e.g. SetCurrent in a control loop.
+
+    The packet is encoded once into a preallocated bytearray. Each update only packs the new field values in place and
+    recomputes the CRC over the value bytes, starting from the precomputed CRC of the message header.
+
+    The same bytearray is reused by every update, so it must not be modified until it has been written. A write
+    function that queues the packet instead of writing it at once must copy it. Templates are not thread-safe.
+    """
+    def __init__(self, msg_cls, can_id=None, write=None):
+        """
+        :param msg_cls: The message type to send. String fields are not supported.
+        :param can_id: Optional, CAN ID to forward the message to.
+        :param write: Optional, function called with the packet by send().
+        """
+        if msg_cls._string_field is not None:
+            raise TypeError("Command templates do not support messages with a string field.")
+        self.msg_cls = msg_cls
+        self.can_id = can_id
+        self._write = write
+        self._scaled_fields = msg_cls._scaled_fields
+        self._values_struct = struct.Struct(VESCMessage._endian_fmt + msg_cls._fmt_fields)
+        if can_id is None:
+            payload_header = VESCMessage._header_struct.pack(msg_cls.id)
+        else:
+            payload_header = VESCMessage._can_header_struct.pack(VESCMessage._comm_forward_can, can_id, msg_cls.id)
+        payload_length = len(payload_header) + self._values_struct.size
+        header = Header.generate(bytes(payload_length))
+        header_struct = struct.Struct(Header.fmt(header.payload_index))
+        self._footer_struct = struct.Struct(Footer.fmt())
+        # layout: header | payload header | values | crc | terminator
+        self._values_offset = header_struct.size + len(payload_header)
+        self._footer_offset = self._values_offset + self._values_struct.size
+        self.frame = bytearray(self._footer_offset + self._footer_struct.size)
+        header_struct.pack_into(self.frame, 0, *header)
+        self.frame[header_struct.size:self._values_offset] = payload_header
+        self._payload_header_crc = crc16(payload_header)
+        self._values_view = memoryview(self.frame)[self._values_offset:self._footer_offset]
+
+    def update(self, *values):
+        """
+        Patch the packet with new field values.
+        :param values: New values of the message fields, in the order of msg_cls.fields.
+        :return: The packet (a bytearray that is reused by the next update).
+        """
+        if self._scaled_fields:
+            values = list(values)
+            for idx, scalar in self._scaled_fields:
+                values[idx] = int(values[idx] * scalar)
+        self._values_struct.pack_into(self.frame, self._values_offset, *values)
+        self._footer_struct.pack_into(self.frame, self._footer_offset,
+                                      crc16(self._values_view, self._payload_header_crc), Footer.TERMINATOR)
+        return self.frame
+
+    def send(self, *values):
+        """
+        Patch the packet with new field values and write it.
+        :param values: New values of the message fields, in the order of msg_cls.fields.
+        """
+        if self._write is None:
+            raise RuntimeError("No write function was given for this command template.")
+        self._write(self.update(*values))
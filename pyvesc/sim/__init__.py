@@ -0,0 +1,2 @@
+from .firmware import SimulatedFirmware
+from .simulator import Simulator
@@ -0,0 +1,152 @@
+from pyvesc.protocol.base import VESCMessage
+from pyvesc.VESC.messages import *
+import struct
+import time
+
+
+class SimulatedFirmware(object):
+    """
+    Message level model of a VESC's firmware. handle() takes the payload of a received packet, updates the state of a
+    simple motor model and returns the payloads of the replies.
+
+    Setters update the setpoints, GetVersion, GetValues, the selective getters and GetRotorPosition are answered, and
+    COMM_FORWARD_CAN payloads are handed to the firmware in can_devices with the matching CAN ID.
+    """
+    def __init__(self, version=(5, 2, 0), v_in=24.0, controller_id=0, rpm_per_amp=500.0, max_erpm=50000.0,
+                 can_devices=None):
+        """
+        :param version: firmware version (comm_fw_version, fw_version_major, fw_version_minor)
+        :param v_in: input voltage
+        :param controller_id: reported app controller id
+        :param rpm_per_amp: steady state electrical rpm per amp of motor current, used by SetCurrent
+        :param max_erpm: electrical rpm at full duty cycle, used by SetDutyCycle
+        :param can_devices: dict mapping CAN IDs to the SimulatedFirmware of the VESCs on the CAN bus
+        """
+        self.version = version
+        self.v_in = v_in
+        self.controller_id = controller_id
+        self.rpm_per_amp = rpm_per_amp
+        self.max_erpm = max_erpm
+        self.can_devices = dict(can_devices or {})
+        self.current = 0.0
+        self.duty_cycle = 0.0
+        self.rpm = 0.0
+        self.servo_pos = 0.0
+        self.rotor_position_mode = SetRotorPositionMode.DISP_POS_OFF
+        self.rotor_pos = 0.0
+        self.tachometer = 0.0
+        self.tachometer_abs = 0.0
+        self.received = {}
+        self._started = time.monotonic()
+        self._last_update = self._started
+
+    def _update(self):
+        """
+        Advance the motor model to the current time.
+        """
+        now = time.monotonic()
+        revolutions = self.rpm / 60.0 * (now - self._last_update)
+        self._last_update = now
+        self.rotor_pos = (self.rotor_pos + revolutions * 360.0) % 360.0
+        self.tachometer += revolutions * 6
+        self.tachometer_abs += abs(revolutions) * 6
+
+    def handle(self, payload):
+        """
+        :param payload: payload of a received packet
+        :return: list of reply payloads
+        """
+        if not payload:
+            # an empty packet is valid but carries no command, the firmware ignores it
+            return []
+        if payload[0] == VESCMessage._comm_forward_can and len(payload) > 2:
+            device = self.can_devices.get(payload[1])
+            return device.handle(payload[2:]) if device is not None else []
+        try:
+            msg_type = VESCMessage.msg_type(payload[0])
+        except KeyError:
+            return []
+        self.received[msg_type] = self.received.get(msg_type, 0) + 1
+        self._update()
+        # getters are requested with header only payloads
+        if msg_type is GetVersion:
+            return [VESCMessage.pack(GetVersion(*self.version))]
+        if msg_type is GetValues:
+            return [VESCMessage.pack(self.values())]
+        if msg_type is GetRotorPosition:
+            return [VESCMessage.pack(self.rotor_position())]
+        if msg_type is GetValuesSelective or msg_type is GetValuesSetupSelective:
+            # requests only carry the mask, VESCMessage.unpack would decode them with the layout of the reply
+            try:
+                mask = struct.unpack_from('!I', payload, 1)[0]
+            except struct.error:
+                return []
+            return [VESCMessage.pack(self.selective_values(msg_type, mask))]
+        try:
+            msg = VESCMessage.unpack(payload)
+        except (IndexError, struct.error, UnicodeDecodeError):
+            return []
+        if msg_type is SetCurrent:
+            self.current = msg.current
+            self.rpm = self.current * self.rpm_per_amp
+        elif msg_type is SetCurrentBrake:
+            self.current = -abs(msg.current_brake)
+            self.rpm = 0.0
+        elif msg_type is SetRPM:
+            self.rpm = float(msg.rpm)
+        elif msg_type is SetDutyCycle:
+            self.duty_cycle = msg.duty_cycle
+            self.rpm = self.duty_cycle * self.max_erpm
+        elif msg_type is SetServoPosition:
+            self.servo_pos = msg.servo_pos
+        elif msg_type is SetRotorPositionMode:
+            self.rotor_position_mode = msg.pos_mode
+        return []
+
+    def _state(self):
+        """
+        :return: dict of the current values, keyed by the field names of the getters
+        """
+        return {
+            'temp_fet': 30.0, 'temp_motor': 25.0, 'temp_pcb': 30.0,
+            'avg_motor_current': self.current, 'current_motor': self.current,
+            'avg_input_current': self.current * abs(self.duty_cycle), 'current_in': self.current * abs(self.duty_cycle),
+            'avg_iq': self.current,
+            'duty_cycle_now': self.duty_cycle, 'duty_now': self.duty_cycle,
+            'rpm': int(self.rpm),
+            'v_in': self.v_in,
+            'tachometer': int(self.tachometer), 'tachometer_abs': int(self.tachometer_abs),
+            'pid_pos_now': self.rotor_pos,
+            'app_controller_id': bytes([self.controller_id]),
+            'time_ms': int((time.monotonic() - self._started) * 1000) & 0x7FFFFFFF,
+            'current_tot': self.current, 'current_in_tot': self.current * abs(self.duty_cycle),
+            'num_vescs': 1 + len(self.can_devices),
+        }
+
+    @staticmethod
+    def _fill(state, fields):
+        return [state.get(field[0], b'\x00' if field[1] == 'c' else 0) for field in fields]
+
+    def values(self):
+        """
+        :return: GetValues message describing the current state, in the current layout of GetValues.fields
+        """
+        return GetValues(*self._fill(self._state(), GetValues.fields))
+
+    def selective_values(self, msg_type, mask):
+        """
+        :param msg_type: GetValuesSelective or GetValuesSetupSelective
+        :param mask: bitmask of the requested fields
+        :return: reply message with the requested fields of the current state
+        """
+        layout = msg_type.layout(mask)
+        state = self._state()
+        state['mask'] = mask
+        return layout(*self._fill(state, layout.fields))
+
+    def rotor_position(self):
+        """
+        :return: GetRotorPosition message with the current rotor position
+        """
+        self._update()
+        return GetRotorPosition(self.rotor_pos)
@@ -0,0 +1,220 @@
+from pyvesc.protocol.packet.codec import Stateful, frame
+from pyvesc.protocol.base import VESCMessage
+from pyvesc.VESC.transport import Transport, SocketTransport, PipeTransport
+from pyvesc.sim.firmware import SimulatedFirmware
+import math
+import os
+import queue
+import random
+import select
+import socket
+import threading
+import time
+
+
+class _FileDescriptorTransport(Transport):
+    """
+    Transport over a file descriptor, used for the master side of a pseudo terminal.
+    """
+    def __init__(self, fd, timeout=0.05, buffer_size=4096):
+        self.fd = fd
+        self.timeout = timeout
+        self.buffer_size = buffer_size
+        self._is_open = True
+
+    def write(self, data):
+        view = memoryview(data)
+        while view:
+            view = view[os.write(self.fd, view):]
+
+    def read(self):
+        readable, writable, errored = select.select([self.fd], [], [], self.timeout)
+        if not readable:
+            return b''
+        return os.read(self.fd, self.buffer_size)
+
+    def close(self):
+        if self._is_open:
+            self._is_open = False
+            os.close(self.fd)
+
+    @property
+    def is_open(self):
+        return self._is_open
+
+
+class Simulator(object):
+    """
+    Serves a SimulatedFirmware over a transport, so VESC and AsyncVESC can be exercised without hardware.
+
+    Received packets are unframed and handed to the firmware, and the replies are framed and written back after the
+    configured latency. Replies stay in order, like on a serial link. Bit errors can be injected into the replies to
+    exercise corruption handling. While the rotor position mode is on, GetRotorPosition messages are pushed at
+    rotor_position_rate like the real firmware does.
+    """
+    def __init__(self, firmware=None, latency=0.0, jitter=0.0, bit_error_rate=0.0, rotor_position_rate=100.0,
+                 seed=None):
+        """
+        :param firmware: SimulatedFirmware to serve, a default one is created if None
+        :param latency: time in seconds between receiving a request and writing the reply
+        :param jitter: maximum random time in seconds added to the latency
+        :param bit_error_rate: probability of each bit written by the simulator being flipped
+        :param rotor_position_rate: rate in Hz of the rotor position messages pushed while the rotor position mode is on
+        :param seed: seed of the random number generator used for jitter and bit errors
+        """
+        self.firmware = firmware if firmware is not None else SimulatedFirmware()
+        self.latency = latency
+        self.jitter = jitter
+        self.bit_error_rate = bit_error_rate
+        self.rotor_position_rate = rotor_position_rate
+        self.transport = None
+        self.bits_flipped = 0
+        self._random = random.Random(seed)
+        self._firmware_lock = threading.Lock()
+        self._outgoing = queue.Queue()
+        self._last_due = 0.0
+        self._stop = threading.Event()
+        self._threads = []
+        self._pty_slave = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    def serve(self, transport):
+        """
+        Starts serving the firmware over a transport. A simulator serves a single link, create one per link to
+        simulate several VESCs.
+        :param transport: Transport connected to the host
+        """
+        if self._threads or self._stop.is_set():
+            raise RuntimeError("The simulator is already serving a link or was stopped.")
+        self.transport = transport
+        for target in (self._reader_func, self._writer_func, self._pusher_func):
+            thread = threading.Thread(target=target, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def pipe(self, timeout=0.05):
+        """
+        Starts serving over an in-memory pipe.
+        :param timeout: timeout of the reads of both ends of the pipe
+        :return: the host's end of the pipe, e.g. to pass to VESC
+        """
+        host, simulator = PipeTransport.pair(timeout=timeout)
+        self.serve(simulator)
+        return host
+
+    def socketpair(self, timeout=0.05):
+        """
+        Starts serving over a connected pair of sockets.
+        :param timeout: timeout of the reads of both transports
+        :return: the host's SocketTransport
+        """
+        host, simulator = socket.socketpair()
+        self.serve(SocketTransport(simulator, timeout=timeout))
+        return SocketTransport(host, timeout=timeout)
+
+    def open_pty(self):
+        """
+        Starts serving over a pseudo terminal (POSIX only). The returned device can be opened like a real VESC's
+        serial port, e.g. VESC(serial_port=device).
+        :return: path of the pseudo terminal device
+        """
+        import tty
+        master, slave = os.openpty()
+        tty.setraw(slave)
+        self._pty_slave = slave
+        self.serve(_FileDescriptorTransport(master))
+        return os.ttyname(slave)
+
+    def stop(self):
+        """
+        Stops serving and closes the simulator's side of the transport.
+        """
+        self._stop.set()
+        self._outgoing.put(None)
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+        if self.transport is not None:
+            self.transport.close()
+        if self._pty_slave is not None:
+            os.close(self._pty_slave)
+            self._pty_slave = None
+
+    def _send(self, payload):
+        """
+        Frames a payload and queues it to be written once the latency has elapsed. Called with the firmware lock held.
+        """
+        data = frame(payload)
+        if self.bit_error_rate:
+            data = self._flip_bits(data)
+        due = time.monotonic() + self.latency
+        if self.jitter:
+            due += self._random.uniform(0, self.jitter)
+        # a serial link does not reorder bytes
+        self._last_due = max(due, self._last_due)
+        self._outgoing.put((self._last_due, data))
+
+    def _flip_bits(self, data):
+        """
+        Flips each bit with probability bit_error_rate. The gaps between flipped bits are drawn from a geometric
+        distribution so the cost does not depend on the number of bits.
+        """
+        data = bytearray(data)
+        if self.bit_error_rate >= 1:
+            self.bits_flipped += len(data) * 8
+            return bytes(byte ^ 0xFF for byte in data)
+        log_keep = math.log1p(-self.bit_error_rate)
+        bit = -1
+        while True:
+            bit += 1 + int(math.log(1.0 - self._random.random()) / log_keep)
+            if bit >= len(data) * 8:
+                return bytes(data)
+            data[bit >> 3] ^= 0x80 >> (bit & 7)
+            self.bits_flipped += 1
+
+    def _reader_func(self):
+        unpacker = Stateful()
+        while not self._stop.is_set():
+            try:
+                data = self.transport.read()
+            except (OSError, ValueError):
+                break
+            for payload in unpacker.feed(data):
+                with self._firmware_lock:
+                    for reply in self.firmware.handle(payload):
+                        self._send(reply)
+
+    def _writer_func(self):
+        while True:
+            item = self._outgoing.get()
+            if item is None or self._stop.is_set():
+                return
+            due, data = item
+            delay = due - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            try:
+                self.transport.write(data)
+            except (OSError, ValueError):
+                return
+
+    def _pusher_func(self):
+        """
+        Pushes a rotor position every period while the rotor position mode is on. Deadlines advance by whole periods so
+        the rate does not drift, and ticks missed by more than a period are skipped instead of being sent in a burst.
+        """
+        period = 1.0 / self.rotor_position_rate
+        deadline = time.monotonic() + period
+        while not self._stop.wait(max(0.0, deadline - time.monotonic())):
+            if self.firmware.rotor_position_mode:
+                with self._firmware_lock:
+                    self._send(VESCMessage.pack(self.firmware.rotor_position()))
+            deadline += period
+            now = time.monotonic()
+            if now - deadline > period:
+                deadline = now
@@ -0,0 +1,183 @@
+"""
+Tools for post-processing recorded VESC traffic.
+"""
+import itertools
+import os
+from concurrent import futures
+
+from pyvesc.protocol.interface import _decode_payloads, _import_numpy, _numpy_dtypes
+from pyvesc.protocol.metrics import CodecMetrics
+from pyvesc.protocol.packet.codec import Stateful, UnpackerBase
+
+# long header, longest payload and footer
+_max_frame_size = 3 + 65535 + 3
+# bytes searched for a chunk boundary per read
+_boundary_window = 1 << 18
+
+
+def _frame_size(buffer, offset):
+    """
+    :return: size of the valid frame at offset in the buffer, 0 if there is none or it is incomplete
+    """
+    payload, size, corrupt = UnpackerBase._parse(buffer, None, 'ignore', None, offset)
+    return size if payload is not None else 0
+
+
+def _find_boundary(file, file_size, position, confirm=2):
+    """
+    Finds the first frame boundary at or after position: a start byte followed by confirm valid frames in a row, or
+    by valid frames up to the end of the file. Requiring more than one frame makes a false boundary inside corrupt
+    data or a payload, which passes one CRC check now and then, very unlikely.
+    :param file: capture file opened in binary mode
+    :param file_size: size of the file
+    :param position: offset in the file to start searching at
+    :param confirm: number of consecutive valid frames required
+    :return: offset of the boundary in the file, file_size if there is none
+    """
+    while position < file_size:
+        file.seek(position)
+        data = file.read(_boundary_window + confirm * _max_frame_size)
+        at_end = position + len(data) >= file_size
+        offset = 0
+        while offset < min(len(data), _boundary_window):
+            match = UnpackerBase._start_byte_pattern.search(data, offset, _boundary_window)
+            if match is None:
+                break
+            candidate = frame = match.start()
+            for i in range(confirm):
+                size = _frame_size(data, frame)
+                if not size:
+                    break
+                frame += size
+                if at_end and frame == len(data):
+                    # the file ends with valid frames
+                    return position + candidate
+            else:
+                return position + candidate
+            offset = candidate + 1
+        position += _boundary_window
+    return file_size
+
+
+def find_chunks(path, chunk_size):
+    """
+    Splits a capture file into chunks that start at frame boundaries, so the chunks can be decoded independently.
+    :param path: path of the capture file
+    :param chunk_size: approximate size of the chunks in bytes
+    :return: list of (start, end) offsets of the chunks, covering the whole file
+    """
+    file_size = os.path.getsize(path)
+    boundaries = [0]
+    with open(path, 'rb') as file:
+        for position in range(chunk_size, file_size, chunk_size):
+            if position <= boundaries[-1]:
+                continue
+            boundary = _find_boundary(file, file_size, position)
+            if boundary >= file_size:
+                break
+            if boundary > boundaries[-1]:
+                boundaries.append(boundary)
+    boundaries.append(file_size)
+    return list(zip(boundaries[:-1], boundaries[1:]))
+
+
+def _decode_chunk(path, start, end, msg_types):
+    """
+    Decodes the messages of the wanted types in a chunk of a capture file. Runs in a worker process.
+    :return: (1) list of structured arrays, one per message type, (2) dict of the codec counters of the chunk
+    """
+    metrics = CodecMetrics()
+    numpy = _import_numpy()
+    sizes = {msg_cls.id: numpy.dtype(_numpy_dtypes(msg_cls)[0]).itemsize for msg_cls in msg_types}
+    payloads = {msg_cls.id: [] for msg_cls in msg_types}
+    with open(path, 'rb') as file:
+        file.seek(start)
+        data = file.read(end - start)
+    unpacker = Stateful(metrics=metrics)
+    # the chunk ends at a frame boundary, so a packet still incomplete at its end is corrupt
+    for payload in itertools.chain(unpacker.feed(data), unpacker.finish()):
+        wanted = payloads.get(payload[0]) if payload else None
+        if wanted is not None and len(payload) == sizes[payload[0]]:
+            wanted.append(payload)
+    return [_decode_payloads(msg_cls, payloads[msg_cls.id]) for msg_cls in msg_types], metrics.as_dict()
+
+
+def decode_capture(path, msg_types, workers=None, chunk_size=None, metrics=None):
+    """
+    Decodes a large capture of framed VESC traffic into columns using several processes. The file is split into
+    chunks at verified frame boundaries, the chunks are decoded in a ProcessPoolExecutor and the results are merged in
+    file order, e.g. decode_capture('capture.bin', GetValues)['rpm']. Requires numpy.
+
+    Message types are sent to the worker processes by reference, so changes to their fields at runtime (e.g.
+    pre_v3_33_fields) are not seen by the workers unless they are forked.
+
+    :param path: path of the capture file
+    :param msg_types: message type to decode, or a sequence of message types. Packets of other types are skipped.
+    :param workers: number of worker processes, defaults to the number of CPUs. 1 decodes in this process.
+    :param chunk_size: approximate size of the chunks in bytes, defaults to a quarter of the file per worker
+    :param metrics: Optional, CodecMetrics to add the codec counters of all chunks to
+    :return: dict mapping the field names to arrays, or for a sequence of message types a dict mapping each type to
+             such a dict
+    """
+    numpy = _import_numpy()
+    single = not isinstance(msg_types, (list, tuple))
+    msg_types = [msg_types] if single else list(msg_types)
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if chunk_size is None:
+        chunk_size = max(1 << 20, os.path.getsize(path) // (4 * workers) + 1)
+    chunks = find_chunks(path, chunk_size)
+    args = ([path] * len(chunks), [start for start, end in chunks], [end for start, end in chunks],
+            [msg_types] * len(chunks))
+    if workers == 1 or len(chunks) == 1:
+        results = list(map(_decode_chunk, *args))
+    else:
+        with futures.ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(_decode_chunk, *args))
+    columns = {}
+    for idx, msg_cls in enumerate(msg_types):
+        decoded = numpy.concatenate([arrays[idx] for arrays, counters in results])
+        columns[msg_cls] = {field_name: decoded[field_name] for field_name in msg_cls._field_names}
+    if metrics is not None:
+        for arrays, counters in results:
+            for name, value in counters.items():
+                setattr(metrics, name, getattr(metrics, name) + value)
+    return columns[msg_types[0]] if single else columns
+
+
+def main(argv=None):
+    """
+    Command line entry point: decodes a capture file into a numpy .npz file with one array per message field.
+    """
+    import argparse
+    import importlib
+    # pyvesc.VESC is the VESC class, not the package, so the messages are looked up by module name
+    messages = importlib.import_module('pyvesc.VESC.messages')
+    numpy = _import_numpy()
+    parser = argparse.ArgumentParser(description=main.__doc__.strip())
+    parser.add_argument('capture', help="capture file of framed VESC traffic")
+    parser.add_argument('messages', nargs='*', default=['GetValues'], help="message types to decode")
+    parser.add_argument('-o', '--output', help="output .npz file, defaults to the capture path with .npz")
+    parser.add_argument('-w', '--workers', type=int, default=None, help="number of worker processes")
+    parser.add_argument('--chunk-size', type=int, default=None, help="approximate chunk size in bytes")
+    args = parser.parse_args(argv)
+    msg_types = []
+    for name in args.messages:
+        msg_cls = getattr(messages, name, None)
+        if msg_cls is None:
+            parser.error("unknown message type %s" % name)
+        msg_types.append(msg_cls)
+    metrics = CodecMetrics()
+    columns = decode_capture(args.capture, msg_types, args.workers, args.chunk_size, metrics)
+    output = args.output or os.path.splitext(args.capture)[0] + '.npz'
+    numpy.savez(output, **{'%s.%s' % (msg_cls.__name__, field_name): column
+                           for msg_cls, fields in columns.items() for field_name, column in fields.items()})
+    for msg_cls, fields in columns.items():
+        print("%s: %u messages" % (msg_cls.__name__, len(next(iter(fields.values()))) if fields else 0))
+    print("%u frames, %u corrupt packets, %u bytes skipped" % (metrics.frames, metrics.corrupt_packets,
+                                                                metrics.bytes_skipped))
+    print("written to %s" % output)
+
+
+if __name__ == '__main__':
+    main()
@@ -4,7 +4,8 @@ VERSION = '1.0.5'
 
 setup(
   name='pyvesc',
-  packages=['pyvesc', 'pyvesc.protocol', 'pyvesc.protocol.packet', 'pyvesc.VESC', 'pyvesc.VESC.messages'],
+  packages=['pyvesc', 'pyvesc.protocol', 'pyvesc.protocol.packet', 'pyvesc.VESC', 'pyvesc.VESC.messages',
+            'pyvesc.sim'],
   version=VERSION,
   description='Python implementation of the VESC communication protocol.',
   author='Liam Bindle',
@@ -13,5 +14,7 @@ setup(
   download_url='https://github.com/LiamBindle/PyVESC/tarball/' + VERSION,
   keywords=['vesc', 'VESC', 'communication', 'protocol', 'packet'],
   classifiers=[],
-  install_requires=['crccheck']
+  install_requires=[],
+  extras_require={'numpy': ['numpy'], 'asyncio': ['pyserial-asyncio'], 'benchmark': ['pytest-benchmark']},
+  entry_points={'console_scripts': ['pyvesc-decode-capture = pyvesc.tools:main']}
 )
@@ -202,10 +202,181 @@ class TestPacket(TestCase):
         self.assertEqual(parsed, test_payload)
         self.assertEqual(out_buffer, b'')
 
+    def test_long_corrupt_recovery(self):
+        import sys
+        import pyvesc.protocol.packet.codec as vesc_packet
+        # more candidate start bytes than the recursion limit before the packet to recover
+        packet_to_recover = b'\x02\x04!\xe1$ 8\xbb\x03'
+        in_buffer = b'\x02\xff' * sys.getrecursionlimit() + packet_to_recover
+        parsed, consumed = vesc_packet.unframe(in_buffer)
+        self.assertEqual(parsed, b'!\xe1$ ')
+        self.assertEqual(consumed, len(in_buffer))
+
+class TestStateful(TestCase):
+    def random_payloads(self, lengths):
+        import random
+        return [bytes(random.getrandbits(8) for i in range(length)) for length in lengths]
+
+    def test_byte_by_byte(self):
+        import pyvesc.protocol.packet.codec as vesc_packet
+        payloads = self.random_payloads([1, 4, 255, 256, 1023])
+        stream = b''.join(vesc_packet.frame(payload) for payload in payloads)
+        unpacker = vesc_packet.Stateful()
+        parsed = []
+        for i in range(len(stream)):
+            parsed.extend(unpacker.feed(stream[i:i + 1]))
+        self.assertEqual(parsed, payloads)
+        self.assertEqual(unpacker.pending, 0)
+
+    def test_chunked(self):
+        import pyvesc.protocol.packet.codec as vesc_packet
+        payloads = self.random_payloads([3, 300, 7, 12, 600])
+        stream = b''.join(vesc_packet.frame(payload) for payload in payloads)
+        for chunk_size in (2, 7, 64, len(stream)):
+            unpacker = vesc_packet.Stateful()
+            parsed = []
+            for i in range(0, len(stream), chunk_size):
+                parsed.extend(unpacker.feed(stream[i:i + chunk_size]))
+            self.assertEqual(parsed, payloads)
+
+    def test_corrupt_recovery(self):
+        import pyvesc.protocol.packet.codec as vesc_packet
+        packet_to_recover = b'\x02\x04!\xe1$ 8\xbb\x03'
+        payload_to_recover = b'!\xe1$ '
+        corrupt_packets = [
+            b'\x01\x03Te!B\x92\x03',
+            b'\x02\x02Te!B\x92\x03',
+            b'\x02\x04Te!B\x92\x03\x03',
+            b'\x02\x03se!B\x92\x03',
+            b'\x02\x03TeyB\x92\x03',
+            b'\x02\x03Te!\xaa\x91\x03',
+            b'\x02\x03Te!B\x92\x09',
+        ]
+        for corrupt in corrupt_packets:
+            unpacker = vesc_packet.Stateful()
+            parsed = list(unpacker.feed(corrupt + packet_to_recover))
+            self.assertEqual(parsed, [payload_to_recover])
+            self.assertEqual(unpacker.pending, 0)
+
+    def test_strict(self):
+        import pyvesc.protocol.packet.codec as vesc_packet
+        good_packet = b'\x02\x03Te!B\x92\x03'
+        unpacker = vesc_packet.Stateful(errors='strict')
+        with self.assertRaises(vesc_packet.CorruptPacket):
+            list(unpacker.feed(b'\x02\x03Te!\xaa\x91\x03' + good_packet))
+        # the corrupt start byte was dropped so the stream can continue
+        self.assertEqual(list(unpacker.feed(b'')), [b'Te!'])
+
+    def test_finish(self):
+        import pyvesc.protocol.packet.codec as vesc_packet
+        payloads = self.random_payloads([3, 300, 7])
+        # a long header whose length runs past the end of the stream
+        stream = b'\x03\xff\xff' + b''.join(vesc_packet.frame(payload) for payload in payloads) + b'\x02\x09'
+        unpacker = vesc_packet.Stateful()
+        self.assertEqual(list(unpacker.feed(stream)), [])
+        self.assertEqual(list(unpacker.finish()), payloads)
+        self.assertEqual(unpacker.pending, 0)
+
+
+class TestZeroCopy(TestCase):
+    def test_unframe_views(self):
+        import pyvesc.protocol.packet.codec as vesc_packet
+        good_packet = b'\x02\x03Te!B\x92\x03'
+        stream = good_packet + b'\x00\x02\x03Te!\xaa\x91\x03' + good_packet + good_packet[:4]
+        # parsing a memoryview at an offset gives the same results as slicing bytes, with views of the payloads
+        view = memoryview(stream)
+        buffer = stream
+        offset = 0
+        while True:
+            payload, consumed = vesc_packet.unframe(view, offset=offset)
+            expected_payload, expected_consumed = vesc_packet.unframe(buffer)
+            self.assertEqual((payload, consumed), (expected_payload, expected_consumed))
+            if payload is not None:
+                self.assertIsInstance(payload, memoryview)
+                self.assertIs(payload.obj, stream)
+            if not consumed:
+                break
+            offset += consumed
+            buffer = buffer[consumed:]
+        self.assertEqual(bytes(view[offset:]), good_packet[:4])
+
+    def test_decode_offset(self):
+        import pyvesc
+        from pyvesc.VESC.messages import SetRPM
+        stream = memoryview(b''.join(pyvesc.encode(SetRPM(rpm)) for rpm in (10, 20, 30)))
+        offset = 0
+        rpms = []
+        while True:
+            msg, consumed = pyvesc.decode(stream, offset)
+            if msg is None:
+                break
+            rpms.append(msg.rpm)
+            offset += consumed
+        self.assertEqual(rpms, [10, 20, 30])
+        self.assertEqual(offset, len(stream))
+
+    def test_frame_buffer(self):
+        import random
+        import pyvesc.protocol.packet.codec as vesc_packet
+        payloads = [bytes(random.getrandbits(8) for i in range(length)) for length in (3, 300, 7, 12, 600)]
+        stream = b'\x00\x02'.join(vesc_packet.frame(payload) for payload in payloads)
+        buffer = vesc_packet.FrameBuffer(size=64)
+        parsed = []
+        for i in range(0, len(stream), 50):
+            buffer.write(stream[i:i + 50])
+            for payload in buffer:
+                self.assertIsInstance(payload, memoryview)
+                parsed.append(bytes(payload))
+        self.assertEqual(parsed, payloads)
+        self.assertEqual(len(buffer), 0)
+        # the buffer grew to fit the longest packet
+        self.assertGreaterEqual(len(buffer._buffer), 600)
+        buffer.write(vesc_packet.frame(b'abc'))
+        payload = buffer.unframe()
+        self.assertEqual(bytes(payload), b'abc')
+        self.assertIsNone(buffer.unframe())
+
+    def test_frame_buffer_recovery(self):
+        import pyvesc.protocol.packet.codec as vesc_packet
+        corrupt = bytearray(vesc_packet.frame(b'abc'))
+        corrupt[-3] ^= 0xff
+        buffer = vesc_packet.FrameBuffer()
+        # the recovery mode entered at the corrupt packet is kept until the long header is complete
+        buffer.write(bytes(corrupt) + b'\x03\xff')
+        self.assertIsNone(buffer.unframe())
+        buffer.write(b'\xff' + vesc_packet.frame(b'def') + vesc_packet.frame(b'ghi'))
+        self.assertEqual([bytes(payload) for payload in buffer], [b'def', b'ghi'])
+        unpacker = vesc_packet.Stateful()
+        self.assertEqual(list(unpacker.feed(bytes(corrupt) + b'\x03\xff')), [])
+        self.assertEqual(list(unpacker.feed(b'\xff' + vesc_packet.frame(b'def') + vesc_packet.frame(b'ghi'))),
+                         [b'def', b'ghi'])
+
+
+class TestCrc(TestCase):
+    def test_check_value(self):
+        from pyvesc.protocol.packet.crc import crc16, crc16_table, crc16_native
+        for calc in (crc16, crc16_table, crc16_native):
+            self.assertEqual(calc(b'123456789'), 0x31C3)
+            self.assertEqual(calc(b''), 0)
+
+    def test_implementations_agree(self):
+        import random
+        from pyvesc.protocol.packet.crc import crc16_table, crc16_native
+        data = bytes(random.getrandbits(8) for i in range(1024))
+        for length in (1, 2, 255, 256, 1024):
+            self.assertEqual(crc16_table(data[:length]), crc16_native(data[:length]))
+        # memoryview slices and incremental computation
+        view = memoryview(data)[100:700]
+        self.assertEqual(crc16_table(view), crc16_native(view))
+        self.assertEqual(crc16_table(view[300:], crc16_table(view[:300])), crc16_native(view))
+
+
 class TestMsg(TestCase):
     def setUp(self):
         import copy
+        import pyvesc.VESC.messages
         from pyvesc.protocol.base import VESCMessage
+        # register the built-in messages before taking the snapshot
         self._initial_registry = copy.deepcopy(VESCMessage._msg_registry)
 
     def tearDown(self):
@@ -288,6 +459,80 @@ class TestMsg(TestCase):
         self.verify_packing_and_unpacking(test_message3)
         self.verify_packing_and_unpacking(test_message4)
 
+    def test_scalars_and_can(self):
+        from pyvesc.protocol.base import VESCMessage
+
+        class testMsg1(metaclass=VESCMessage):
+            id = 0x46
+            fields = [
+                ('f1', 'i', 1000),
+                ('f2', 'H'),
+                ('f3', 'c', 0),
+                ('f4', 'h', 10),
+            ]
+
+        test_message = testMsg1(-1.5, 513, b'x', 12.3)
+        payload = VESCMessage.pack(test_message)
+        self.assertEqual(payload, b'\x46\xff\xff\xfa\x24\x02\x01x\x00\x7b')
+        parsed_msg = VESCMessage.unpack(payload)
+        self.assertEqual(parsed_msg.f1, -1.5)
+        self.assertEqual(parsed_msg.f2, 513)
+        self.assertEqual(parsed_msg.f3, b'x')
+        self.assertEqual(parsed_msg.f4, 12.3)
+        # CAN forwarded messages are prefixed with COMM_FORWARD_CAN and the CAN id
+        can_message = testMsg1(-1.5, 513, b'x', 12.3, can_id=7)
+        self.assertEqual(VESCMessage.pack(can_message), b'\x22\x07' + payload)
+        self.assertEqual(VESCMessage.pack(can_message, header_only=True), b'\x22\x07\x46')
+        self.assertEqual(VESCMessage.pack(testMsg1, header_only=True), b'\x46')
+
+    def test_fields_reassignment(self):
+        from pyvesc.protocol.base import VESCMessage
+
+        class testMsg1(metaclass=VESCMessage):
+            id = 0x47
+            fields = [
+                ('f1', 'B'),
+            ]
+
+        testMsg1.fields = [
+            ('f1', 'B'),
+            ('f2', 'h', 10),
+        ]
+        self.assertEqual(testMsg1._full_msg_size, 3)
+        parsed_msg = VESCMessage.unpack(VESCMessage.pack(testMsg1(4, -2.5)))
+        self.assertEqual(parsed_msg.f1, 4)
+        self.assertEqual(parsed_msg.f2, -2.5)
+
+    def test_compact_instances(self):
+        from pyvesc.protocol.base import VESCMessage
+
+        class testMsg1(metaclass=VESCMessage):
+            id = 0x48
+            fields = [
+                ('f1', 'B'),
+                ('f2', 'i', 100),
+            ]
+
+        test_message = testMsg1(3, 1.25)
+        self.assertFalse(hasattr(test_message, '__dict__'))
+        with self.assertRaises(AttributeError):
+            test_message.not_a_field = 1
+        parsed_msg = VESCMessage.unpack(VESCMessage.pack(test_message))
+        self.assertEqual(parsed_msg.as_tuple(), (3, 1.25))
+        self.assertIs(parsed_msg.as_tuple(), parsed_msg.as_tuple())
+        self.assertIsNone(parsed_msg.can_id)
+        self.assertIsNone(testMsg1.can_id)
+        # fields can still be set one by one
+        test_message = testMsg1(can_id=5)
+        test_message.f2 = -2
+        test_message.f1 = 7
+        self.assertEqual(test_message.as_tuple(), (7, -2))
+        self.assertEqual(test_message.can_id, 5)
+        # properties follow the layout when fields are reassigned
+        testMsg1.fields = [('f3', 'h')]
+        self.assertFalse(hasattr(testMsg1, 'f1'))
+        self.assertEqual(VESCMessage.unpack(VESCMessage.pack(testMsg1(-9))).f3, -9)
+
     def test_errors(self):
         from pyvesc.protocol.base import VESCMessage
 
@@ -356,11 +601,42 @@ class TestMsg(TestCase):
             caught = True
         self.assertTrue(caught)
 
+    def test_selective(self):
+        from pyvesc.protocol.base import VESCMessage
+        from pyvesc.VESC.messages import GetValuesSelective, GetValuesSetupSelective
+
+        mask = GetValuesSelective.build_mask('rpm', 'avg_motor_current', 'v_in')
+        self.assertEqual(mask, 1 << 2 | 1 << 7 | 1 << 8)
+        self.assertEqual(GetValuesSelective.build_mask('temp_mos2'), 1 << 18)
+        with self.assertRaises(ValueError):
+            GetValuesSelective.build_mask('odometer')
+        # the request only carries the mask
+        self.assertEqual(VESCMessage.pack(GetValuesSelective(mask)), b'\x32\x00\x00\x01\x84')
+        # replies are decoded with a layout generated for their mask
+        layout = GetValuesSelective.layout(mask)
+        self.assertIs(GetValuesSelective.layout(mask), layout)
+        self.assertEqual(layout._field_names, ['mask', 'avg_motor_current', 'rpm', 'v_in'])
+        self.assertIs(VESCMessage.msg_type(GetValuesSelective.id), GetValuesSelective)
+        payload = VESCMessage.pack(layout(mask, 12.5, 3000, 24.1))
+        self.assertEqual(len(payload), 1 + 4 + 4 + 4 + 2)
+        parsed_msg = VESCMessage.unpack(payload)
+        self.assertIs(type(parsed_msg), layout)
+        self.assertEqual(parsed_msg.as_tuple(), (mask, 12.5, 3000, 24.1))
+        # layouts are cached per message type
+        setup_mask = GetValuesSetupSelective.build_mask('rpm', 'odometer')
+        self.assertEqual(GetValuesSetupSelective.layout(setup_mask)._field_names, ['mask', 'rpm', 'odometer'])
+        self.assertIsNot(GetValuesSetupSelective.layout(mask), layout)
+        # bits of unknown fields are ignored when decoding
+        parsed_msg = VESCMessage.unpack(VESCMessage.pack(layout(mask | 1 << 30, 1, 2, 3)) + b'\x00\x01')
+        self.assertEqual(parsed_msg.as_tuple(), (mask | 1 << 30, 1, 2, 3))
+
 
 class TestInterface(TestCase):
     def setUp(self):
         import copy
+        import pyvesc.VESC.messages
         from pyvesc.protocol.base import VESCMessage
+        # register the built-in messages before taking the snapshot
         self._initial_registry = copy.deepcopy(VESCMessage._msg_registry)
 
     def tearDown(self):
@@ -424,3 +700,1198 @@ class TestInterface(TestCase):
         self.verify_encode_decode(test_message2)
         self.verify_encode_decode(test_message3)
         self.verify_encode_decode(test_message4)
+
+
+class TestCommandTemplate(TestCase):
+    def test_matches_encode(self):
+        import pyvesc
+        from pyvesc.VESC.messages import SetCurrent, SetRPM, SetDutyCycle
+        for msg_cls, values in ((SetCurrent, (0, 1.5, -12.25, 100)),
+                                (SetRPM, (0, 3000, -45000)),
+                                (SetDutyCycle, (0.02, -0.5, 1))):
+            for can_id in (None, 3):
+                template = pyvesc.CommandTemplate(msg_cls, can_id=can_id)
+                for value in values:
+                    self.assertEqual(template.update(value), pyvesc.encode(msg_cls(value, can_id=can_id)))
+
+    def test_send(self):
+        import pyvesc
+        from pyvesc.VESC.messages import SetCurrent
+        written = []
+        template = pyvesc.CommandTemplate(SetCurrent, write=lambda data: written.append(bytes(data)))
+        template.send(2)
+        template.send(-3)
+        self.assertEqual(written, [pyvesc.encode(SetCurrent(2)), pyvesc.encode(SetCurrent(-3))])
+        with self.assertRaises(RuntimeError):
+            pyvesc.CommandTemplate(SetCurrent).send(1)
+
+
+class TestEncodeMany(TestCase):
+    def verify(self, msg_cls, values, can_id=None):
+        from pyvesc.protocol.interface import encode, encode_many
+        frames, offsets = encode_many(msg_cls, values, can_id=can_id)
+        self.assertIsInstance(frames, bytearray)
+        self.assertEqual(len(offsets), len(values) + 1)
+        self.assertEqual(offsets[-1], len(frames))
+        for i, value in enumerate(values):
+            msg = msg_cls(*value, can_id=can_id) if isinstance(value, tuple) else msg_cls(value, can_id=can_id)
+            self.assertEqual(frames[offsets[i]:offsets[i + 1]], encode(msg))
+
+    def test_matches_encode(self):
+        import random
+        from pyvesc.VESC.messages import SetCurrent, SetDutyCycle, SetRPM
+        self.verify(SetCurrent, [random.uniform(-50, 50) for i in range(200)])
+        self.verify(SetDutyCycle, [random.uniform(-1, 1) for i in range(200)], can_id=3)
+        self.verify(SetRPM, [random.randint(-50000, 50000) for i in range(200)])
+        self.verify(SetRPM, [])
+
+    def test_multiple_fields(self):
+        from pyvesc.protocol.base import VESCMessage
+        msg_cls = VESCMessage('TestEncodeMany', (), {'id': 0x70, 'fields': [('a', 'h', 10), ('b', 'B'), ('c', 'i')]},
+                              register=False)
+        self.verify(msg_cls, [(1.5, 2, -3), (-2.25, 255, 100000), (0, 0, 0)])
+
+    def test_numpy(self):
+        import struct
+        try:
+            import numpy
+        except ImportError:
+            self.skipTest("numpy is not installed")
+        from pyvesc.protocol.interface import encode_many
+        from pyvesc.VESC.messages import SetCurrent, SetRPM
+        values = numpy.linspace(-40, 40, 1001)
+        frames, offsets = encode_many(SetCurrent, values)
+        self.assertEqual(frames, encode_many(SetCurrent, values.tolist())[0])
+        self.verify(SetCurrent, values.tolist())
+        with self.assertRaises(struct.error):
+            encode_many(SetRPM, numpy.array([0, 2 ** 31]))
+        with self.assertRaises(ValueError):
+            encode_many(SetRPM, numpy.zeros((3, 2)))
+        for value in (numpy.nan, numpy.inf):
+            with self.assertRaises(ValueError):
+                encode_many(SetCurrent, numpy.array([1.0, value]))
+
+
+class TestDecodeBatch(TestCase):
+    def setUp(self):
+        try:
+            import numpy
+        except ImportError:
+            self.skipTest("numpy is not installed")
+
+    def test_get_values(self):
+        import pyvesc
+        from pyvesc.VESC.messages import GetValues, SetRPM
+        messages = []
+        buffer = b''
+        for i in range(50):
+            values = [b'\x01' if field[1] == 'c' else (i + idx) / 10 * (-1) ** idx
+                      for idx, field in enumerate(GetValues.fields)]
+            messages.append(GetValues(*values))
+            buffer += pyvesc.encode(messages[-1])
+            # other messages and garbage in between are skipped
+            buffer += pyvesc.encode(SetRPM(i)) + b'\x02\x01\x9a'
+        decoded = pyvesc.decode_batch(buffer, GetValues)
+        self.assertEqual(len(decoded), len(messages))
+        self.assertEqual(decoded.dtype.names, tuple(GetValues._field_names))
+        for record, msg in zip(decoded, messages):
+            expected = pyvesc.decode(pyvesc.encode(msg))[0]
+            for field_name, value in zip(GetValues._field_names, expected.as_tuple()):
+                self.assertEqual(record[field_name], value)
+        columns = pyvesc.decode_batch(buffer, GetValues, as_dict=True, chunk_size=100)
+        self.assertEqual(list(columns['rpm']), list(decoded['rpm']))
+
+    def test_empty(self):
+        import pyvesc
+        from pyvesc.VESC.messages import GetValues
+        self.assertEqual(len(pyvesc.decode_batch(b'', GetValues)), 0)
+
+
+class TestAsyncVESC(TestCase):
+    def test_requests_and_commands(self):
+        import asyncio
+        import socket
+        import pyvesc
+        from pyvesc.VESC.messages import GetVersion, GetValues, SetCurrent, Alive, GetRotorPosition
+        values = [b'\x00' if field[1] == 'c' else 1 for field in GetValues.fields]
+        received = []
+
+        class FakeVESC(asyncio.Protocol):
+            def connection_made(self, transport):
+                self.transport = transport
+                self.unpacker = pyvesc.Stateful()
+
+            def data_received(self, data):
+                for payload in self.unpacker.feed(data):
+                    received.append(payload)
+                    if payload[0] == GetVersion.id:
+                        self.transport.write(pyvesc.encode(GetVersion(5, 2, 0)))
+                    elif payload[0] == GetValues.id:
+                        # an empty packet and a truncated message do not stop the replies
+                        self.transport.write(b'\x02\x00\x00\x00\x03' + pyvesc.protocol.packet.codec.frame(
+                            bytes([GetValues.id, 1])) + pyvesc.encode(GetValues(*values)))
+
+        async def run():
+            loop = asyncio.get_event_loop()
+            vesc_socket, fake_socket = socket.socketpair()
+            fake_transport, fake = await loop.create_connection(FakeVESC, sock=fake_socket)
+
+            def connection_factory(protocol_factory):
+                return loop.create_connection(protocol_factory, sock=vesc_socket)
+            async with await pyvesc.AsyncVESC.connect(connection_factory) as vesc:
+                self.assertEqual(await vesc.get_firmware_version(), '5.2.0')
+                measurements = await asyncio.gather(*[vesc.get_measurements() for i in range(10)])
+                self.assertEqual([msg.rpm for msg in measurements], [1] * 10)
+                vesc.set_current(2.5)
+                with self.assertRaises(TimeoutError):
+                    await vesc.request(GetRotorPosition, timeout=0.05)
+                await asyncio.sleep(0.15)
+            fake_transport.close()
+
+        asyncio.run(run())
+        self.assertIn(pyvesc.VESCMessage.pack(SetCurrent(2.5)), received)
+        self.assertIn(pyvesc.VESCMessage.pack(Alive()), received)
+
+    def test_queued_commands(self):
+        import pyvesc
+        from pyvesc.protocol.template import CommandTemplate
+        from pyvesc.VESC.AsyncVESC import VESCProtocol
+        from pyvesc.VESC.messages import SetCurrent
+
+        class QueueingTransport(object):
+            # keeps references to the written data like a transport whose socket is busy
+            def __init__(self):
+                self.queued = []
+
+            def write(self, data):
+                self.queued.append(data)
+
+        protocol = VESCProtocol()
+        protocol.connection_made(QueueingTransport())
+        template = CommandTemplate(SetCurrent, write=protocol.write)
+        template.send(1.0)
+        template.send(2.0)
+        self.assertEqual(protocol.transport.queued, [pyvesc.encode(SetCurrent(1.0)), pyvesc.encode(SetCurrent(2.0))])
+
+
+class TestTransport(TestCase):
+    def read_all(self, transport, size):
+        received = b''
+        while len(received) < size:
+            received += bytes(transport.read())
+        return received
+
+    def test_pipe(self):
+        import pyvesc
+        a, b = pyvesc.PipeTransport.pair(timeout=0.01)
+        self.assertEqual(a.read(), b'')
+        a.write(b'\x02\x01')
+        a.write(b'\x1e')
+        self.assertEqual(self.read_all(b, 3), b'\x02\x01\x1e')
+        a.close()
+        with self.assertRaises(ConnectionError):
+            b.read()
+
+    def test_socket(self):
+        import socket
+        import pyvesc
+        sock_a, sock_b = socket.socketpair()
+        a = pyvesc.SocketTransport(sock_a, timeout=0.01)
+        b = pyvesc.SocketTransport(sock_b, timeout=0.01, buffer_size=4)
+        self.assertEqual(bytes(a.read()), b'')
+        a.write(b'0123456789')
+        self.assertEqual(self.read_all(b, 10), b'0123456789')
+        a.close()
+        with self.assertRaises(ConnectionError):
+            b.read()
+        b.close()
+
+    def test_udp(self):
+        import socket
+        import pyvesc
+        server = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        server.bind(('127.0.0.1', 0))
+        transport = pyvesc.UDPTransport.connect('127.0.0.1', server.getsockname()[1], timeout=1)
+        transport.write(b'\x02\x01\x1e')
+        data, address = server.recvfrom(100)
+        self.assertEqual(data, b'\x02\x01\x1e')
+        server.sendto(b'reply', address)
+        self.assertEqual(bytes(transport.read()), b'reply')
+        transport.close()
+        server.close()
+
+    def test_vesc_over_pipe(self):
+        import threading
+        import pyvesc
+        from pyvesc.VESC.messages import GetVersion, GetValues, SetRPM
+        vesc_end, fake_end = pyvesc.PipeTransport.pair(timeout=0.01)
+        values = [b'\x00' if field[1] == 'c' else 2 for field in GetValues.fields]
+        received = []
+        stop = threading.Event()
+
+        def fake_vesc():
+            unpacker = pyvesc.Stateful()
+            while not stop.is_set():
+                try:
+                    data = fake_end.read()
+                except ConnectionError:
+                    break
+                for payload in unpacker.feed(data):
+                    received.append(payload)
+                    if payload[0] == GetVersion.id:
+                        fake_end.write(pyvesc.encode(GetVersion(3, 40, 0)))
+                    elif payload[0] == GetValues.id:
+                        fake_end.write(pyvesc.encode(GetValues(*values)))
+        fake_thread = threading.Thread(target=fake_vesc)
+        fake_thread.start()
+        try:
+            with pyvesc.VESC(vesc_end, start_heartbeat=False) as vesc:
+                self.assertIsNone(vesc.serial_port)
+                self.assertEqual(vesc.get_firmware_version(), '3.40.0')
+                self.assertEqual(vesc.get_rpm(), 2)
+                vesc.set_rpm(1500)
+        finally:
+            stop.set()
+            fake_thread.join()
+        self.assertIn(pyvesc.VESCMessage.pack(SetRPM(1500)), received)
+
+    def test_vesc_no_reply(self):
+        import threading
+        import time
+        import pyvesc
+        vesc_end, fake_end = pyvesc.PipeTransport.pair(timeout=0.01)
+        threads = set(threading.enumerate())
+        with self.assertRaises(TimeoutError):
+            pyvesc.VESC(vesc_end, start_heartbeat=False, request_timeout=0.05)
+        # the port was closed and the threads were stopped
+        deadline = time.monotonic() + 1.0
+        with self.assertRaises(ConnectionError):
+            while time.monotonic() < deadline:
+                fake_end.read()
+        self.assertEqual([thread for thread in threading.enumerate() if thread not in threads], [])
+
+    def test_vesc_bad_packets(self):
+        import pyvesc
+        from pyvesc.protocol.packet.codec import frame
+        from pyvesc.sim import Simulator
+        from pyvesc.VESC.messages import GetValues
+        with Simulator() as sim:
+            with pyvesc.VESC(sim.pipe(timeout=0.01), start_heartbeat=False, request_timeout=0.5) as vesc:
+                # an empty packet, an unknown message id and a truncated message
+                sim.transport.write(b'\x02\x00\x00\x00\x03' + frame(b'\xfe\x01') + frame(bytes([GetValues.id, 1])))
+                vesc.set_rpm(1000)
+                self.assertEqual(vesc.get_rpm(), 1000)
+                self.assertTrue(vesc.reader_thread.is_alive())
+
+
+class TestSimulator(TestCase):
+    def test_getters_and_setters(self):
+        import pyvesc
+        from pyvesc.sim import Simulator, SimulatedFirmware
+        from pyvesc.VESC.messages import SetRPM, SetCurrent
+        with Simulator(SimulatedFirmware(version=(3, 40, 0))) as sim:
+            with pyvesc.VESC(sim.pipe(timeout=0.01)) as vesc:
+                self.assertEqual(vesc.get_firmware_version(), '3.40.0')
+                vesc.set_rpm(1200)
+                self.assertEqual(vesc.get_rpm(), 1200)
+                vesc.set_current(2)
+                self.assertEqual(vesc.get_rpm(), 2 * sim.firmware.rpm_per_amp)
+                self.assertEqual(vesc.get_v_in(), 24.0)
+        self.assertEqual(sim.firmware.received[SetRPM], 1)
+        self.assertEqual(sim.firmware.received[SetCurrent], 1)
+
+    def test_empty_packet(self):
+        import time
+        import pyvesc
+        from pyvesc.sim import Simulator
+        from pyvesc.VESC.messages import GetVersion
+        with Simulator() as sim:
+            host = sim.pipe(timeout=0.01)
+            host.write(b'\x02\x00\x00\x00\x03' + pyvesc.encode_request(GetVersion))
+            unpacker = pyvesc.Stateful()
+            replies = []
+            deadline = time.monotonic() + 1.0
+            while not replies and time.monotonic() < deadline:
+                replies.extend(unpacker.feed(host.read()))
+            self.assertEqual([str(pyvesc.VESCMessage.unpack(reply)) for reply in replies], ['5.2.0'])
+            self.assertTrue(all(thread.is_alive() for thread in sim._threads))
+
+    def test_single_link(self):
+        from pyvesc.sim import Simulator
+        with Simulator() as sim:
+            sim.pipe(timeout=0.01)
+            with self.assertRaises(RuntimeError):
+                sim.pipe(timeout=0.01)
+        with self.assertRaises(RuntimeError):
+            sim.pipe(timeout=0.01)
+
+    def test_can_forwarding(self):
+        import pyvesc
+        from pyvesc.sim import Simulator, SimulatedFirmware
+        from pyvesc.VESC.messages import GetValues
+        firmware = SimulatedFirmware(can_devices={7: SimulatedFirmware(v_in=12.0)})
+        with Simulator(firmware) as sim:
+            with pyvesc.VESC(sim.socketpair(timeout=0.01), start_heartbeat=False) as vesc:
+                vesc.set_rpm(300, can_id=7)
+                self.assertEqual(vesc.request(GetValues, can_id=7).v_in, 12.0)
+                self.assertEqual(vesc.request(GetValues, can_id=7).rpm, 300)
+                self.assertEqual(vesc.get_rpm(), 0)
+                with self.assertRaises(TimeoutError):
+                    vesc.request(GetValues, can_id=8, timeout=0.05)
+
+    def test_latency(self):
+        import time
+        import pyvesc
+        from pyvesc.sim import Simulator
+        with Simulator(latency=0.02, jitter=0.01, seed=0) as sim:
+            with pyvesc.VESC(sim.pipe(timeout=0.01), start_heartbeat=False) as vesc:
+                start = time.monotonic()
+                vesc.get_measurements()
+                self.assertGreaterEqual(time.monotonic() - start, 0.02)
+
+    def test_bit_errors(self):
+        import pyvesc
+        from pyvesc.sim import Simulator
+        with Simulator(seed=1) as sim:
+            with pyvesc.VESC(sim.pipe(timeout=0.01), start_heartbeat=False, request_timeout=0.05) as vesc:
+                sim.bit_error_rate = 1e-3
+                replies = 0
+                for i in range(50):
+                    try:
+                        vesc.get_measurements()
+                        replies += 1
+                    except TimeoutError:
+                        pass
+        self.assertGreater(sim.bits_flipped, 0)
+        self.assertGreater(replies, 0)
+        self.assertLess(replies, 50)
+
+    def test_rotor_position_push(self):
+        import time
+        import pyvesc
+        from pyvesc.sim import Simulator
+        from pyvesc.VESC.messages import SetRotorPositionMode, GetRotorPosition
+        with Simulator(rotor_position_rate=200.0) as sim:
+            host = sim.pipe(timeout=0.01)
+            time.sleep(0.05)
+            self.assertEqual(host.read(), b'')
+            host.write(pyvesc.encode(SetRotorPositionMode(SetRotorPositionMode.DISP_POS_MODE_ENCODER)))
+            unpacker = pyvesc.Stateful()
+            messages = []
+            deadline = time.monotonic() + 1.0
+            while len(messages) < 3 and time.monotonic() < deadline:
+                messages.extend(pyvesc.VESCMessage.unpack(payload) for payload in unpacker.feed(host.read()))
+            host.close()
+        self.assertEqual(len(messages), 3)
+        for msg in messages:
+            self.assertIsInstance(msg, GetRotorPosition)
+
+    def test_pty(self):
+        import os
+        import pyvesc
+        from pyvesc.sim import Simulator
+        if os.name != 'posix':
+            self.skipTest("pseudo terminals are POSIX only")
+        try:
+            import serial
+        except ImportError:
+            self.skipTest("pyserial is not installed")
+        with Simulator() as sim:
+            with pyvesc.VESC(sim.open_pty(), start_heartbeat=False) as vesc:
+                vesc.set_rpm(-800)
+                self.assertEqual(vesc.get_rpm(), -800)
+
+
+class TestCanBus(TestCase):
+    def firmware(self, can_ids):
+        from pyvesc.sim import SimulatedFirmware
+        return SimulatedFirmware(can_devices={can_id: SimulatedFirmware(controller_id=can_id, v_in=can_id)
+                                              for can_id in can_ids})
+
+    def test_get_measurements(self):
+        import time
+        import pyvesc
+        from pyvesc.sim import Simulator
+        can_ids = list(range(1, 9))
+        with Simulator(self.firmware(can_ids), latency=0.05) as sim:
+            with pyvesc.VESC(sim.pipe(timeout=0.01), start_heartbeat=False) as vesc:
+                bus = pyvesc.CanBus(vesc, can_ids)
+                bus.set_rpm({can_id: can_id * 100 for can_id in can_ids})
+                start = time.monotonic()
+                values = bus.get_measurements()
+                # one polling cycle costs about one round trip
+                self.assertLess(time.monotonic() - start, 0.1 * 2)
+        self.assertEqual(sorted(values), can_ids)
+        for can_id, msg in values.items():
+            self.assertEqual(msg.v_in, can_id)
+            self.assertEqual(msg.rpm, can_id * 100)
+
+    def test_missing_controller(self):
+        import pyvesc
+        from pyvesc.sim import Simulator
+        from pyvesc.VESC.messages import GetVersion
+        with Simulator(self.firmware([1, 2])) as sim:
+            with pyvesc.VESC(sim.pipe(timeout=0.01), start_heartbeat=False) as vesc:
+                bus = pyvesc.CanBus(vesc, [1, 3, 2])
+                values = bus.get_measurements(timeout=0.1)
+                self.assertEqual(values[1].v_in, 1)
+                self.assertEqual(values[2].v_in, 2)
+                self.assertIsNone(values[3])
+                # replies without a controller id are matched in order
+                versions = pyvesc.CanBus(vesc, [1, 2]).request(GetVersion)
+                self.assertEqual(str(versions[1]), '5.2.0')
+                self.assertEqual(str(versions[2]), '5.2.0')
+                # with a silent controller the senders can not be told
+                versions = pyvesc.CanBus(vesc, [1, 3, 2]).request(GetVersion, timeout=0.1)
+                self.assertEqual(versions, {1: None, 3: None, 2: None})
+                # late replies do not complete later requests
+                self.assertEqual(vesc.get_v_in(), 24.0)
+
+    def test_selective(self):
+        import pyvesc
+        from pyvesc.sim import Simulator
+        from pyvesc.VESC.messages import GetValuesSelective, GetValuesSetupSelective
+        with Simulator() as sim:
+            with pyvesc.VESC(sim.pipe(timeout=0.01), start_heartbeat=False) as vesc:
+                vesc.set_rpm(2500)
+                mask = GetValuesSelective.build_mask('rpm', 'v_in')
+                values = vesc.request_selective(GetValuesSelective, mask)
+                self.assertEqual((values.mask, values.rpm, values.v_in), (mask, 2500, 24.0))
+                setup = vesc.request_selective(GetValuesSetupSelective, GetValuesSetupSelective.build_mask('num_vescs'))
+                self.assertEqual(setup.num_vescs, 1)
+
+
+class TestStream(TestCase):
+    def test_ring_buffer(self):
+        import threading
+        from pyvesc.VESC import RingBuffer
+        buffer = RingBuffer(3)
+        self.assertIsNone(buffer.latest())
+        self.assertEqual(buffer.drain(), [])
+        for i in range(5):
+            buffer.push(i)
+        # the oldest samples are dropped
+        self.assertEqual(len(buffer), 3)
+        self.assertEqual(buffer.dropped, 2)
+        self.assertEqual(buffer.latest(), 4)
+        self.assertEqual(buffer.drain(), [2, 3, 4])
+        self.assertEqual(len(buffer), 0)
+        buffer.push(5)
+        self.assertEqual(buffer.drain(), [5])
+        # iterating blocks until samples arrive and ends when the buffer is closed
+        received = []
+        consumer = threading.Thread(target=lambda: received.extend(buffer))
+        consumer.start()
+        buffer.push(6)
+        buffer.push(7)
+        buffer.close()
+        consumer.join(1)
+        self.assertFalse(consumer.is_alive())
+        self.assertEqual(received, [6, 7])
+        with self.assertRaises(ValueError):
+            RingBuffer(0)
+
+    def test_stream(self):
+        import time
+        import pyvesc
+        from pyvesc.sim import Simulator
+        from pyvesc.VESC.messages import GetValues, GetValuesSelective
+        with Simulator(latency=0.02) as sim:
+            with pyvesc.VESC(sim.pipe(timeout=0.01), start_heartbeat=False) as vesc:
+                vesc.set_rpm(1500)
+                stream = vesc.start_stream(GetValues, rate_hz=200, capacity=8)
+                with self.assertRaises(ValueError):
+                    vesc.start_stream(GetValues)
+                time.sleep(0.2)
+                # requests are pipelined, so the rate is not limited by the latency
+                self.assertGreater(stream.requests_sent, 20)
+                self.assertEqual(stream.latest().rpm, 1500)
+                samples = stream.drain()
+                self.assertEqual(len(samples), 8)
+                self.assertGreater(stream.buffer.dropped, 0)
+                mask = GetValuesSelective.build_mask('rpm')
+                selective = vesc.start_stream(GetValuesSelective, rate_hz=100, mask=mask)
+                self.assertEqual(next(iter(selective)).rpm, 1500)
+                # requests are answered while streaming
+                self.assertEqual(vesc.get_rpm(), 1500)
+                vesc.stop_stream(GetValues)
+                self.assertTrue(stream.buffer.closed)
+                self.assertFalse(selective.buffer.closed)
+            # streams are stopped with the VESC
+            self.assertTrue(selective.buffer.closed)
+            self.assertFalse(selective.poller_thread.is_alive())
+
+
+class TestTrajectoryPlayer(TestCase):
+    def test_schedule(self):
+        import time
+        from pyvesc.protocol.interface import encode, encode_many
+        from pyvesc.VESC.player import TrajectoryPlayer
+        from pyvesc.VESC.messages import SetCurrent
+        frames, offsets = encode_many(SetCurrent, [i / 10 for i in range(200)])
+        written = []
+        player = TrajectoryPlayer(lambda data: written.append((time.perf_counter_ns(), bytes(data))), frames, offsets,
+                                  rate_hz=1000)
+        self.assertEqual(len(player), 200)
+        player.start()
+        self.assertTrue(player.wait(2))
+        self.assertFalse(player.running)
+        self.assertEqual(player.sent + player.missed, 200)
+        self.assertEqual(player.sent, len(written))
+        # frames are sent in order, and skipped frames are not sent in a burst later
+        expected = [bytes(frames[offsets[i]:offsets[i + 1]]) for i in range(200)]
+        indices = [expected.index(data) for t, data in written]
+        self.assertEqual(indices, sorted(indices))
+        self.assertEqual(indices[-1], 199)
+        # deadlines are absolute, so the duration does not drift with the number of frames
+        self.assertAlmostEqual((written[-1][0] - written[0][0]) / 1e9, 0.199, delta=0.02)
+        self.assertEqual(written[0][1], encode(SetCurrent(0)))
+        with self.assertRaises(ValueError):
+            TrajectoryPlayer(None, [], rate_hz=0)
+
+    def test_heartbeat(self):
+        from pyvesc.protocol.interface import encode
+        from pyvesc.VESC.player import TrajectoryPlayer
+        from pyvesc.VESC.messages import Alive, SetRPM
+        alive = encode(Alive())
+        written = []
+        player = TrajectoryPlayer(written.append, [encode(SetRPM(1)), encode(SetRPM(2))], rate_hz=4,
+                                  alive=[alive], heartbeat_period=0.1)
+        player.start()
+        self.assertTrue(player.wait(2))
+        # alive frames fill the gap of 250 ms between the setpoints
+        self.assertEqual(written, [encode(SetRPM(1)), alive, alive, encode(SetRPM(2))])
+        self.assertEqual(player.heartbeats_sent, 2)
+        player = TrajectoryPlayer(written.append, [encode(SetRPM(1))] * 1000, rate_hz=1000)
+        player.start()
+        player.stop()
+        self.assertTrue(player.wait(0))
+        self.assertLess(player.sent, 1000)
+
+    def test_vesc(self):
+        import time
+        import pyvesc
+        from pyvesc.sim import Simulator
+        from pyvesc.VESC.messages import Alive, SetCurrent
+        with Simulator() as sim:
+            with pyvesc.VESC(sim.pipe(timeout=0.01)) as vesc:
+                frames, offsets = pyvesc.encode_many(SetCurrent, [2.0] * 500)
+                time.sleep(0.15)
+                player = vesc.play_trajectory(frames, offsets, rate_hz=1000)
+                with self.assertRaises(ValueError):
+                    vesc.play_trajectory(frames, offsets)
+                alive_count = sim.firmware.received.get(Alive, 0)
+                self.assertTrue(player.wait(2))
+                time.sleep(0.05)
+                # the heartbeat is suppressed while playing
+                self.assertLessEqual(sim.firmware.received.get(Alive, 0), alive_count + 1)
+                self.assertEqual(sim.firmware.received[SetCurrent], player.sent)
+                self.assertEqual(sim.firmware.current, 2.0)
+                self.assertGreater(alive_count, 0)
+
+
+class TestHeartbeat(TestCase):
+    def test_touch_frames(self):
+        from pyvesc.protocol.interface import encode, encode_request
+        from pyvesc.VESC.heartbeat import Heartbeat
+        from pyvesc.VESC.messages import GetValues, SetCurrent, SetRPM, SetServoPosition
+        heartbeat = Heartbeat(None)
+        for can_id in (None, 3, 7):
+            heartbeat.add_target(can_id)
+        self.assertEqual(heartbeat.targets, [None, 3, 7])
+        for target in heartbeat._targets.values():
+            target[0] = 0
+        # getters and the servo position do not reset the firmware timeout
+        heartbeat.touch_frames(encode_request(GetValues()) + encode(SetServoPosition(0.5)))
+        self.assertEqual([target[0] for target in heartbeat._targets.values()], [0, 0, 0])
+        heartbeat.touch_frames(encode(SetRPM(100, can_id=3)) + encode(SetCurrent(1)) + encode(SetRPM(1, can_id=9)))
+        self.assertEqual([target[0] > 0 for target in heartbeat._targets.values()], [True, True, False])
+        heartbeat.touch_frames(b'\x02\x05')
+
+    def test_scheduler(self):
+        import time
+        from pyvesc.protocol.interface import encode
+        from pyvesc.VESC.heartbeat import Heartbeat, HeartbeatScheduler
+        from pyvesc.VESC.messages import Alive, SetCurrent
+        scheduler = HeartbeatScheduler()
+        written = [[], []]
+        heartbeats = [Heartbeat(written[0].append, period=0.05), Heartbeat(written[1].append, period=0.05)]
+        for heartbeat in heartbeats:
+            heartbeat.add_target()
+            heartbeat.add_target(5)
+            scheduler.add(heartbeat)
+        # one thread serves all the links
+        thread = scheduler.scheduler_thread
+        for i in range(15):
+            time.sleep(0.01)
+            heartbeats[0].touch_frames(encode(SetCurrent(1)))
+        self.assertIs(scheduler.scheduler_thread, thread)
+        # commanded targets are not sent an Alive, and the due Alives of a link are coalesced into one write
+        self.assertTrue(written[0])
+        self.assertTrue(all(data == encode(Alive(can_id=5)) for data in written[0]))
+        self.assertTrue(written[1])
+        self.assertTrue(all(data == encode(Alive()) + encode(Alive(can_id=5)) for data in written[1]))
+        self.assertEqual(heartbeats[1].alive_sent, 2 * heartbeats[1].writes)
+        for heartbeat in heartbeats:
+            scheduler.remove(heartbeat)
+        count = len(written[1])
+        time.sleep(0.1)
+        self.assertEqual(len(written[1]), count)
+        thread.join(1)
+        self.assertIsNone(scheduler.scheduler_thread)
+
+    def test_vesc(self):
+        import time
+        import pyvesc
+        from pyvesc.sim import Simulator
+        from pyvesc.VESC.heartbeat import shared_scheduler
+        from pyvesc.VESC.messages import Alive
+        with Simulator() as sim, Simulator() as other_sim:
+            with pyvesc.VESC(sim.pipe(timeout=0.01)) as vesc, pyvesc.VESC(other_sim.pipe(timeout=0.01)) as other:
+                self.assertIs(vesc.heartbeat_scheduler, shared_scheduler())
+                self.assertIs(other.heartbeat_scheduler, vesc.heartbeat_scheduler)
+                vesc.start_heartbeat(can_id=4)
+                self.assertEqual(len(vesc.alive_msg), 2)
+                # targets appended directly are kept alive too
+                other.alive_msg.append(pyvesc.encode(Alive(can_id=6)))
+                self.assertEqual(other.heartbeat.targets, [None, 6])
+                self.assertTrue(vesc.heart_beat_thread.is_alive())
+                for i in range(10):
+                    vesc.set_current(1)
+                    other.set_rpm(1000)
+                    time.sleep(0.03)
+                # CAN IDs 4 and 6 are not commanded, so only they are kept alive
+                self.assertEqual(other.heartbeat.alive_sent, other.heartbeat.writes)
+                self.assertEqual(vesc.heartbeat.alive_sent, vesc.heartbeat.writes)
+                self.assertGreater(vesc.heartbeat.alive_sent, 0)
+                alive_sent, writes = other.heartbeat.alive_sent, other.heartbeat.writes
+                time.sleep(0.25)
+                # once idle, the Alives of both targets are written together
+                self.assertGreater(other.heartbeat.alive_sent - alive_sent, other.heartbeat.writes - writes)
+                self.assertGreater(sim.firmware.received[Alive], 0)
+
+
+class TestOutgoingQueue(TestCase):
+    def test_coalescing(self):
+        import time
+        from pyvesc.protocol.interface import encode
+        from pyvesc.VESC.outgoing import OutgoingQueue
+        from pyvesc.VESC.messages import SetCurrent, SetRPM
+        written = []
+        queue = OutgoingQueue(lambda data: written.append(bytes(data)), window=0.05)
+        frames = [encode(SetRPM(i)) for i in range(10)]
+        for data in frames:
+            queue.put(data)
+        self.assertEqual(written, [])
+        time.sleep(0.2)
+        self.assertEqual(written, [b''.join(frames)])
+        # the caller's buffer is copied
+        buffer = bytearray(frames[0])
+        queue.put(buffer)
+        buffer[:] = frames[1]
+        queue.flush()
+        self.assertEqual(written[-1], frames[0])
+        # urgent frames drop the pending ones
+        queue.put(frames[2])
+        queue.put_urgent(encode(SetCurrent(0)))
+        time.sleep(0.1)
+        self.assertEqual(written[-1], encode(SetCurrent(0)))
+        self.assertEqual(queue.bytes_discarded, len(frames[2]))
+        queue.put(frames[3], flush=True)
+        self.assertEqual(written[-1], frames[3])
+        self.assertEqual(queue.writes, len(written))
+        queue.close()
+        self.assertFalse(queue.writer_thread.is_alive())
+        with self.assertRaises(ValueError):
+            queue.put(frames[0])
+
+    def test_threads(self):
+        import threading
+        from pyvesc.protocol.interface import encode
+        from pyvesc.protocol.packet.codec import Stateful
+        from pyvesc.VESC.outgoing import OutgoingQueue
+        from pyvesc.VESC.messages import SetRPM
+        written = bytearray()
+
+        def write(data):
+            # a write that is not atomic, as with a serial port
+            for i in range(0, len(data), 3):
+                written.extend(data[i:i + 3])
+
+        queue = OutgoingQueue(write, window=0.0001)
+
+        def writer(base):
+            for i in range(300):
+                queue.put(encode(SetRPM(base + i)), flush=(i % 7 == 0))
+
+        threads = [threading.Thread(target=writer, args=(base,)) for base in (0, 10000, 20000)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        queue.close()
+        # frames are never interleaved and keep the order of each thread
+        rpms = [SetRPM._struct.unpack(bytes(payload))[1] for payload in Stateful(errors='raise').feed(written)]
+        self.assertEqual(len(rpms), 900)
+        for base in (0, 10000, 20000):
+            self.assertEqual([rpm for rpm in rpms if base <= rpm < base + 10000], list(range(base, base + 300)))
+
+    def test_write_error(self):
+        from pyvesc.VESC.outgoing import OutgoingQueue
+
+        def write(data):
+            raise ConnectionError("Pipe is closed.")
+
+        queue = OutgoingQueue(write, window=0.001)
+        queue.put(b'\x00')
+        queue.writer_thread.join(1)
+        with self.assertRaises(ConnectionError):
+            queue.put(b'\x00')
+        queue.close()
+
+    def test_vesc(self):
+        import time
+        import pyvesc
+        from pyvesc.sim import Simulator
+        from pyvesc.VESC.messages import SetCurrent
+        with Simulator() as sim:
+            with pyvesc.VESC(sim.pipe(timeout=0.01), start_heartbeat=False, write_window=0.5) as vesc:
+                vesc.set_current(5)
+                vesc.set_current(6)
+                # requests write the queued frames first
+                self.assertEqual(vesc.get_measurements().avg_motor_current, 6)
+                vesc.set_current(7)
+                vesc.emergency_stop()
+                time.sleep(0.05)
+                self.assertEqual(sim.firmware.current, 0)
+                self.assertEqual(sim.firmware.received[SetCurrent], 3)
+                vesc.set_current(8)
+                vesc.flush()
+                time.sleep(0.05)
+                self.assertEqual(sim.firmware.current, 8)
+
+
+class TestDispatcher(TestCase):
+    def get_values(self, controller_id):
+        from pyvesc.VESC.messages import GetValues
+        return GetValues(*([0] * 15 + [b'\x00', 0, bytes([controller_id]), 0]))
+
+    def test_matching(self):
+        from pyvesc.VESC.dispatch import Dispatcher
+        from pyvesc.VESC.messages import GetValues, GetVersion
+        dispatcher = Dispatcher()
+        local, = dispatcher.expect(GetValues.id)
+        can_3, = dispatcher.expect(GetValues.id, 3)
+        can_5, = dispatcher.expect(GetValues.id, 5)
+        version, = dispatcher.expect(GetVersion.id, 5)
+        # replies telling their sender are matched out of order
+        self.assertTrue(dispatcher.dispatch(self.get_values(5)))
+        self.assertEqual(ord(can_5.result(0).app_controller_id), 5)
+        self.assertTrue(dispatcher.dispatch(self.get_values(9)))
+        self.assertEqual(ord(local.result(0).app_controller_id), 9)
+        self.assertFalse(can_3.done())
+        # other replies complete the oldest request with their id
+        self.assertTrue(dispatcher.dispatch(GetVersion(5, 2, 0)))
+        self.assertEqual(str(version.result(0)), '5.2.0')
+        self.assertTrue(dispatcher.cancel(can_3))
+        self.assertFalse(dispatcher.cancel(can_3))
+        self.assertFalse(dispatcher.cancel(version))
+        self.assertFalse(dispatcher.dispatch(self.get_values(3)))
+        self.assertEqual(dispatcher.unhandled, 1)
+
+    def test_expire_and_subscribe(self):
+        import time
+        from pyvesc.protocol.metrics import Metrics
+        from pyvesc.VESC.dispatch import Dispatcher
+        from pyvesc.VESC.messages import GetVersion, Print
+        metrics = Metrics()
+        dispatcher = Dispatcher(metrics)
+        stale, = dispatcher.expect(GetVersion.id, timeout=0.01)
+        fresh, = dispatcher.expect(GetVersion.id, timeout=10)
+        dispatcher.expire()
+        self.assertFalse(stale.done())
+        time.sleep(0.02)
+        dispatcher.expire()
+        with self.assertRaises(TimeoutError):
+            stale.result(0)
+        self.assertFalse(fresh.done())
+        self.assertEqual(metrics.timeouts, {GetVersion.id: 1})
+        received = []
+
+        def failing(msg):
+            raise RuntimeError()
+
+        dispatcher.subscribe(Print.id, failing)
+        dispatcher.subscribe(Print.id, received.append)
+        self.assertFalse(dispatcher.dispatch(Print('hello')))
+        self.assertEqual([msg.text for msg in received], ['hello'])
+        self.assertEqual(dispatcher.callback_errors, 1)
+        dispatcher.unsubscribe(Print.id, failing)
+        dispatcher.unsubscribe(Print.id, received.append)
+        dispatcher.dispatch(Print('again'))
+        self.assertEqual(len(received), 1)
+        dispatcher.fail_all(ConnectionError())
+        with self.assertRaises(ConnectionError):
+            fresh.result(0)
+
+    def test_vesc(self):
+        import time
+        import pyvesc
+        from pyvesc.sim import Simulator, SimulatedFirmware
+        from pyvesc.VESC.messages import GetValues, GetVersion, GetRotorPosition, SetRotorPositionMode
+        firmware = SimulatedFirmware(can_devices={3: SimulatedFirmware(controller_id=3)})
+        with Simulator(firmware, latency=0.01, rotor_position_rate=500.0) as sim:
+            with pyvesc.VESC(sim.pipe(timeout=0.01), start_heartbeat=False) as vesc:
+                pushes = []
+                vesc.subscribe(GetRotorPosition, pushes.append)
+                vesc.write(pyvesc.encode(SetRotorPositionMode(SetRotorPositionMode.DISP_POS_MODE_ENCODER)))
+                vesc.set_rpm(1000)
+                # requests are pipelined between the rotor position pushes
+                start = time.monotonic()
+                values, version, can_values, position = vesc.request_many(
+                    [GetValues, GetVersion, (GetValues, 3), GetRotorPosition])
+                self.assertLess(time.monotonic() - start, 0.1)
+                self.assertEqual(values.rpm, 1000)
+                self.assertEqual(ord(values.app_controller_id), 0)
+                self.assertEqual(ord(can_values.app_controller_id), 3)
+                self.assertEqual(str(version), '5.2.0')
+                self.assertIsInstance(position, GetRotorPosition)
+                time.sleep(0.05)
+                self.assertGreater(len(pushes), 5)
+                replies = vesc.write(pyvesc.encode_request(GetVersion) + pyvesc.encode_request(GetValues(can_id=3)),
+                                     num_read_bytes=0)
+                self.assertEqual(str(replies[0]), '5.2.0')
+                self.assertEqual(ord(replies[1].app_controller_id), 3)
+                self.assertEqual(vesc.request_many([(GetValues, 7)], timeout=0.05), [None])
+
+
+class TestSubscription(TestCase):
+    def test_queue(self):
+        import queue
+        from pyvesc.VESC.stream import Subscription
+        target = queue.Queue(2)
+        subscription = Subscription(target)
+        for i in range(3):
+            subscription.push(i)
+        # the oldest message is dropped instead of blocking
+        self.assertEqual([target.get_nowait(), target.get_nowait()], [1, 2])
+        self.assertEqual(subscription.dropped, 1)
+        self.assertEqual(subscription.delivered, 3)
+        with self.assertRaises(TypeError):
+            Subscription(None)
+
+    def test_callback(self):
+        import threading
+        import time
+        from pyvesc.VESC.stream import Subscription
+        release = threading.Event()
+        received = []
+
+        def callback(msg):
+            release.wait()
+            received.append(msg)
+            if msg == 'fail':
+                raise RuntimeError()
+
+        subscription = Subscription(callback, capacity=4)
+        start = time.monotonic()
+        for i in range(10):
+            subscription.push(i)
+        subscription.push('fail')
+        # a blocked callback does not block the pushes
+        self.assertLess(time.monotonic() - start, 0.1)
+        self.assertGreater(subscription.dropped, 0)
+        release.set()
+        subscription.close()
+        self.assertEqual(received[-4:], [7, 8, 9, 'fail'])
+        self.assertEqual(subscription.callback_errors, 1)
+        self.assertFalse(subscription.delivery_thread.is_alive())
+
+    def test_rotor_position(self):
+        import queue
+        import time
+        import pyvesc
+        from pyvesc.sim import Simulator
+        from pyvesc.VESC.messages import GetRotorPosition, SetRotorPositionMode
+        with Simulator(rotor_position_rate=1000.0) as sim:
+            with pyvesc.VESC(sim.pipe(timeout=0.01), start_heartbeat=False) as vesc:
+                positions = queue.Queue()
+                vesc.subscribe(GetRotorPosition, positions)
+                slow = vesc.subscribe(GetRotorPosition, lambda msg: time.sleep(0.05), capacity=8)
+                vesc.set_rpm(6000)
+                vesc.write(pyvesc.encode(SetRotorPositionMode(SetRotorPositionMode.DISP_POS_MODE_ENCODER)))
+                mode_set = time.monotonic()
+                time.sleep(0.1)
+                # a slow subscriber does not delay the replies
+                start = time.monotonic()
+                self.assertEqual(vesc.get_rpm(), 6000)
+                self.assertLess(time.monotonic() - start, 0.05)
+                time.sleep(0.2)
+                # the queue subscriber keeps up with the firmware rate, with some slack for a loaded machine
+                received, elapsed = positions.qsize(), time.monotonic() - mode_set
+                self.assertGreater(received, 0.75 * 1000.0 * elapsed)
+                self.assertIsInstance(positions.get_nowait(), GetRotorPosition)
+                self.assertGreater(slow.dropped, 0)
+                vesc.unsubscribe(GetRotorPosition, positions)
+                count = positions.qsize()
+                time.sleep(0.05)
+                self.assertEqual(positions.qsize(), count)
+            self.assertFalse(slow.delivery_thread.is_alive())
+
+
+class TestDecodeCapture(TestCase):
+    def setUp(self):
+        import os
+        import random
+        import tempfile
+        try:
+            import numpy
+        except ImportError:
+            self.skipTest("numpy is not installed")
+        import pyvesc
+        from pyvesc.VESC.messages import GetValues, GetRotorPosition, SetCurrent
+        rng = random.Random(3)
+        self.frame_starts = set()
+        self.time_ms = []
+        capture = bytearray()
+        for i in range(3000):
+            kind = rng.random()
+            if kind < 0.4:
+                msg = GetValues(*([rng.randint(-300, 300) / 10 for j in range(15)] +
+                                  [b'\x00', 0, bytes([i % 4]), i]))
+                self.time_ms.append(i)
+            elif kind < 0.8:
+                msg = GetRotorPosition(rng.uniform(0, 360))
+            else:
+                msg = SetCurrent(rng.uniform(-20, 20))
+            self.frame_starts.add(len(capture))
+            capture += pyvesc.encode(msg)
+            if rng.random() < 0.05:
+                # line noise, with start bytes in it
+                capture += bytes(rng.choice(b'\x02\x03\x00\xff') for j in range(rng.randint(1, 40)))
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'capture.bin')
+        with open(self.path, 'wb') as file:
+            file.write(capture)
+        self.capture = bytes(capture)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_chunks(self):
+        from pyvesc.tools import find_chunks
+        chunks = find_chunks(self.path, 4096)
+        self.assertGreater(len(chunks), 10)
+        self.assertEqual(chunks[0][0], 0)
+        self.assertEqual(chunks[-1][1], len(self.capture))
+        for (start, end), (next_start, next_end) in zip(chunks, chunks[1:]):
+            self.assertEqual(end, next_start)
+            self.assertIn(next_start, self.frame_starts)
+
+    def test_matches_decode_batch(self):
+        import numpy
+        import pyvesc
+        from pyvesc.protocol.metrics import CodecMetrics
+        from pyvesc.protocol.packet.codec import Stateful
+        from pyvesc.tools import decode_capture
+        from pyvesc.VESC.messages import GetValues, GetRotorPosition
+        sequential = {msg_cls: pyvesc.decode_batch(self.capture, msg_cls, as_dict=True)
+                      for msg_cls in (GetValues, GetRotorPosition)}
+        # a start byte in the noise whose length runs past the end must not hide the frames after it
+        self.assertEqual(list(sequential[GetValues]['time_ms']), self.time_ms)
+        expected = CodecMetrics()
+        unpacker = Stateful(metrics=expected)
+        list(unpacker.feed(self.capture))
+        list(unpacker.finish())
+        for workers in (1, 2):
+            metrics = CodecMetrics()
+            columns = decode_capture(self.path, [GetValues, GetRotorPosition], workers=workers, chunk_size=8192,
+                                     metrics=metrics)
+            for msg_cls, fields in sequential.items():
+                self.assertEqual(list(columns[msg_cls]), msg_cls._field_names)
+                for field_name, column in fields.items():
+                    numpy.testing.assert_array_equal(columns[msg_cls][field_name], column)
+            self.assertEqual(metrics.frames, expected.frames)
+        time_ms = decode_capture(self.path, GetValues, workers=1)['time_ms']
+        numpy.testing.assert_array_equal(time_ms, sequential[GetValues]['time_ms'])
+
+    def test_main(self):
+        import contextlib
+        import io
+        import os
+        import numpy
+        from pyvesc.tools import main
+        output = os.path.join(self.directory.name, 'out.npz')
+        with contextlib.redirect_stdout(io.StringIO()) as stdout:
+            main([self.path, 'GetValues', 'GetRotorPosition', '-o', output, '-w', '1', '--chunk-size', '8192'])
+        with numpy.load(output) as columns:
+            numpy.testing.assert_array_equal(columns['GetValues.time_ms'], self.time_ms)
+            self.assertIn('GetRotorPosition: %u messages' % len(columns['GetRotorPosition.rotor_pos']),
+                          stdout.getvalue())
+
+
+class TestLog(TestCase):
+    def setUp(self):
+        import os
+        import tempfile
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'telemetry.log')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_messages(self):
+        from pyvesc.log import LogReader, LogWriter, RECORD_PAYLOAD
+        from pyvesc.VESC.messages import GetValues, SetRPM
+        values = GetValues(*[b'\x00' if field[1] == 'c' else 1 for field in GetValues.fields])
+        with LogWriter(self.path, chunk_size=256) as writer:
+            for i in range(100):
+                writer.write_message(SetRPM(i), timestamp=i)
+            writer.write_message(values, timestamp=100)
+            with self.assertRaises(ValueError):
+                writer.write_message(SetRPM(0), timestamp=99)
+        with LogReader(self.path) as reader:
+            self.assertEqual(len(reader), 101)
+            self.assertGreater(len(reader._offsets), 1)
+            self.assertEqual((reader.start_time, reader.end_time), (0, 100))
+            # seeking by time
+            self.assertEqual([t for t, msg in reader.messages(41.5, 45)], [42, 43, 44])
+            self.assertEqual([msg.rpm for t, msg in reader.messages(97, 100)], [97, 98, 99])
+            self.assertEqual(list(reader.records(200)), [])
+            timestamp, kind, data = next(iter(reader))
+            self.assertEqual((timestamp, kind, bytes(data)), (0, RECORD_PAYLOAD, b'\x08\x00\x00\x00\x00'))
+            self.assertIsInstance(data, memoryview)
+            timestamp, msg = list(reader.messages(100))[0]
+            self.assertEqual(msg.as_tuple(), values.as_tuple())
+
+    def test_frames_and_append(self):
+        from pyvesc.log import LogFormatError, LogReader, LogWriter
+        from pyvesc.protocol.interface import encode
+        from pyvesc.VESC.messages import SetCurrent, SetDutyCycle
+        packet = encode(SetCurrent(5))
+        with LogWriter(self.path) as writer:
+            # a packet split over two reads
+            writer.write_frame(packet[:3], timestamp=1)
+            writer.write_frame(packet[3:] + encode(SetDutyCycle(0.5)), timestamp=2)
+        # a chunk cut short by a crash is dropped when appending
+        with open(self.path, 'ab') as f:
+            f.write(b'CHNK\x01')
+        with LogReader(self.path) as reader:
+            self.assertEqual(len(reader), 2)
+        with LogWriter(self.path) as writer:
+            with self.assertRaises(ValueError):
+                writer.write_frame(packet, timestamp=0)
+            writer.write_frame(packet, timestamp=3)
+        with LogReader(self.path) as reader:
+            messages = [(t, type(msg).__name__) for t, msg in reader.messages()]
+            self.assertEqual(messages, [(2, 'SetCurrent'), (2, 'SetDutyCycle'), (3, 'SetCurrent')])
+        with open(self.path, 'wb') as f:
+            f.write(b'not a log')
+        with self.assertRaises(LogFormatError):
+            LogReader(self.path)
+
+    def test_clock_step(self):
+        import time
+        from pyvesc.log import LogReader, LogWriter
+        from pyvesc.VESC.messages import SetRPM
+        # records written before the wall clock stepped back, e.g. by NTP
+        ahead = time.time() + 3600
+        with LogWriter(self.path) as writer:
+            writer.write_message(SetRPM(1), timestamp=ahead)
+            writer.write_message(SetRPM(2))
+        with LogWriter(self.path) as writer:
+            writer.write_message(SetRPM(3))
+            with self.assertRaises(ValueError):
+                writer.write_message(SetRPM(4), timestamp=ahead - 1)
+        with LogReader(self.path) as reader:
+            self.assertEqual([(t, msg.rpm) for t, msg in reader.messages()], [(ahead, 1), (ahead, 2), (ahead, 3)])
+
+
+class TestMetrics(TestCase):
+    def test_codec(self):
+        import pyvesc.protocol.packet.codec as vesc_packet
+        from pyvesc.protocol.metrics import CodecMetrics
+        good_packet = b'\x02\x03Te!B\x92\x03'
+        bad_crc = b'\x02\x03Te!\xaa\x91\x03'
+        stream = good_packet + b'\x00\x01' + bad_crc + good_packet
+        for feed in (lambda unpacker: list(unpacker.feed(stream)),
+                     lambda unpacker: [p for i in range(len(stream)) for p in unpacker.feed(stream[i:i + 1])]):
+            metrics = CodecMetrics()
+            self.assertEqual(feed(vesc_packet.Stateful(metrics=metrics)), [b'Te!', b'Te!'])
+            counters = metrics.as_dict()
+            # start bytes inside bad_crc may be probed as well, depending on how the stream is chunked
+            self.assertGreaterEqual(counters.pop('corrupt_packets'), 2)
+            self.assertEqual(counters, {'frames': 2, 'bytes': len(stream), 'crc_errors': 1, 'resyncs': 1,
+                                        'bytes_skipped': 2 + len(bad_crc)})
+        # unframe counts the same way
+        metrics = CodecMetrics()
+        buffer = stream
+        while buffer:
+            payload, consumed = vesc_packet.unframe(buffer, metrics=metrics)
+            buffer = buffer[consumed:]
+        self.assertEqual((metrics.frames, metrics.bytes, metrics.crc_errors, metrics.resyncs, metrics.bytes_skipped),
+                         (2, len(stream), 1, 1, 2 + len(bad_crc)))
+
+    def test_vesc(self):
+        import pyvesc
+        from pyvesc.protocol.metrics import Metrics
+        from pyvesc.sim import Simulator
+        from pyvesc.VESC.messages import GetValues, GetVersion, SetRPM
+        metrics = Metrics()
+        with Simulator(latency=0.002) as sim:
+            with pyvesc.VESC(sim.pipe(timeout=0.01), start_heartbeat=False, metrics=metrics) as vesc:
+                for i in range(10):
+                    vesc.get_measurements()
+                # the simulator does not reply to setters
+                with self.assertRaises(TimeoutError):
+                    vesc.request(SetRPM, timeout=0.05)
+        exported = metrics.as_dict()
+        self.assertEqual(exported['latency'][GetValues.id]['count'], 10)
+        self.assertEqual(exported['latency'][GetVersion.id]['count'], 1)
+        self.assertGreaterEqual(exported['latency'][GetValues.id]['sum'], 10 * 0.002)
+        self.assertEqual(exported['latency'][GetValues.id]['buckets'][-1], (float('inf'), 10))
+        self.assertEqual(exported['timeouts'], {SetRPM.id: 1})
+        self.assertEqual(exported['codec']['frames'], 11)
+        text = metrics.prometheus()
+        self.assertIn('pyvesc_frames_total 11\n', text)
+        self.assertIn('pyvesc_request_latency_seconds_bucket{msg_id="4",le="+Inf"} 10\n', text)
+        self.assertIn('pyvesc_request_latency_seconds_count{msg_id="4"} 10\n', text)
+        self.assertIn('pyvesc_request_timeouts_total{msg_id="8"} 1\n', text)
+
+
+class TestImport(TestCase):
+    # budget for `import pyvesc` in microseconds, as reported by python -X importtime
+    IMPORT_BUDGET_US = 20000
+
+    def run_python(self, code, *options):
+        import os
+        import subprocess
+        import sys
+        return subprocess.run([sys.executable] + list(options) + ['-c', code], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True)
+
+    def test_import_time(self):
+        result = self.run_python('import pyvesc', '-X', 'importtime')
+        cumulative = [int(line.split('|')[1]) for line in result.stderr.splitlines()
+                      if line.startswith('import time:') and line.split('|')[2].strip() == 'pyvesc']
+        self.assertEqual(len(cumulative), 1)
+        self.assertLess(cumulative[0], self.IMPORT_BUDGET_US)
+
+    def test_lazy_names(self):
+        code = '\n'.join([
+            'import sys',
+            'import pyvesc',
+            'heavy = ["asyncio", "concurrent.futures", "serial", "pyvesc.protocol.packet.codec", "pyvesc.VESC.messages"]',
+            'print(sorted(name for name in heavy if name in sys.modules))',
+            # messages register when a payload is first decoded
+            'print(type(pyvesc.decode(pyvesc.frame(b"\\x08\\x00\\x00\\x01\\x00"))[0]).__name__)',
+            'print("asyncio" in sys.modules)',
+            # importing a submodule named like its class does not hide the class
+            'import pyvesc.VESC.VESC',
+            'from pyvesc.VESC import VESC',
+            'print(isinstance(pyvesc.VESC, type), pyvesc.VESC is VESC)',
+            'from pyvesc.protocol import *',
+            'print(encode is pyvesc.encode, Stateful is pyvesc.Stateful)',
+        ])
+        self.assertEqual(self.run_python(code).stdout.splitlines(),
+                         ['[]', 'SetRPM', 'False', 'True True', 'True True'])